@@ -10,19 +10,35 @@ import sys
 import subprocess
 import sqlite3
 import argparse
+import base64
 import json
 import pwd
 import grp
+import gzip
+import hashlib
+import re
+import selectors
+import shlex
 import shutil
+import signal
+import socket
 import time
 import tempfile
+import threading
 import urllib.request
 import urllib.error
-from datetime import datetime
-from flask import Flask, request, jsonify, send_from_directory
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import Flask, Response, request, jsonify, send_from_directory
 from flask_cors import CORS
 from pathlib import Path
 
+try:
+    import brotli  # Optional: enables .br precompression
+except ImportError:
+    brotli = None
+
 CONFIG = {
     "database_path": "/tmp/hosting/hosting.db",  # Use /tmp for read-only systems
     "nginx_sites_dir": "/etc/nginx/sites-available",
@@ -32,15 +48,1602 @@ CONFIG = {
     "api_user": "www-data",
     "api_group": "www-data",
     "readonly_mode": False,  # Will be set during initialization
+    # Deploy-time precompression (served with gzip_static / brotli_static)
+    "precompress_extensions": [
+        ".html",
+        ".htm",
+        ".css",
+        ".js",
+        ".mjs",
+        ".json",
+        ".xml",
+        ".txt",
+        ".svg",
+        ".map",
+        ".webmanifest",
+        ".ico",
+        ".ttf",
+        ".otf",
+        ".eot",
+    ],
+    "precompress_min_size": 256,  # Bytes; smaller files are not worth it
+    "precompress_workers": os.cpu_count() or 2,
+    "nginx_brotli_static": None,  # None = auto-detect ngx_brotli via nginx -V
+    # "per-site": one server {} file per domain in sites-available
+    # "map": one generated include routing every host through map $host lookups
+    "nginx_routing_mode": "per-site",
+    "nginx_routes_file": "/etc/nginx/conf.d/hosting-routes.conf",
+    "nginx_server_names_hash_bucket_size": 128,
+    "template_cache_size": 2048,  # Rendered configs kept in memory
+    # Applied to every HTTPS vhost after certificate issuance
+    "tls_profile": {
+        "protocols": "TLSv1.2 TLSv1.3",
+        "ciphers": "ECDHE-ECDSA-AES128-GCM-SHA256:ECDHE-RSA-AES128-GCM-SHA256:"
+        "ECDHE-ECDSA-AES256-GCM-SHA384:ECDHE-RSA-AES256-GCM-SHA384:"
+        "ECDHE-ECDSA-CHACHA20-POLY1305:ECDHE-RSA-CHACHA20-POLY1305",
+        "ecdh_curve": "X25519:prime256v1:secp384r1",
+        "session_cache": "shared:HostingSSL:20m",  # ~80k sessions, shared by vhosts
+        "session_timeout": "1d",
+        "session_tickets": "off",  # Tickets without key rotation weaken PFS
+        "ocsp_stapling": True,
+        "resolver": "1.1.1.1 8.8.8.8",
+    },
+    "letsencrypt_live_dir": "/etc/letsencrypt/live",
+    # Bulk issuance over http-01/webroot; point the directory at Pebble to test
+    "acme_directory_url": "https://acme-v02.api.letsencrypt.org/directory",
+    "acme_verify_ssl": True,  # Pebble serves its directory from a test CA
+    "acme_email": None,  # None = admin@<first name on each certificate>
+    "acme_webroot": "/var/lib/hosting-acme/webroot",
+    "acme_state_dir": "/var/lib/hosting-acme",  # One certbot config dir per shard
+    "acme_workers": 4,
+    "acme_orders_per_hour": 100,  # Let's Encrypt allows 300 new orders per 3h
+    "acme_order_burst": 10,
+    "acme_max_sans": 100,  # Let's Encrypt limit on names per certificate
+    # Background renewal: each certificate gets a stable, hashed slot inside the
+    # window before expiry so renewals never bunch up on the same day
+    "cert_renew_before_days": 30,
+    "cert_renew_window_days": 14,
+    "cert_renew_check_interval": 3600,  # Seconds between scheduler passes
+    "cert_renew_batch_size": 25,  # Certificates renewed per pass (one reload)
+    "cert_renew_retry_hours": 6,
+    # App readiness after start: TCP connect, then an HTTP GET answered < 500
+    "readiness_path": "/",
+    "readiness_timeout": 120,  # Seconds; build-on-start apps get the unit's 300
+    "readiness_initial_delay": 0.05,  # First backoff step, doubled per probe
+    "readiness_max_delay": 2.0,
+    "readiness_http_timeout": 5,
+    # Blue/green releases: the new release starts on other ports, then the old
+    # instances keep serving in-flight requests for the drain period
+    "app_port_range": (20000, 29999),  # Pool handed out by the port allocator
+    "release_drain_seconds": 30,
+    "releases_to_keep": 3,
+    # Instances per Node.js app; None = derive from CPU count and app density
+    "default_instances": None,
+    "max_instances_per_site": 4,
+    # Scale-to-zero: apps idle this long are stopped and woken by their next
+    # request (nginx hands the refused connection to the API's wake endpoint)
+    "hibernate_after_seconds": 1800,  # 0 = never; deployConfig.hibernateAfter wins
+    "hibernate_check_interval": 60,
+    "app_access_log_dir": "/var/log/nginx/hosting-apps",  # Log mtime = last request
+    "app_access_log_max_bytes": 50 * 1024 * 1024,  # Truncated (mtime kept) above this
+    "nginx_access_log": "/var/log/nginx/access.log",  # Still written for app vhosts
+    "wake_api_address": "127.0.0.1:5000",
+    # Resource classes per app (deployConfig.resources), rendered into the
+    # systemd units; the supervisor applies them through cgroup v2 if delegated
+    "resource_classes": {
+        "small": {
+            "memory_max": "256M",
+            "cpu_weight": 50,
+            "tasks_max": 256,
+            "io_weight": 50,
+        },
+        "standard": {
+            "memory_max": "512M",
+            "cpu_weight": 100,
+            "tasks_max": 512,
+            "io_weight": 100,
+        },
+        "large": {
+            "memory_max": "1G",
+            "cpu_weight": 200,
+            "tasks_max": 1024,
+            "io_weight": 200,
+        },
+    },
+    "default_resource_class": "standard",
+    "memory_high_ratio": 0.9,  # Throttle and reclaim before the OOM kill at max
+    "app_slice": "hosting-apps.slice",  # Every app unit shares one parent slice
+    "cgroup_mount": "/sys/fs/cgroup",
+    # V8 heap sizing (NODE_OPTIONS): each instance gets a share of host memory
+    # weighted by its class, capped at its MemoryHigh; the old space takes
+    # node_heap_ratio of that, leaving room for code, stacks and buffers
+    "host_memory": None,  # e.g. "16G"; None = physical memory
+    "host_memory_reserve_ratio": 0.2,  # Kept for the OS, nginx, builds and the API
+    "node_heap_ratio": 0.75,
+    "node_min_heap_mb": 64,
+    "node_semi_space_divisor": 16,  # Semi-space ~ heap / 16, rounded down to 2^n MB
+    "node_max_semi_space_mb": 64,
+    "node_retune_threshold": 0.1,  # Restart to retune when the heap is off by 10%
+    # Build admission: npm install/build stages queue (FIFO) until a build slot
+    # is free and the host has the memory and CPU for one more build
+    "build_slots": None,  # None = half the CPUs, at least 1
+    "build_memory_estimate": "1G",  # Peak memory assumed for an install/build
+    "nextjs_build_memory_estimate": "3G",
+    "build_memory_headroom": "512M",  # Kept free for live apps on top
+    "build_max_load_per_cpu": 1.5,  # 1-minute load average limit
+    "build_queue_timeout": 1800,  # Seconds a deploy may wait for admission
+    "build_admission_poll": 5,  # Memory and load are re-checked this often
+    "build_nice": 10,
+    "build_slice": "hosting-builds.slice",  # systemd hosts: builds run as scopes here
+    "build_memory_max": "4G",  # Hard cap per build scope
+    "build_cpu_weight": 20,
+    "build_io_weight": 20,
+    "deploy_job_retention": 3600,  # Finished deploy jobs stay pollable this long
+    # Next.js standalone output: the release keeps .next/standalone plus the
+    # static assets instead of the whole tree, and starts with node server.js
+    "nextjs_standalone": False,  # Default when deployConfig has no "output"
+    # Next.js apps without API routes, middleware or server-only features are
+    # exported to static files and served by nginx with no Node process; a
+    # failed export falls back to server mode
+    "nextjs_static_export": True,
+    # Budgets: every install/build step runs in its own process group, killed
+    # as a whole (TERM, then KILL after the grace) on timeout or cancel
+    "deploy_timeout": 1800,  # Whole job from admission, all stages together
+    "deploy_stage_timeouts": {"install": 600, "build": 900},  # All strategies share one
+    "build_kill_grace": 10,
+    "npm_history_runs": 20,  # Recent installs per template that pick the strategy order
+    # Golden environments: per generator template version, installed
+    # node_modules and a warm .next/cache that deploys clone copy-on-write
+    "generator_templates_dir": os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        "..",
+        "lib",
+        "generator",
+        "templates",
+    ),
+    "golden_env_dir": "/var/lib/hosting-golden",
+    "golden_env_keep": 2,  # Versions kept per template
+    # Site specs: deploys may send {template, version, theme, pages, files,
+    # assets} and have the project rendered here. Every rendered file and
+    # asset is stored once by sha256, copied into the build and hardlinked into
+    # the finished releases using it
+    "blob_store_dir": "/var/lib/hosting-blobs",
+    "blob_retention_days": 30,  # Blobs no deploy has used for this long are pruned
+    # Build scheduling: tenants take turns, cheaper jobs go first within a turn
+    # and jobs estimated at or under the fast-lane cost may use an extra slot
+    # that full builds never occupy. Costs are install+build seconds, the
+    # median of recent runs (site first, then class), else these defaults
+    "build_cost_defaults": {"install": 60, "build": 180, "nextjs-build": 420},
+    "build_cost_history": 10,  # Recent runs the median is taken over
+    "build_fast_lane_seconds": 90,
+    "build_fast_lane_slots": 1,
+    "build_aging_seconds": 600,  # Waited this long: goes ahead of everything
+    # Crash-loop detection: restarts are counted per app over a sliding window;
+    # past the threshold the app is stopped (quarantined) for a doubling hold
+    "crash_watch_interval": 15,
+    "crash_loop_window": 300,  # Seconds
+    "crash_loop_threshold": 5,  # Restarts inside the window
+    "quarantine_base_seconds": 300,
+    "quarantine_max_seconds": 6 * 3600,
+    "crash_log_lines": 20,  # Log tail kept with each restart event
+    # Read-only mode: one supervisor process runs every app instance
+    "supervisor_socket": "/tmp/hosting/supervisor.sock",
+    "supervisor_state_file": "/tmp/hosting/supervisor.json",
+    "supervisor_backoff_initial": 1,  # Seconds, doubled per crash in a row
+    "supervisor_backoff_max": 60,
+    "supervisor_stable_seconds": 30,  # Uptime after which a crash resets backoff
+    "supervisor_stop_timeout": 10,  # SIGTERM grace before SIGKILL
+    "supervisor_log_max_bytes": 10 * 1024 * 1024,
+    "supervisor_log_backups": 3,
+}
+
+# Serializes map-mode route changes: the vhost_routes rows, the rendered
+# include and its nginx test/reload change together
+VHOST_ROUTES_LOCK = threading.RLock()
+
+# Named, versioned nginx templates. Bump a template's version whenever its text
+# changes; "{{name}}" is a parameter and "{{> name}}" inlines another template.
+NGINX_TEMPLATES = {
+    "security_headers": (
+        1,
+        r"""    # Security headers
+    add_header X-Frame-Options "SAMEORIGIN" always;
+    add_header X-Content-Type-Options "nosniff" always;
+    add_header X-XSS-Protection "1; mode=block" always;
+    add_header Referrer-Policy "strict-origin-when-cross-origin" always;
+""",
+    ),
+    "proxy_settings": (
+        1,
+        r"""        proxy_http_version 1.1;
+        proxy_set_header Upgrade $http_upgrade;
+        proxy_set_header Connection 'upgrade';
+        proxy_set_header Host $host;
+        proxy_set_header X-Real-IP $remote_addr;
+        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
+        proxy_set_header X-Forwarded-Proto $scheme;
+        proxy_cache_bypass $http_upgrade;
+        proxy_read_timeout 86400;
+        proxy_connect_timeout 60s;
+        proxy_send_timeout 60s;
+        
+        # Buffer settings for better performance
+        proxy_buffering on;
+        proxy_buffer_size 8k;
+        proxy_buffers 8 8k;
+""",
+    ),
+    "health_location": (
+        1,
+        r"""    # Health check endpoint
+    location /health {
+        access_log off;
+        return 200 "healthy\n";
+        add_header Content-Type text/plain;
+    }
+""",
+    ),
+    "static_site_locations": (
+        2,
+        r"""    # Serve .gz/.br files precompressed at deploy time (no per-request CPU)
+    gzip_static on;{{brotli_static}}
+    gzip_vary on;
+    
+    # Performance optimizations (static exports write /about as about.html)
+    location / {
+        try_files $uri $uri.html $uri/ =404;
+        expires 1h;
+        add_header Cache-Control "public, no-transform";
+    }
+    
+    # Static assets with long-term caching
+    location ~* \.(css|js|png|jpg|jpeg|gif|ico|svg|woff|woff2|ttf|eot|webp|avif)$ {
+        expires 1y;
+        add_header Cache-Control "public, immutable";
+        add_header Vary Accept-Encoding;
+    }
+    
+    # Security: Prevent access to hidden files
+    location ~ /\. {
+        deny all;
+        access_log off;
+        log_not_found off;
+    }
+    
+    # Security: Prevent access to backup files
+    location ~* \.(bak|backup|old|tmp)$ {
+        deny all;
+        access_log off;
+        log_not_found off;
+    }
+""",
+    ),
+    "acme_challenge_location": (
+        1,
+        r"""    # ACME http-01 challenges answered from disk - issuance needs no reload
+    location ^~ /.well-known/acme-challenge/ {
+        root {{acme_webroot}};
+        default_type text/plain;
+        access_log off;
+    }
+""",
+    ),
+    "tls_profile": (
+        1,
+        r"""
+    # TLS performance profile: session resumption, stapling, modern ciphers
+    ssl_certificate {{ssl_certificate}};
+    ssl_certificate_key {{ssl_certificate_key}};
+    ssl_protocols {{ssl_protocols}};
+    ssl_ciphers {{ssl_ciphers}};
+    ssl_prefer_server_ciphers off;
+    ssl_ecdh_curve {{ssl_ecdh_curve}};
+    ssl_session_cache {{ssl_session_cache}};
+    ssl_session_timeout {{ssl_session_timeout}};
+    ssl_session_tickets {{ssl_session_tickets}};{{ocsp_stapling}}""",
+    ),
+    "tls_ocsp_stapling": (
+        1,
+        r"""
+    ssl_stapling on;
+    ssl_stapling_verify on;
+    ssl_trusted_certificate {{ssl_trusted_certificate}};
+    resolver {{resolver}} valid=300s;
+    resolver_timeout 5s;""",
+    ),
+    "tls_redirect_server": (
+        2,
+        r"""# HTTP to HTTPS redirect for {{domain_name}}
+server {
+    listen 80;
+    server_name {{domain_name}};
+    
+{{> acme_challenge_location}}
+    
+    location / {
+        return 301 https://$host$request_uri;
+    }
+}
+
+""",
+    ),
+    "static_vhost": (
+        4,
+        r"""{{redirect_server}}# Static site configuration for {{domain_name}}
+server {
+    {{listen}}
+    server_name {{domain_name}};
+    root {{public_path}};
+    index index.html index.htm;{{tls}}
+    
+{{> security_headers}}
+    
+{{> acme_challenge_location}}
+    
+{{> static_site_locations}}
+}""",
+    ),
+    "proxy_vhost": (
+        4,
+        r"""{{redirect_server}}# Reverse proxy configuration for {{domain_name}}
+server {
+    {{listen}}
+    server_name {{domain_name}};{{tls}}
+    
+{{> security_headers}}
+    
+{{> acme_challenge_location}}
+    
+    # Main application proxy
+    location / {
+        proxy_pass http://localhost:{{port}};
+{{> proxy_settings}}
+    }
+    
+{{> health_location}}
+}""",
+    ),
+    "app_static_locations": (
+        1,
+        r"""
+    root {{app_dir}}/public;
+    gzip_static on;{{brotli_static}}
+    gzip_vary on;
+
+    # Next.js build assets (content-hashed, precompressed at deploy time)
+    location /_next/static/ {
+        alias {{app_dir}}/.next/static/;
+        expires 1y;
+        add_header Cache-Control "public, immutable";
+        access_log off;
+    }
+
+    # public/ files first, then the application
+    location / {
+        try_files $uri @app;
+    }
+""",
+    ),
+    "app_upstream": (
+        1,
+        r"""upstream {{upstream_name}} {
+{{servers}}}
+
+""",
+    ),
+    "app_access_log": (
+        1,
+        r"""    # Per-app access log: its mtime is the app's last request (hibernation)
+    access_log {{nginx_access_log}};
+    access_log {{app_access_log}} combined;
+""",
+    ),
+    "app_wake_location": (
+        1,
+        r"""    # A hibernated app refuses connections; the hosting API starts it, waits
+    # until it is ready and answers the request that woke it
+    location @hosting_wake {
+        root {{app_access_log_dir}};
+        rewrite ^ /api/apps/wake/{{site_name}} break;
+        proxy_pass http://{{wake_api_address}};
+        proxy_set_header Host $host;
+        proxy_set_header X-Hosting-Original-URI $request_uri;
+        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
+        proxy_set_header X-Forwarded-Proto $scheme;
+        proxy_read_timeout {{wake_timeout}}s;
+    }
+""",
+    ),
+    "app_proxy_vhost": (
+        5,
+        r"""# Nginx proxy configuration for {{site_name}}
+{{> app_upstream}}
+
+server {
+    listen 80;
+    server_name {{server_names}};
+    
+{{> app_access_log}}
+    
+{{> security_headers}}
+    
+{{> acme_challenge_location}}
+    {{static_locations}}
+    # Main application proxy
+    {{app_location}} {
+        proxy_pass http://{{upstream_name}};
+        error_page 502 = @hosting_wake;
+{{> proxy_settings}}
+    }
+    
+{{> app_wake_location}}
+    
+{{> health_location}}
+    
+    # Static assets if they exist
+    location /static/ {
+        alias {{web_root}}/{{site_name}}/static/;
+        expires 1y;
+        add_header Cache-Control "public, immutable";
+    }
+}
+""",
+    ),
+    "routes_map": (
+        1,
+        r"""map $host ${{variable}} {
+    hostnames;
+    default "";
+{{entries}}}
+""",
+    ),
+    "routes_static_server": (
+        2,
+        r"""
+# Static sites
+server {
+    listen 80;
+    server_name{{server_names}};
+    root $hosting_static_root;
+    index index.html index.htm;
+    
+{{> security_headers}}
+    
+{{> acme_challenge_location}}
+    
+{{> static_site_locations}}
 }
+""",
+    ),
+    "routes_proxy_server": (
+        3,
+        r"""
+# Reverse-proxied applications
+server {
+    listen 80;
+    server_name{{server_names}};
+    root $hosting_app_root/public;
+    
+{{> app_access_log}}
+    open_log_file_cache max=1000 inactive=60s valid=1m;
+    
+{{> security_headers}}
+    
+{{> acme_challenge_location}}
+    
+    gzip_static on;{{brotli_static}}
+    gzip_vary on;
+
+    location ~ ^/_next/static/(.*)$ {
+        alias $hosting_app_root/.next/static/$1;
+        expires 1y;
+        add_header Cache-Control "public, immutable";
+        access_log off;
+    }
+
+    location / {
+        try_files $uri @app;
+    }
+
+    location @app {
+        # nginx skips logs with variables in their path when root is missing
+        root {{app_access_log_dir}};
+        proxy_pass http://$hosting_upstream;
+        error_page 502 = @hosting_wake;
+{{> proxy_settings}}
+    }
+    
+{{> app_wake_location}}
+    
+{{> health_location}}
+}
+""",
+    ),
+    "routes_include": (
+        2,
+        r"""# Consolidated vhost routing - generated by simple-hosting.py, do not edit
+# Hosts: {{host_count}} ({{static_count}} static, {{proxy_count}} proxy)
+server_names_hash_max_size {{hash_max_size}};
+server_names_hash_bucket_size {{bucket_size}};
+map_hash_max_size {{hash_max_size}};
+map_hash_bucket_size {{bucket_size}};
+
+{{upstreams}}{{maps}}{{servers}}""",
+    ),
+}
+
+
+class ConfigTemplate:
+    """A template compiled once into alternating literal text and parameter names"""
+
+    FIELD_PATTERN = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+    def __init__(self, name, version, source):
+        self.name = name
+        self.version = version
+        self.literals = []
+        self.fields = []
+
+        position = 0
+        for match in self.FIELD_PATTERN.finditer(source):
+            self.literals.append(source[position : match.start()])
+            self.fields.append(match.group(1))
+            position = match.end()
+        self.literals.append(source[position:])
+
+    def render(self, params):
+        missing = [field for field in self.fields if field not in params]
+        if missing:
+            raise KeyError(f"Template {self.name} missing parameters: {missing}")
+
+        parts = [self.literals[0]]
+        for field, literal in zip(self.fields, self.literals[1:]):
+            parts.append(str(params[field]))
+            parts.append(literal)
+        return "".join(parts)
+
+
+class ConfigTemplateEngine:
+    """Compiles named templates once and caches renders by (version, parameters)"""
+
+    INCLUDE_PATTERN = re.compile(r"\{\{>\s*(\w+)\s*\}\}")
+
+    def __init__(self, sources):
+        self.sources = sources
+        self.compiled = {}
+        self.render_cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, name):
+        """Return the compiled template, inlining any {{> partial}} references"""
+        template = self.compiled.get(name)
+        if template is None:
+            source, version = self._expand(name, set())
+            template = ConfigTemplate(name, version, source)
+            with self.lock:
+                self.compiled[name] = template
+        return template
+
+    def _expand(self, name, seen):
+        if name in seen:
+            raise ValueError(f"Template include cycle at {name}")
+        version, source = self.sources[name]
+        versions = [f"{name}@{version}"]
+
+        def inline(match):
+            partial, partial_version = self._expand(match.group(1), seen | {name})
+            versions.append(partial_version)
+            return partial.rstrip("\n")
+
+        source = self.INCLUDE_PATTERN.sub(inline, source)
+        # The effective version covers every inlined partial, so editing a shared
+        # fragment invalidates the renders of every template that uses it
+        return source, "+".join(versions)
+
+    def render(self, name, **params):
+        template = self.get(name)
+        key = (name, template.version, tuple(sorted(params.items())))
+
+        with self.lock:
+            if key in self.render_cache:
+                self.render_cache.move_to_end(key)
+                return self.render_cache[key]
+
+        output = template.render(params)
+
+        with self.lock:
+            self.render_cache[key] = output
+            while len(self.render_cache) > CONFIG["template_cache_size"]:
+                self.render_cache.popitem(last=False)
+        return output
+
+    @staticmethod
+    def write_if_changed(path, content):
+        """Write content only when its hash differs from the file on disk"""
+        new_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        try:
+            with open(path, "rb") as f:
+                if hashlib.sha256(f.read()).hexdigest() == new_hash:
+                    return False
+        except FileNotFoundError:
+            pass
+
+        temp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        with open(temp_path, "w") as f:
+            f.write(content)
+        os.replace(temp_path, path)
+        return True
+
+
+class GeneratorTemplateLoader:
+    """Renders lib/generator template trees from a site spec, as the frontend would
+
+    Follows the generator's TemplateLoader (IF/FOREACH comment blocks and
+    ${path} variables) and also fills {{path}} fields and {{#each}} blocks.
+    Template sources are read once and re-read only when the tree changes.
+    """
+
+    IF_PATTERN = re.compile(
+        r"\{\s*/\*\s*IF\s+([^*]+)\s*\*/\s*\}([\s\S]*?)\{\s*/\*\s*ENDIF\s*\*/\s*\}"
+    )
+    FOREACH_PATTERN = re.compile(
+        r"\{\s*/\*\s*FOREACH\s+([^*]+)\s*\*/\s*\}([\s\S]*?)\{\s*/\*\s*ENDFOREACH\s*\*/\s*\}"
+    )
+    VARIABLE_PATTERN = re.compile(r"\$\{([^}]+)\}")
+    COMMENT_PATTERN = re.compile(r"\{\s*/\*\s*[^*]*\*/\s*\}")
+    EACH_PATTERN = re.compile(r"\{\{#each\s+([\w.]+)\s*\}\}([\s\S]*?)\{\{/each\}\}")
+    # Identifiers only: JSX style objects like {{ color: 'red' }} never match
+    FIELD_PATTERN = re.compile(r"\{\{\s*([A-Za-z_@][\w.]*)\s*\}\}")
+    # Pages the generator only adds when enabled explicitly
+    OPT_IN_PAGES = {"services", "portfolio", "blog"}
+
+    def __init__(self):
+        self.trees = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def root():
+        return CONFIG["generator_templates_dir"]
+
+    def templates(self):
+        """Template ids a spec may name: base and every template directory"""
+        try:
+            return sorted(
+                name
+                for name in os.listdir(self.root())
+                if os.path.isdir(os.path.join(self.root(), name))
+            )
+        except OSError:
+            return []
+
+    def layer(self, template):
+        """{project path: template file} of one template directory; config/ maps to the root"""
+        files = {}
+        top = os.path.join(self.root(), template)
+        for dirpath, _, filenames in os.walk(top):
+            for filename in filenames:
+                if not filename.endswith(".template"):
+                    continue
+                path = os.path.join(dirpath, filename)
+                relative = os.path.relpath(path, top)[: -len(".template")]
+                if relative.startswith(f"config{os.sep}"):
+                    relative = relative[len("config") + 1 :]
+                files[relative.replace(os.sep, "/")] = path
+        return files
+
+    def tree(self, template):
+        """Cached {"version", "sources"} of base overlaid with the template"""
+        if template not in self.templates():
+            raise ValueError(f"Unknown template: {template}")
+        paths = self.layer("base")
+        if template != "base":
+            paths.update(self.layer(template))
+        fingerprint = tuple(
+            sorted(
+                (relative, os.stat(path).st_mtime_ns, os.stat(path).st_size)
+                for relative, path in paths.items()
+            )
+        )
+        with self.lock:
+            cached = self.trees.get(template)
+            if cached and cached["fingerprint"] == fingerprint:
+                return cached
+
+        sources = {}
+        for relative, path in paths.items():
+            with open(path, "r", encoding="utf-8") as f:
+                sources[relative] = f.read()
+        version = hashlib.sha256(
+            json.dumps(sources, sort_keys=True).encode()
+        ).hexdigest()[:12]
+        cached = {"fingerprint": fingerprint, "version": version, "sources": sources}
+        with self.lock:
+            self.trees[template] = cached
+        return cached
+
+    def page_enabled(self, relative, spec):
+        """Same page selection as the generator's TemplatePathManager"""
+        parts = relative.split("/")
+        if len(parts) < 3 or parts[0] != "app":
+            return True
+        page = (spec.get("pages") or {}).get(parts[1]) or {}
+        if parts[1] in self.OPT_IN_PAGES:
+            return page.get("enabled") is True
+        return page.get("enabled") is not False
+
+    def render(self, template, spec):
+        """{project path: text} for a spec; raises ValueError on an unknown template"""
+        tree = self.tree(template)
+        return {
+            relative: self.render_source(source, spec, relative.endswith(".json"))
+            for relative, source in tree["sources"].items()
+            if self.page_enabled(relative, spec)
+        }
+
+    def render_source(self, source, spec, json_file=False):
+        source = self.IF_PATTERN.sub(
+            lambda match: (
+                match.group(2) if self.condition(match.group(1).strip(), spec) else ""
+            ),
+            source,
+        )
+        source = self.FOREACH_PATTERN.sub(
+            lambda match: self.foreach(
+                match.group(2), self.lookup(spec, match.group(1))
+            ),
+            source,
+        )
+        source = self.VARIABLE_PATTERN.sub(
+            lambda match: self.variable(source, match, spec), source
+        )
+        source = self.COMMENT_PATTERN.sub("", source)
+        source = re.sub(r"\n\s*\n\s*\n", "\n\n", source)
+        source = self.EACH_PATTERN.sub(
+            lambda match: self.each(match.group(2), self.lookup(spec, match.group(1))),
+            source,
+        )
+        return self.FIELD_PATTERN.sub(
+            lambda match: self.escape(self.lookup(spec, match.group(1)), json_file),
+            source,
+        )
+
+    def condition(self, condition, spec):
+        if condition.startswith("!"):
+            return not self.lookup(spec, condition[1:])
+        return bool(self.lookup(spec, condition))
+
+    def foreach(self, body, items):
+        if not isinstance(items, list):
+            return ""
+        rendered = []
+        for index, item in enumerate(items):
+            content = body
+            if isinstance(item, dict):
+                for key, value in item.items():
+                    content = content.replace(f"${{item.{key}}}", self.escape(value))
+            rendered.append(content.replace("${index}", str(index)))
+        return "".join(rendered)
+
+    def each(self, body, items):
+        if not isinstance(items, list):
+            return ""
+        rendered = []
+        for index, item in enumerate(items):
+            scope = {"this": item, "@index": index}
+            if isinstance(item, dict):
+                scope.update(item)
+
+            def field(match, scope=scope):
+                name = match.group(1)
+                if name in scope or name.split(".")[0] in scope:
+                    return self.escape(self.lookup(scope, name))
+                return match.group(0)  # Left for the spec-wide pass
+
+            rendered.append(self.FIELD_PATTERN.sub(field, body))
+        return "".join(rendered)
+
+    def variable(self, source, match, spec):
+        """${path} from the spec, unless it sits inside a JavaScript template literal"""
+        index = match.start()
+        before = source[max(0, index - 100) : index]
+        after = source[index : index + 100]
+        before_backtick = before.rfind("`")
+        before_quote = max(before.rfind('"'), before.rfind("'"))
+        after_backtick = after.find("`")
+        after_quote = min(
+            (i for i in (after.find('"'), after.find("'")) if i != -1),
+            default=float("inf"),
+        )
+        if before_backtick > before_quote and after_backtick < after_quote:
+            return match.group(0)
+        return self.escape(self.lookup(spec, match.group(1).strip()))
+
+    @staticmethod
+    def lookup(scope, path):
+        value = scope
+        for key in path.split("."):
+            if isinstance(value, dict) and key in value:
+                value = value[key]
+            elif isinstance(value, list) and key.isdigit() and int(key) < len(value):
+                value = value[int(key)]
+            else:
+                return None
+        return value
+
+    @staticmethod
+    def escape(value, json_string=False):
+        """Values as the generator writes them: quotes escaped, objects as JSON"""
+        if value is None:
+            return ""
+        if isinstance(value, str) and json_string:
+            return json.dumps(value)[1:-1]  # package.json and friends
+        if isinstance(value, str):
+            return value.replace("'", "\\'").replace('"', '\\"')
+        if isinstance(value, bool):
+            return "true" if value else "false"
+        if isinstance(value, (dict, list)):
+            return json.dumps(value, separators=(",", ":"))
+        return str(value)
+
+
+class AcmeRateLimiter:
+    """Token bucket shared by issuance workers to stay under ACME order limits"""
+
+    def __init__(self, per_hour, burst):
+        self.rate = per_hour / 3600.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until one more order may be placed"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class BuildAdmissionController:
+    """Scheduler that keeps concurrent deploys from oversubscribing the host
+
+    Waiting builds are ordered by tenant turn (a tenant's n-th job ranks
+    behind every other tenant's earlier ones), then estimated cost, then the
+    tenant served least recently; jobs waiting past build_aging_seconds go
+    first. The first build
+    in line starts once a build slot is free, available memory covers its
+    estimate on top of what running builds reserved, and the load average is
+    under the limit. Cheap jobs may also pass the line through the fast lane.
+    An idle host always admits the first in line, so a small host still makes
+    progress one build at a time.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.waiting = []  # Tickets in arrival order
+        self.running = {}  # Ticket id -> ticket
+        self.last_served = {}  # Tenant -> when its last build was admitted
+
+    @staticmethod
+    def slots():
+        return CONFIG["build_slots"] or max(1, (os.cpu_count() or 2) // 2)
+
+    @staticmethod
+    def available_memory():
+        """MemAvailable in bytes, or None where /proc/meminfo has none"""
+        try:
+            with open("/proc/meminfo", "r") as f:
+                for line in f:
+                    if line.startswith("MemAvailable:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return None
+
+    def ordered_waiting(self):
+        """Waiting tickets in the order they should start"""
+        turns = {}
+        for ticket in self.running.values():
+            turns[ticket["tenant"]] = turns.get(ticket["tenant"], 0) + 1
+        rank = {}
+        for ticket in sorted(self.waiting, key=lambda t: t["queued_at"]):
+            rank[ticket["id"]] = turns.get(ticket["tenant"], 0)
+            turns[ticket["tenant"]] = rank[ticket["id"]] + 1
+
+        now = time.time()
+        return sorted(
+            self.waiting,
+            key=lambda t: (
+                now - t["queued_at"] < CONFIG["build_aging_seconds"],
+                rank[t["id"]],
+                t["cost"],
+                self.last_served.get(t["tenant"], 0),
+                t["queued_at"],
+            ),
+        )
+
+    def free_lane(self, ticket):
+        """The slot a ticket could take right now: "build", "fast" or None"""
+        lanes = [t["lane"] for t in self.running.values()]
+        if lanes.count("build") < self.slots():
+            return "build"
+        if (
+            ticket["cost"] <= CONFIG["build_fast_lane_seconds"]
+            and lanes.count("fast") < CONFIG["build_fast_lane_slots"]
+        ):
+            return "fast"
+        return None
+
+    def blocker(self, ticket):
+        """What a waiting ticket is held back by, or None if it may start"""
+        lane = self.free_lane(ticket)
+        # Only the fast lane lets a job start ahead of the first in line
+        if self.ordered_waiting()[0] is not ticket and lane != "fast":
+            return "queue"
+        ticket["lane"] = lane
+        if not self.running:
+            return None
+        if lane is None:
+            return "slot"
+        available = self.available_memory()
+        if available is not None:
+            reserved = sum(t["memory"] for t in self.running.values())
+            headroom = SimpleHostingManager.parse_size(CONFIG["build_memory_headroom"])
+            if available - reserved < ticket["memory"] + headroom:
+                return "memory"
+        if (
+            lane == "build"
+            and os.getloadavg()[0]
+            > (os.cpu_count() or 1) * CONFIG["build_max_load_per_cpu"]
+        ):
+            return "load"
+        return None
+
+    def admit(self, ticket, timeout=None, cancel=None):
+        """Block until the ticket may build; False if it waited too long or was cancelled"""
+        if timeout is None:
+            timeout = CONFIG["build_queue_timeout"]
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            ticket["queued_at"] = time.time()
+            self.waiting.append(ticket)
+            while True:
+                ticket["waiting_for"] = self.blocker(ticket)
+                if ticket["waiting_for"] is None:
+                    self.waiting.remove(ticket)
+                    self.running[ticket["id"]] = ticket
+                    ticket["admitted_at"] = time.time()
+                    self.last_served[ticket["tenant"]] = ticket["admitted_at"]
+                    self.condition.notify_all()  # The next in line re-checks
+                    return True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or (cancel and cancel.is_set()):
+                    self.waiting.remove(ticket)
+                    self.condition.notify_all()
+                    return False
+                # Memory and load change without notice: re-check periodically
+                self.condition.wait(min(remaining, CONFIG["build_admission_poll"]))
+
+    def wake(self):
+        """Make waiting tickets re-check now, e.g. after a cancel"""
+        with self.condition:
+            self.condition.notify_all()
+
+    def release(self, ticket):
+        with self.condition:
+            self.running.pop(ticket["id"], None)
+            self.condition.notify_all()
+
+    def position(self, ticket_id):
+        """1-based place in the queue, 0 while building, None otherwise"""
+        with self.condition:
+            for index, ticket in enumerate(self.ordered_waiting()):
+                if ticket["id"] == ticket_id:
+                    return {
+                        "queue_position": index + 1,
+                        "waiting_for": ticket["waiting_for"],
+                        "queued_seconds": round(time.time() - ticket["queued_at"], 1),
+                    }
+            return {
+                "queue_position": 0 if ticket_id in self.running else None,
+                "waiting_for": None,
+            }
+
+    def snapshot(self):
+        """Slots, reservations and the queue, for the jobs API"""
+        with self.condition:
+            return {
+                "slots": self.slots(),
+                "running": [
+                    {
+                        "id": t["id"],
+                        "site_name": t["site_name"],
+                        "tenant": t["tenant"],
+                        "job_class": t["job_class"],
+                        "lane": t["lane"],
+                        "memory": t["memory"],
+                        "estimated_seconds": t["cost"],
+                        "seconds": round(time.time() - t["admitted_at"], 1),
+                    }
+                    for t in self.running.values()
+                ],
+                "queued": [
+                    {
+                        "id": t["id"],
+                        "tenant": t["tenant"],
+                        "job_class": t["job_class"],
+                        "estimated_seconds": t["cost"],
+                        "waiting_for": t["waiting_for"],
+                    }
+                    for t in self.ordered_waiting()
+                ],
+                "memory_available": self.available_memory(),
+                "load_average": os.getloadavg()[0],
+            }
+
+
+class NoRedirectHandler(urllib.request.HTTPRedirectHandler):
+    """Surface 3xx responses as-is; a redirect already proves the app is serving"""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class AppSupervisor:
+    """Single process that runs and restarts every read-only mode app instance
+
+    Exits are seen through pidfds registered in a selectors loop, so a crash is
+    noticed immediately and restarted with exponential backoff. Child output is
+    piped into size-rotated logs. Control requests (one JSON line each way)
+    arrive on a unix socket, so status checks never fork.
+    """
+
+    def __init__(self, socket_path=None, state_file=None):
+        self.socket_path = socket_path or CONFIG["supervisor_socket"]
+        self.state_file = state_file or CONFIG["supervisor_state_file"]
+        self.selector = selectors.DefaultSelector()
+        self.programs = {}  # "site:port" -> spec plus runtime state
+        self.running = True
+        self.cgroup_base = None  # Delegated cgroup v2 subtree, if we own one
+        self.cgroup_controllers = set()
+
+    @staticmethod
+    def program_key(site_name, port):
+        return f"{site_name}:{port}"
+
+    def run(self):
+        """Serve the control socket and supervise programs until SIGTERM"""
+        os.makedirs(os.path.dirname(self.socket_path), exist_ok=True)
+        if os.path.exists(self.socket_path):
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                    probe.connect(self.socket_path)
+                print(f"❌ Supervisor already running on {self.socket_path}")
+                return False
+            except OSError:
+                os.remove(self.socket_path)  # Left behind by a dead supervisor
+
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(self.socket_path)
+        os.chmod(self.socket_path, 0o660)
+        listener.listen(64)
+        listener.setblocking(False)
+        self.selector.register(listener, selectors.EVENT_READ, ("accept", listener))
+
+        def request_shutdown(signum, frame):
+            self.running = False
+
+        signal.signal(signal.SIGTERM, request_shutdown)
+        signal.signal(signal.SIGINT, request_shutdown)
+
+        print(f"🧭 App supervisor listening on {self.socket_path}")
+        self.setup_cgroups()
+        self.load_state()
+
+        while self.running:
+            for key, _ in self.selector.select(self.next_timer_delay()):
+                kind, target = key.data
+                if kind == "accept":
+                    self.accept_client(target)
+                elif kind == "client":
+                    self.read_client(target)
+                elif kind == "exit":
+                    self.on_exit(target)
+                elif kind == "output":
+                    self.read_output(target)
+            self.run_timers()
+
+        self.shutdown()
+        self.selector.unregister(listener)
+        listener.close()
+        os.remove(self.socket_path)
+        return True
+
+    # Programs
+
+    def setup_cgroups(self):
+        """Take over our cgroup v2 subtree so each program gets its own limits"""
+        try:
+            with open("/proc/self/cgroup", "r") as f:
+                path = next(
+                    line.split("::", 1)[1].strip()
+                    for line in f
+                    if line.startswith("0::")
+                )
+            base = f"{CONFIG['cgroup_mount']}{path}".rstrip("/")
+            if not os.access(f"{base}/cgroup.subtree_control", os.W_OK):
+                raise PermissionError(f"{base} is not delegated to us")
+
+            # cgroup v2 keeps processes out of cgroups whose children have
+            # controllers, so the supervisor itself moves into a leaf first
+            os.makedirs(f"{base}/supervisor", exist_ok=True)
+            with open(f"{base}/supervisor/cgroup.procs", "w") as f:
+                f.write(str(os.getpid()))
+            with open(f"{base}/cgroup.controllers", "r") as f:
+                controllers = set(f.read().split()) & {"memory", "cpu", "pids", "io"}
+            with open(f"{base}/cgroup.subtree_control", "w") as f:
+                f.write(" ".join(f"+{name}" for name in sorted(controllers)))
+        except (OSError, StopIteration) as e:
+            print(f"   ⚠️  No cgroup v2 delegation - apps run without limits ({e})")
+            return False
+
+        self.cgroup_base = base
+        self.cgroup_controllers = controllers
+        print(f"   📦 Per-app cgroups under {base} ({', '.join(sorted(controllers))})")
+        return True
+
+    def program_cgroup(self, program):
+        """Create (or update) a program's cgroup and write its limits"""
+        if not self.cgroup_base:
+            return None
+        path = f"{self.cgroup_base}/app-{program['site_name']}-{program['port']}"
+        os.makedirs(path, exist_ok=True)
+        limits = program.get("limits") or {}
+        settings = [
+            ("memory", "memory.max", limits.get("memory_max")),
+            ("memory", "memory.high", limits.get("memory_high")),
+            ("cpu", "cpu.weight", limits.get("cpu_weight")),
+            ("pids", "pids.max", limits.get("tasks_max")),
+            ("io", "io.weight", limits.get("io_weight")),
+        ]
+        for controller, name, value in settings:
+            if value is None or controller not in self.cgroup_controllers:
+                continue
+            try:
+                with open(f"{path}/{name}", "w") as f:
+                    f.write(f"default {value}" if name == "io.weight" else str(value))
+            except OSError as e:
+                self.log(program, f"could not set {name}={value}: {e}")
+        return path
+
+    def spawn(self, program):
+        """Start a program in its own process group and watch its pidfd"""
+        env = dict(os.environ)
+        env.update(program.get("env") or {})
+        env.update(
+            {
+                "NODE_ENV": "production",
+                "PORT": str(program["port"]),
+                "PATH": f"/usr/bin:/bin:/usr/local/bin:{env.get('PATH', '')}",
+            }
+        )
+        cgroup = self.program_cgroup(program)
+        program["cgroup"] = cgroup
+
+        def enter_cgroup():
+            # Runs in the child before exec: nothing escapes the limits
+            with open(f"{cgroup}/cgroup.procs", "w") as f:
+                f.write("0")
+
+        try:
+            process = subprocess.Popen(
+                program["command"],
+                cwd=program["cwd"],
+                env=env,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                start_new_session=True,
+                preexec_fn=enter_cgroup if cgroup else None,
+            )
+        except (OSError, subprocess.SubprocessError) as e:
+            self.log(program, f"failed to start: {e}")
+            self.schedule_restart(program)
+            return False
+
+        program.update(
+            process=process,
+            started_at=time.time(),
+            restart_at=None,
+            kill_at=None,
+        )
+        pidfd = os.pidfd_open(process.pid)
+        program["pidfd"] = pidfd
+        self.selector.register(pidfd, selectors.EVENT_READ, ("exit", program))
+        os.set_blocking(process.stdout.fileno(), False)
+        self.selector.register(
+            process.stdout, selectors.EVENT_READ, ("output", (program, process.stdout))
+        )
+        self.log(program, f"started pid {process.pid}: {' '.join(program['command'])}")
+        return True
+
+    def signal_program(self, program, signum):
+        try:
+            os.killpg(program["process"].pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def stop(self, program):
+        """SIGTERM the program's process group; SIGKILL after the grace period"""
+        if program.get("process") and not program.get("kill_at"):
+            self.signal_program(program, signal.SIGTERM)
+            program["kill_at"] = time.time() + CONFIG["supervisor_stop_timeout"]
+
+    def on_exit(self, program):
+        """Reap an exited program, then restart it (with backoff) if still wanted"""
+        process = program["process"]
+        returncode = process.wait()
+        self.selector.unregister(program["pidfd"])
+        os.close(program["pidfd"])
+        uptime = time.time() - program["started_at"]
+        program.update(process=None, pidfd=None, kill_at=None)
+        program["last_exit"] = {
+            "code": returncode,
+            "at": time.time(),
+            "uptime": round(uptime, 1),
+        }
+        self.log(program, f"exited with code {returncode} after {uptime:.1f}s")
+
+        key = self.program_key(program["site_name"], program["port"])
+        if program["desired"] != "running":
+            self.programs.pop(key, None)
+            if program.get("cgroup"):
+                try:
+                    os.rmdir(program["cgroup"])
+                except OSError:
+                    pass  # Still has a straggler; reused on the next start
+        elif program.pop("restart_now", False):
+            self.spawn(program)
+        else:
+            if uptime >= CONFIG["supervisor_stable_seconds"]:
+                program["failures"] = 0  # Ran long enough: not a crash loop
+            self.schedule_restart(program)
+        self.reply_waiters(program)
+        self.save_state()
+
+    def schedule_restart(self, program):
+        delay = min(
+            CONFIG["supervisor_backoff_max"],
+            CONFIG["supervisor_backoff_initial"] * 2 ** program["failures"],
+        )
+        program["failures"] += 1
+        program["restarts"] += 1
+        program["restart_at"] = time.time() + delay
+        self.log(program, f"restarting in {delay:g}s")
+
+    def next_timer_delay(self):
+        # Capped so a SIGTERM flag is noticed within a second
+        due = [
+            when
+            for program in self.programs.values()
+            for when in (program.get("restart_at"), program.get("kill_at"))
+            if when
+        ]
+        return max(0, min([time.time() + 1, *due]) - time.time())
+
+    def run_timers(self):
+        now = time.time()
+        for program in list(self.programs.values()):
+            if program.get("restart_at") and program["restart_at"] <= now:
+                program["restart_at"] = None
+                self.spawn(program)
+                self.reply_waiters(program)
+            if program.get("kill_at") and program["kill_at"] <= now:
+                self.log(program, "did not stop in time - sending SIGKILL")
+                self.signal_program(program, signal.SIGKILL)
+                program["kill_at"] = None
+
+    def shutdown(self):
+        """Stop every child; the state file keeps them for the next supervisor"""
+        self.save_state()
+        for program in self.programs.values():
+            program["desired"] = "stopped"
+            self.stop(program)
+        deadline = time.time() + CONFIG["supervisor_stop_timeout"]
+        for program in self.programs.values():
+            if program.get("process"):
+                try:
+                    program["process"].wait(max(0, deadline - time.time()))
+                except subprocess.TimeoutExpired:
+                    self.signal_program(program, signal.SIGKILL)
+
+    # Output and logs
+
+    def read_output(self, target):
+        # The pipe outlives its process until drained, so it travels with it
+        program, stream = target
+        try:
+            data = os.read(stream.fileno(), 65536)
+        except BlockingIOError:
+            return
+        if not data:
+            self.selector.unregister(stream)
+            stream.close()
+            return
+        self.write_log(program, data)
+
+    def log(self, program, message):
+        stamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.write_log(program, f"[supervisor {stamp}] {message}\n".encode())
+
+    def write_log(self, program, data):
+        log = program.get("log")
+        if log is None:
+            os.makedirs(os.path.dirname(program["log_file"]), exist_ok=True)
+            log = program["log"] = open(program["log_file"], "ab", buffering=0)
+        log.write(data)
+        if log.tell() >= CONFIG["supervisor_log_max_bytes"]:
+            log.close()
+            backups = CONFIG["supervisor_log_backups"]
+            for index in range(backups - 1, 0, -1):
+                older = f"{program['log_file']}.{index}"
+                if os.path.exists(older):
+                    os.replace(older, f"{program['log_file']}.{index + 1}")
+            os.replace(program["log_file"], f"{program['log_file']}.1")
+            program["log"] = open(program["log_file"], "ab", buffering=0)
+
+    # Control socket
+
+    def accept_client(self, listener):
+        try:
+            conn, _ = listener.accept()
+        except BlockingIOError:
+            return
+        conn.setblocking(False)
+        self.selector.register(
+            conn, selectors.EVENT_READ, ("client", {"conn": conn, "buffer": b""})
+        )
+
+    def read_client(self, client):
+        conn = client["conn"]
+        try:
+            data = conn.recv(65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self.selector.unregister(conn)
+            conn.close()
+            return
+        client["buffer"] += data
+        if b"\n" not in client["buffer"]:
+            return
+
+        self.selector.unregister(conn)
+        try:
+            request = json.loads(client["buffer"].split(b"\n", 1)[0])
+            response = self.handle_request(request, conn)
+        except Exception as e:
+            response = {"ok": False, "error": str(e)}
+        if response is not None:  # None: answered once the program settles
+            self.send(conn, response)
+
+    def send(self, conn, response):
+        try:
+            conn.settimeout(1)
+            conn.sendall(json.dumps(response).encode() + b"\n")
+        except OSError:
+            pass
+        conn.close()
+
+    def reply_waiters(self, program):
+        waiters, program["waiters"] = program.get("waiters", []), []
+        ok = program["desired"] != "running" or program.get("process") is not None
+        for conn in waiters:
+            self.send(conn, {"ok": ok, "program": self.describe(program)})
+
+    def handle_request(self, request, conn):
+        action = request.get("action")
+        if action == "status":
+            programs = [
+                self.describe(program)
+                for program in self.programs.values()
+                if request.get("site_name") in (None, program["site_name"])
+                and request.get("port") in (None, program["port"])
+            ]
+            return {"ok": True, "programs": programs}
+
+        key = self.program_key(request["site_name"], request["port"])
+        program = self.programs.get(key)
+
+        if action == "start":
+            spec = {
+                name: request[name]
+                for name in ("site_name", "port", "cwd", "command", "log_file")
+            }
+            spec["limits"] = request.get("limits")
+            spec["env"] = request.get("env") or {}
+            if program is None:
+                program = self.programs[key] = {
+                    **spec,
+                    "failures": 0,
+                    "restarts": 0,
+                    "waiters": [],
+                }
+            program.update(spec, desired="running", failures=0)
+            if program.get("process"):
+                # Restart: answered once the replacement has been spawned
+                program["restart_now"] = True
+                program["waiters"].append(conn)
+                self.stop(program)
+                return None
+            program["restart_at"] = None
+            started = self.spawn(program)
+            self.save_state()
+            return {"ok": started, "program": self.describe(program)}
+
+        if action == "stop":
+            if program is None:
+                return {"ok": True, "program": None}
+            program["desired"] = "stopped"
+            if program.get("process"):
+                # Answered once the process is gone and its port is free
+                program["waiters"].append(conn)
+                self.stop(program)
+                return None
+            self.programs.pop(key)
+            self.save_state()
+            return {"ok": True, "program": None}
+
+        if action == "logs":
+            lines = int(request.get("lines", 50))
+            try:
+                with open(request.get("log_file") or program["log_file"], "rb") as f:
+                    f.seek(max(0, os.fstat(f.fileno()).st_size - 65536))
+                    tail = f.read().decode(errors="replace").splitlines()[-lines:]
+            except (OSError, TypeError):
+                tail = []
+            return {"ok": True, "lines": tail}
+
+        return {"ok": False, "error": f"Unknown action: {action}"}
+
+    def describe(self, program):
+        process = program.get("process")
+        if process:
+            state = "stopping" if program.get("kill_at") else "running"
+        else:
+            state = "backoff" if program.get("restart_at") else "stopped"
+        return {
+            "site_name": program["site_name"],
+            "port": program["port"],
+            "state": state,
+            "pid": process.pid if process else None,
+            "uptime": round(time.time() - program["started_at"], 1) if process else 0,
+            "restarts": program["restarts"],
+            "last_exit": program.get("last_exit"),
+            "cwd": program["cwd"],
+            "log_file": program["log_file"],
+            "cgroup": program.get("cgroup"),
+            "limits": program.get("limits"),
+        }
+
+    # State across supervisor restarts
+
+    def save_state(self):
+        state = {
+            key: {
+                "site_name": program["site_name"],
+                "port": program["port"],
+                "cwd": program["cwd"],
+                "command": program["command"],
+                "log_file": program["log_file"],
+                "limits": program.get("limits"),
+                "env": program.get("env"),
+                "pid": program["process"].pid if program.get("process") else None,
+            }
+            for key, program in self.programs.items()
+            if program["desired"] == "running"
+        }
+        temp_file = f"{self.state_file}.tmp"
+        with open(temp_file, "w") as f:
+            json.dump(state, f, indent=2)
+        os.replace(temp_file, self.state_file)
+
+    def load_state(self):
+        """Restart the programs a previous supervisor was running"""
+        if not os.path.exists(self.state_file):
+            return
+        with open(self.state_file, "r") as f:
+            state = json.load(f)
+
+        for key, spec in state.items():
+            pid = spec.pop("pid", None)
+            # An orphan of a crashed supervisor still holds the port; its
+            # output pipe is gone, so replace it rather than adopt it
+            if pid and self.process_group_alive(pid):
+                os.killpg(pid, signal.SIGTERM)
+                deadline = time.time() + CONFIG["supervisor_stop_timeout"]
+                while self.process_group_alive(pid) and time.time() < deadline:
+                    time.sleep(0.1)
+                if self.process_group_alive(pid):
+                    os.killpg(pid, signal.SIGKILL)
+            program = self.programs[key] = {
+                **spec,
+                "desired": "running",
+                "failures": 0,
+                "restarts": 0,
+                "waiters": [],
+            }
+            self.spawn(program)
+        print(f"   ♻️  Restarted {len(state)} program(s) from {self.state_file}")
+
+    @staticmethod
+    def process_group_alive(pgid):
+        try:
+            os.killpg(pgid, 0)
+            return True
+        except (ProcessLookupError, PermissionError):
+            return False
 
 
 class SimpleHostingManager:
+    # Public suffixes with two labels, so "shop.example.co.uk" groups under
+    # "example.co.uk" rather than every customer sharing "co.uk"
+    MULTI_LABEL_SUFFIXES = {
+        "co.uk",
+        "org.uk",
+        "ac.uk",
+        "gov.uk",
+        "com.au",
+        "net.au",
+        "org.au",
+        "co.nz",
+        "co.jp",
+        "co.za",
+        "co.in",
+        "com.br",
+        "com.mx",
+        "com.tr",
+    }
+
+    # Log lines most likely to say why an app died
+    CRASH_LINE_PATTERN = re.compile(
+        r"error|exception|fatal|failed|cannot|npm ERR!|EADDRINUSE|ENOMEM|killed",
+        re.IGNORECASE,
+    )
+
     def __init__(self):
         self.is_root = os.geteuid() == 0
         self.current_user = self.get_current_user()
         self.readonly_filesystem = self.detect_readonly_filesystem()
         self.setup_readonly_config()
+        self.templates = ConfigTemplateEngine(NGINX_TEMPLATES)
+        self.site_templates = GeneratorTemplateLoader()
+        self.blobs_pruned_at = 0
+        self.acme_limiter = AcmeRateLimiter(
+            CONFIG["acme_orders_per_hour"], CONFIG["acme_order_burst"]
+        )
+        self.build_admission = BuildAdmissionController()
+        self.renewal_stop = threading.Event()
+        self.hibernation_stop = threading.Event()
+        self.crash_watch_stop = threading.Event()
+        self.restart_counters = {}  # (site, port) -> last seen restart count
+        self.app_locks = {}
+        self.app_locks_guard = threading.Lock()
+        self.deploy_slots = {}  # site -> running and pending deploy job ids
+        self.deploy_slots_condition = threading.Condition()
+        self.port_pool_ready = False
 
     def detect_readonly_filesystem(self):
         """Comprehensive read-only filesystem detection"""
@@ -103,6 +1706,8 @@ class SimpleHostingManager:
             CONFIG["database_path"] = "/tmp/hosting/hosting.db"
             CONFIG["web_root"] = "/tmp/www/domains"
             CONFIG["log_dir"] = "/tmp/hosting/logs"
+            CONFIG["golden_env_dir"] = "/tmp/hosting/golden"
+            CONFIG["blob_store_dir"] = "/tmp/hosting/blobs"
 
             # Create writable directories
             writable_dirs = [
@@ -386,8 +1991,71 @@ class SimpleHostingManager:
             print(f"   ❌ Nginx reload error: {e}")
             return False
 
+    def wait_for_app_ready(self, port, path=None, timeout=None, is_alive=None):
+        """Poll an app's port until it serves HTTP, with exponential backoff"""
+        path = path or CONFIG["readiness_path"]
+        timeout = timeout or CONFIG["readiness_timeout"]
+        opener = urllib.request.build_opener(NoRedirectHandler)
+
+        started = time.monotonic()
+        deadline = started + timeout
+        delay = CONFIG["readiness_initial_delay"]
+        attempts = 0
+        stage = "tcp"
+
+        print(f"   ⏳ Waiting for http://127.0.0.1:{port}{path} (up to {timeout}s)")
+        while True:
+            attempts += 1
+            try:
+                # A cheap connect first; only listening apps get an HTTP request
+                with socket.create_connection(("127.0.0.1", port), timeout=1):
+                    pass
+                stage = "http"
+                try:
+                    with opener.open(
+                        f"http://127.0.0.1:{port}{path}",
+                        timeout=CONFIG["readiness_http_timeout"],
+                    ) as response:
+                        status = response.status
+                except urllib.error.HTTPError as e:
+                    status = e.code
+
+                if status < 500:
+                    print(
+                        f"   ✅ Ready in {time.monotonic() - started:.1f}s (HTTP {status} after {attempts} probes)"
+                    )
+                    return True
+                stage = f"http {status}"
+            except OSError:
+                pass
+
+            if is_alive and not is_alive():
+                print(f"   ❌ Process exited before becoming ready (last: {stage})")
+                return False
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                print(f"   ❌ Not ready after {timeout}s (last: {stage})")
+                return False
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, CONFIG["readiness_max_delay"])
+
+    def systemd_unit_alive(self, unit):
+        """True while a unit is running or (re)starting"""
+        result = subprocess.run(
+            ["systemctl", "is-active", unit], capture_output=True, text=True
+        )
+        return result.stdout.strip() in ("active", "activating", "reloading")
+
     def create_readonly_process_manager(
-        self, site_name, final_dir, app_port, start_command=None
+        self,
+        site_name,
+        final_dir,
+        app_port,
+        start_command=None,
+        readiness_path=None,
+        readiness_timeout=None,
+        resources=None,
     ):
         """Create a simple process manager for read-only filesystems"""
         try:
@@ -401,6 +2069,9 @@ class SimpleHostingManager:
             if start_command:
                 exec_command = start_command
                 print(f"   ▶️  Using provided start command: {start_command}")
+            elif self.is_standalone_release(final_dir):
+                exec_command = self.STANDALONE_START_COMMAND
+                print(f"   🔍 Detected Next.js standalone release: {exec_command}")
             else:
                 # Fallback to detecting start method
                 if os.path.exists(
@@ -444,202 +2115,182 @@ class SimpleHostingManager:
                     exec_command = f"node {main_script}"
                     print(f"   📄 Using Node.js command: {exec_command}")
 
-            # Create a simple start script
-            start_script = f"""#!/bin/bash
-# Simple Node.js app starter for {site_name}
-cd "{final_dir}"
-export NODE_ENV=production
-export PORT={app_port}
-export PATH=/usr/bin:/bin:/usr/local/bin:$PATH
-
-# Create a PID file
-PID_FILE="/tmp/nodejs-apps/{site_name}/{site_name}.pid"
-LOG_FILE="/tmp/nodejs-apps/{site_name}/{site_name}.log"
-
-# Function to start the app
-start_app() {{
-    echo "Starting {site_name} with command: {exec_command}..."
-    echo "Working directory: $(pwd)"
-    echo "Starting at: $(date)" >> "$LOG_FILE"
-    
-    # Start the application
-    nohup {exec_command} > "$LOG_FILE" 2>&1 &
-    echo $! > "$PID_FILE"
-    echo "Started {site_name} with PID $(cat $PID_FILE)"
-    echo "Logs: tail -f $LOG_FILE"
-}}
-
-# Function to stop the app
-stop_app() {{
-    if [ -f "$PID_FILE" ]; then
-        PID=$(cat "$PID_FILE")
-        if kill -0 "$PID" 2>/dev/null; then
-            echo "Stopping {site_name} (PID: $PID)..."
-            kill "$PID"
-            rm -f "$PID_FILE"
-            echo "Stopped {site_name}"
-        else
-            echo "{site_name} is not running"
-            rm -f "$PID_FILE"
-        fi
-    else
-        echo "PID file not found, {site_name} may not be running"
-    fi
-}}
-
-# Function to check status
-status_app() {{
-    if [ -f "$PID_FILE" ]; then
-        PID=$(cat "$PID_FILE")
-        if kill -0 "$PID" 2>/dev/null; then
-            echo "{site_name} is running (PID: $PID)"
-            echo "Command: {exec_command}"
-            echo "Directory: {final_dir}"
-            echo "Log file: $LOG_FILE"
-            return 0
-        else
-            echo "{site_name} is not running (stale PID file)"
-            rm -f "$PID_FILE"
-            return 1
-        fi
-    else
-        echo "{site_name} is not running"
-        return 1
-    fi
-}}
-
-# Function to show logs
-logs_app() {{
-    if [ -f "$LOG_FILE" ]; then
-        echo "=== {site_name} logs ==="
-        tail -n 50 "$LOG_FILE"
-    else
-        echo "No log file found for {site_name}"
-    fi
-}}
+            # The supervisor runs the release's start script and restarts it
+            # if it dies; readiness is still probed over HTTP here
+            self.write_release_start_script(final_dir, exec_command)
+            instance = {"port": app_port, "release": final_dir}
+            if not self.readonly_instance_control(
+                site_name, instance, "start", resources
+            ):
+                print(
+                    f"   ❌ Supervisor could not start {site_name} on port {app_port}"
+                )
+                return False
 
-case "$1" in
-    start)
-        stop_app
-        start_app
-        ;;
-    stop)
-        stop_app
-        ;;
-    restart)
-        stop_app
-        start_app
-        ;;
-    status)
-        status_app
-        ;;
-    logs)
-        logs_app
-        ;;
-    *)
-        echo "Usage: $0 {{start|stop|restart|status|logs}}"
-        exit 1
-        ;;
-esac
-"""
+            print(f"   ✅ Supervised by the app supervisor on port {app_port}")
+            print(f"   ▶️  Start command: {exec_command}")
+
+            # deployment.json is owned by release_app, which records this
+            # instance only once it is serving
+            return self.wait_for_app_ready(
+                app_port,
+                readiness_path,
+                readiness_timeout,
+                is_alive=lambda: self.readonly_instance_control(
+                    site_name, instance, "status"
+                ),
+            )
 
-            # Write the start script
-            script_path = f"{wrapper_dir}/control.sh"
-            with open(script_path, "w") as f:
-                f.write(start_script)
+        except Exception as e:
+            print(f"   ❌ Read-only process manager creation failed: {e}")
+            return False
 
-            # Make executable
-            os.chmod(script_path, 0o755)
+    def readonly_instance_control(self, site_name, instance, action, resources=None):
+        """Start, stop or check one instance through the app supervisor"""
+        wrapper_dir = f"/tmp/nodejs-apps/{site_name}"
+        if instance.get("legacy"):
+            control_script = f"{wrapper_dir}/control.sh"
+        else:
+            control_script = f"{wrapper_dir}/control-{instance['port']}.sh"
 
-            # Test the script
-            test_result = subprocess.run(
-                [script_path, "start"], capture_output=True, text=True
+        # Deployed before the supervisor: keep driving the bash control script
+        if os.path.exists(control_script):
+            result = subprocess.run(
+                [control_script, action], capture_output=True, text=True
             )
+            return result.returncode == 0
 
-            if test_result.returncode == 0:
-                print(f"   ✅ Read-only process manager created: {script_path}")
-                print(f"   ▶️  Start command: {exec_command}")
-
-                # Save deployment info
-                deployment_info = {
+        port = instance["port"]
+        if action == "status":
+            response = self.supervisor_request(
+                {"action": "status", "site_name": site_name, "port": port}
+            )
+            return any(p["state"] == "running" for p in response.get("programs", []))
+        if action == "start":
+            if not instance.get("release"):
+                return False
+            response = self.supervisor_request(
+                {
+                    "action": "start",
                     "site_name": site_name,
-                    "port": app_port,
-                    "cwd": final_dir,
-                    "process_manager": "readonly-simple",
-                    "control_script": script_path,
-                    "start_command": exec_command,
-                    "created_at": datetime.now().isoformat(),
+                    "port": port,
+                    "cwd": instance["release"],
+                    "command": ["/bin/bash", f"{instance['release']}/.hosting-start"],
+                    "log_file": f"{wrapper_dir}/{site_name}-{port}.log",
+                    "limits": resources,
+                    "env": self.read_node_env(site_name),
                 }
+            )
+            return response.get("ok", False)
+        if action == "stop":
+            response = self.supervisor_request(
+                {"action": "stop", "site_name": site_name, "port": port},
+                timeout=CONFIG["supervisor_stop_timeout"] + 5,
+            )
+            return response.get("ok", False)
+        return False
 
-                info_file = f"{wrapper_dir}/deployment.json"
-                with open(info_file, "w") as f:
-                    json.dump(deployment_info, f, indent=2)
-
-                return True
-            else:
-                print(
-                    f"   ❌ Read-only process manager test failed: {test_result.stderr}"
-                )
-                print(f"   📋 Error output: {test_result.stdout}")
-                return False
+    def supervisor_request(self, payload, timeout=30):
+        """One JSON request/response over the supervisor's control socket"""
+        for attempt in range(2):
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                    sock.settimeout(timeout)
+                    sock.connect(CONFIG["supervisor_socket"])
+                    sock.sendall(json.dumps(payload).encode() + b"\n")
+                    data = b""
+                    while not data.endswith(b"\n"):
+                        chunk = sock.recv(65536)
+                        if not chunk:
+                            break
+                        data += chunk
+                return json.loads(data) if data else {"ok": False}
+            except (FileNotFoundError, ConnectionRefusedError):
+                # Nothing listening: start the supervisor once, then retry
+                if attempt or not self.start_supervisor():
+                    return {"ok": False, "error": "App supervisor unavailable"}
+            except (OSError, ValueError) as e:
+                return {"ok": False, "error": str(e)}
+
+    def start_supervisor(self):
+        """Launch the app supervisor detached and wait for its control socket"""
+        print("🧭 Starting app supervisor...")
+        os.makedirs(CONFIG["log_dir"], exist_ok=True)
+        with open(f"{CONFIG['log_dir']}/supervisor.log", "ab") as log:
+            subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), "supervisor"],
+                stdin=subprocess.DEVNULL,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                start_new_session=True,
+            )
 
-        except Exception as e:
-            print(f"   ❌ Read-only process manager creation failed: {e}")
-            return False
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                    sock.connect(CONFIG["supervisor_socket"])
+                return True
+            except OSError:
+                time.sleep(0.1)
+        print("   ❌ App supervisor did not come up")
+        return False
 
     def get_readonly_app_status(self, site_name):
         """Get status of read-only managed app"""
         try:
-            wrapper_dir = f"/tmp/nodejs-apps/{site_name}"
-            control_script = f"{wrapper_dir}/control.sh"
-
-            if os.path.exists(control_script):
-                result = subprocess.run(
-                    [control_script, "status"], capture_output=True, text=True
-                )
-
-                return result.returncode == 0
-            return False
+            return any(
+                self.readonly_instance_control(site_name, instance, "status")
+                for instance in self.app_instances(site_name)
+            )
         except:
             return False
 
     def stop_readonly_app(self, site_name):
         """Stop read-only managed app"""
         try:
-            wrapper_dir = f"/tmp/nodejs-apps/{site_name}"
-            control_script = f"{wrapper_dir}/control.sh"
-
-            if os.path.exists(control_script):
-                result = subprocess.run(
-                    [control_script, "stop"], capture_output=True, text=True
-                )
-                return result.returncode == 0
-            return False
+            results = [
+                self.readonly_instance_control(site_name, instance, "stop")
+                for instance in self.app_instances(site_name)
+            ]
+            return bool(results) and all(results)
         except:
             return False
 
     def start_readonly_app(self, site_name):
         """Start read-only managed app"""
         try:
-            wrapper_dir = f"/tmp/nodejs-apps/{site_name}"
-            control_script = f"{wrapper_dir}/control.sh"
-
-            if os.path.exists(control_script):
-                result = subprocess.run(
-                    [control_script, "start"], capture_output=True, text=True
+            info = self.load_deployment_info(site_name) or {}
+            results = [
+                self.readonly_instance_control(
+                    site_name, instance, "start", info.get("resources")
                 )
-                return result.returncode == 0
-            return False
+                for instance in self.app_instances(site_name, info)
+            ]
+            return bool(results) and all(results)
         except:
             return False
 
-    def create_systemd_app_service(self, site_name, final_dir, app_port):
+    def create_systemd_app_service(
+        self,
+        site_name,
+        final_dir,
+        app_port,
+        readiness_path=None,
+        readiness_timeout=None,
+        resources=None,
+    ):
         """Create a systemd service as alternative to PM2 - with read-only fallback"""
         try:
             # If read-only filesystem, use our simple process manager
             if self.readonly_filesystem:
                 return self.create_readonly_process_manager(
-                    site_name, final_dir, app_port
+                    site_name,
+                    final_dir,
+                    app_port,
+                    readiness_path=readiness_path,
+                    readiness_timeout=readiness_timeout,
+                    resources=resources,
                 )
 
             print(f"🔧 Creating systemd service for {site_name}...")
@@ -655,8 +2306,14 @@ esac
             start_command = None
             main_script = None
 
+            # A standalone release carries its own server and no next binary
+            if self.is_standalone_release(final_dir):
+                app_type = "nextjs"
+                start_command = self.STANDALONE_START_COMMAND
+                print(f"   🔍 Detected Next.js standalone release")
+
             # Check for Next.js application
-            if os.path.exists(
+            elif os.path.exists(
                 os.path.join(final_dir, "next.config.mjs")
             ) or os.path.exists(os.path.join(final_dir, "next.config.js")):
                 app_type = "nextjs"
@@ -677,14 +2334,11 @@ esac
                             f"   ⚠️  Incomplete .next build - missing server directory"
                         )
                         print(f"   🔄 Will attempt to rebuild during startup")
-                        start_command = (
-                            "npm run build && node_modules/next/dist/bin/next start"
-                        )
+                        # Builds once: a crash restart must not rebuild every time
+                        start_command = "(test -f .next/BUILD_ID || npm run build) && node_modules/next/dist/bin/next start"
                 else:
                     print(f"   ⚠️  No .next directory found - will build then start")
-                    start_command = (
-                        "npm run build && node_modules/next/dist/bin/next start"
-                    )
+                    start_command = "(test -f .next/BUILD_ID || npm run build) && node_modules/next/dist/bin/next start"
 
             # Check for package.json with start script
             elif os.path.exists(os.path.join(final_dir, "package.json")):
@@ -708,7 +2362,7 @@ esac
                                     f"   ✅ Found .next directory - using direct binary path"
                                 )
                             else:
-                                start_command = "npm run build && node_modules/next/dist/bin/next start"
+                                start_command = "(test -f .next/BUILD_ID || npm run build) && node_modules/next/dist/bin/next start"
                                 print(
                                     f"   🔨 No .next directory - will build then start with direct binary"
                                 )
@@ -761,28 +2415,36 @@ esac
             print(f"   🚀 Application type: {app_type}")
             print(f"   ▶️  Start command: {start_command}")
 
-            # Create systemd service content
+            # One template unit per site; each instance (nodejs-<site>@<port>) runs
+            # the release its instances/<port> symlink points at, so a new
+            # release can start beside the old one on another port
+            instances_dir = f"{self.deployment_info_dir(site_name)}/instances"
+            unit = f"nodejs-{site_name}@{app_port}"
+            limits = self.systemd_resource_directives(resources)
+
             if app_type in ["nextjs", "npm"]:
                 # For Next.js and npm-based apps
                 service_content = f"""[Unit]
-Description=Node.js App - {site_name} ({app_type})
+Description=Node.js App - {site_name} ({app_type}) on port %i
 After=network.target nginx.service
 Wants=network-online.target
+# No start limit: the crash watch decides when a crash loop is quarantined
+StartLimitIntervalSec=0
 
 [Service]
 Type=simple
 User=www-data
 Group=www-data
-WorkingDirectory={final_dir}
+WorkingDirectory={instances_dir}/%i
 Environment=NODE_ENV=production
-Environment=PORT={app_port}
+Environment=PORT=%i
 Environment=PATH=/usr/bin:/bin:/usr/local/bin:/usr/local/sbin
-ExecStart=/bin/bash -c '{start_command}'
+{limits}
+EnvironmentFile=-{self.node_env_file(site_name)}
+ExecStart=/bin/bash {instances_dir}/%i/.hosting-start
 ExecReload=/bin/kill -HUP $MAINPID
 Restart=always
 RestartSec=10
-StartLimitBurst=3
-StartLimitInterval=60
 StandardOutput=journal
 StandardError=journal
 SyslogIdentifier={site_name}-app
@@ -794,24 +2456,26 @@ WantedBy=multi-user.target
             else:
                 # For traditional Node.js apps
                 service_content = f"""[Unit]
-Description=Node.js App - {site_name} ({app_type})
+Description=Node.js App - {site_name} ({app_type}) on port %i
 After=network.target nginx.service
 Wants=network-online.target
+# No start limit: the crash watch decides when a crash loop is quarantined
+StartLimitIntervalSec=0
 
 [Service]
 Type=simple
 User=www-data
 Group=www-data
-WorkingDirectory={final_dir}
+WorkingDirectory={instances_dir}/%i
 Environment=NODE_ENV=production
-Environment=PORT={app_port}
+Environment=PORT=%i
 Environment=PATH=/usr/bin:/bin:/usr/local/bin
-ExecStart=/bin/bash -c '{start_command}'
+{limits}
+EnvironmentFile=-{self.node_env_file(site_name)}
+ExecStart=/bin/bash {instances_dir}/%i/.hosting-start
 ExecReload=/bin/kill -HUP $MAINPID
 Restart=always
 RestartSec=5
-StartLimitBurst=3
-StartLimitInterval=60
 StandardOutput=journal
 StandardError=journal
 SyslogIdentifier={site_name}-app
@@ -820,57 +2484,65 @@ SyslogIdentifier={site_name}-app
 WantedBy=multi-user.target
 """
 
-            service_file = f"/etc/systemd/system/nodejs-{site_name}.service"
+            service_file = f"/etc/systemd/system/nodejs-{site_name}@.service"
             print(f"   📝 Creating systemd service: {service_file}")
 
             try:
-                with open(service_file, "w") as f:
-                    f.write(service_content)
+                self.write_release_start_script(final_dir, start_command)
+                self.link_instance_release(site_name, app_port, final_dir)
+                unit_changed = self.templates.write_if_changed(
+                    service_file, service_content
+                )
                 print(f"   ✅ Service file created successfully")
             except PermissionError as e:
                 print(f"   ❌ Permission denied creating service file: {e}")
                 print("   🔄 Falling back to read-only process manager...")
                 return self.create_readonly_process_manager(
-                    site_name, final_dir, app_port, start_command
+                    site_name,
+                    final_dir,
+                    app_port,
+                    start_command,
+                    readiness_path,
+                    readiness_timeout,
+                    resources,
                 )
 
-            subprocess.run(["systemctl", "daemon-reload"], capture_output=True)
-            subprocess.run(
-                ["systemctl", "enable", f"nodejs-{site_name}"], capture_output=True
-            )
+            if unit_changed:
+                subprocess.run(["systemctl", "daemon-reload"], capture_output=True)
+            subprocess.run(["systemctl", "enable", unit], capture_output=True)
 
-            print(f"   🚀 Starting systemd service: nodejs-{site_name}")
+            # restart, not start: a reused port must pick up the new release
+            print(f"   🚀 Starting systemd service: {unit}")
             start_result = subprocess.run(
-                ["systemctl", "start", f"nodejs-{site_name}"],
+                ["systemctl", "restart", unit],
                 capture_output=True,
                 text=True,
             )
 
             if start_result.returncode == 0:
-                print(f"   ✅ Systemd service created and started: nodejs-{site_name}")
+                print(f"   ✅ Systemd service created and started: {unit}")
 
-                # Verify the service is actually running
-                time.sleep(2)  # Give it a moment to start
-                status_result = subprocess.run(
-                    ["systemctl", "is-active", f"nodejs-{site_name}"],
-                    capture_output=True,
-                    text=True,
+                # Verify the app is actually serving, not just that the unit started
+                if "npm run build" in start_command:
+                    readiness_timeout = max(readiness_timeout or 0, 300)
+                ready = self.wait_for_app_ready(
+                    app_port,
+                    readiness_path,
+                    readiness_timeout,
+                    is_alive=lambda: self.systemd_unit_alive(unit),
                 )
 
-                if (
-                    status_result.returncode == 0
-                    and status_result.stdout.strip() == "active"
-                ):
+                if ready:
                     print(f"   ✅ Service verified as running")
                     return True
                 else:
-                    print(f"   ⚠️  Service created but not running properly")
+                    print(f"   ⚠️  Service created but not serving on port {app_port}")
                     # Get more detailed status
                     detailed_status = subprocess.run(
                         [
                             "systemctl",
                             "status",
-                            f"nodejs-{site_name}",
+                            unit,
                             "--no-pager",
                             "-l",
                         ],
@@ -884,7 +2556,7 @@ WantedBy=multi-user.target
                         [
                             "journalctl",
                             "-u",
-                            f"nodejs-{site_name}",
+                            unit,
                             "--no-pager",
                             "-n",
                             "10",
@@ -899,7 +2571,13 @@ WantedBy=multi-user.target
                 print(f"   ❌ Systemd service start failed: {start_result.stderr}")
                 print(f"   🔄 Falling back to read-only process manager...")
                 return self.create_readonly_process_manager(
-                    site_name, final_dir, app_port, start_command
+                    site_name,
+                    final_dir,
+                    app_port,
+                    start_command,
+                    readiness_path,
+                    readiness_timeout,
+                    resources,
                 )
 
         except Exception as e:
@@ -912,22 +2590,37 @@ WantedBy=multi-user.target
                     final_dir,
                     app_port,
                     start_command if "start_command" in locals() else None,
+                    readiness_path,
+                    readiness_timeout,
+                    resources,
                 )
             return False
 
+    def systemd_instance_unit(self, site_name, instance):
+        """Unit name for an instance; pre-blue/green deploys used one plain unit"""
+        if instance.get("legacy"):
+            return f"nodejs-{site_name}"
+        return f"nodejs-{site_name}@{instance['port']}"
+
     def get_systemd_app_status(self, site_name):
         """Get status of systemd-managed app"""
         try:
             if self.readonly_filesystem:
                 return self.get_readonly_app_status(site_name)
 
+            units = [
+                self.systemd_instance_unit(site_name, instance)
+                for instance in self.app_instances(site_name)
+            ]
+            if not units:
+                return False
             result = subprocess.run(
-                ["systemctl", "is-active", f"nodejs-{site_name}"],
+                ["systemctl", "is-active", *units],
                 capture_output=True,
                 text=True,
             )
 
-            return result.returncode == 0 and result.stdout.strip() == "active"
+            return "active" in result.stdout.split()
         except:
             return False
 
@@ -937,8 +2630,14 @@ WantedBy=multi-user.target
             if self.readonly_filesystem:
                 return self.stop_readonly_app(site_name)
 
+            units = [
+                self.systemd_instance_unit(site_name, instance)
+                for instance in self.app_instances(site_name)
+            ]
+            if not units:
+                return False
             result = subprocess.run(
-                ["systemctl", "stop", f"nodejs-{site_name}"],
+                ["systemctl", "stop", *units],
                 capture_output=True,
                 text=True,
             )
@@ -952,8 +2651,14 @@ WantedBy=multi-user.target
             if self.readonly_filesystem:
                 return self.start_readonly_app(site_name)
 
+            units = [
+                self.systemd_instance_unit(site_name, instance)
+                for instance in self.app_instances(site_name)
+            ]
+            if not units:
+                return False
             result = subprocess.run(
-                ["systemctl", "start", f"nodejs-{site_name}"],
+                ["systemctl", "start", *units],
                 capture_output=True,
                 text=True,
             )
@@ -961,136 +2666,1714 @@ WantedBy=multi-user.target
         except:
             return False
 
-    def setup_system(self):
-        """Complete system setup with read-only filesystem support"""
-        print("🚀 Starting simple multi-domain hosting setup v2.6...")
-        print("   🔒 FULL READ-ONLY FILESYSTEM SUPPORT!")
+    def deployment_apps_dir(self):
+        """Parent directory of every app's deployment info"""
+        if self.readonly_filesystem:
+            return "/tmp/nodejs-apps"
+        return "/var/lib/hosting-apps"
+
+    def deployment_info_dir(self, site_name):
+        """Where a Node.js app's deployment.json and instance links live"""
+        return f"{self.deployment_apps_dir()}/{site_name}"
 
+    def load_deployment_info(self, site_name):
+        """Read an app's deployment.json, or None if it was never deployed"""
+        info_file = f"{self.deployment_info_dir(site_name)}/deployment.json"
+        if not os.path.exists(info_file):
+            return None
+        with open(info_file, "r") as f:
+            return json.load(f)
+
+    def save_deployment_info(self, site_name, info):
+        """Atomically replace an app's deployment.json"""
+        info_dir = self.deployment_info_dir(site_name)
+        os.makedirs(info_dir, mode=0o755, exist_ok=True)
+        temp_file = f"{info_dir}/deployment.json.tmp-{os.getpid()}"
+        with open(temp_file, "w") as f:
+            json.dump(info, f, indent=2)
+        os.replace(temp_file, f"{info_dir}/deployment.json")
+
+    def app_instances(self, site_name, info=None):
+        """The running instances ({port, release}) recorded for an app"""
+        if info is None:
+            info = self.load_deployment_info(site_name)
+        if not info:
+            return []
+        if "instances" in info:
+            return info["instances"]
+        # Deployed before releases: one instance on the recorded port
+        return [{"port": info["port"], "release": info.get("cwd"), "legacy": True}]
+
+    def write_release_start_script(self, release_dir, start_command):
+        """Store a release's start command next to its files"""
+        script_path = f"{release_dir}/.hosting-start"
+        with open(script_path, "w") as f:
+            f.write(
+                "#!/bin/bash\n"
+                "# Generated by simple-hosting.py - starts this release\n"
+                f"exec /bin/bash -c {shlex.quote(start_command)}\n"
+            )
+        os.chmod(script_path, 0o755)
+
+    def link_instance_release(self, site_name, port, release_dir):
+        """Point instances/<port> at a release (the unit's WorkingDirectory)"""
+        instances_dir = f"{self.deployment_info_dir(site_name)}/instances"
+        os.makedirs(instances_dir, mode=0o755, exist_ok=True)
+        temp_link = f"{instances_dir}/.{port}.tmp-{os.getpid()}"
+        if os.path.lexists(temp_link):
+            os.remove(temp_link)
+        os.symlink(release_dir, temp_link)
+        os.replace(temp_link, f"{instances_dir}/{port}")
+
+    def start_app_instance(
+        self,
+        site_name,
+        release_dir,
+        port,
+        readiness_path=None,
+        readiness_timeout=None,
+        resources=None,
+    ):
+        """Start one release on one port and wait until it is serving"""
         if self.readonly_filesystem:
-            print("🔒 Read-only filesystem detected - using safe deployment mode")
+            return self.create_readonly_process_manager(
+                site_name,
+                release_dir,
+                port,
+                readiness_path=readiness_path,
+                readiness_timeout=readiness_timeout,
+                resources=resources,
+            )
+        return self.create_systemd_app_service(
+            site_name,
+            release_dir,
+            port,
+            readiness_path=readiness_path,
+            readiness_timeout=readiness_timeout,
+            resources=resources,
+        )
 
-        if not self.is_root:
-            print("❌ Root privileges required for initial setup")
-            print("   Run: sudo python3 simple-hosting.py --setup")
-            return False
+    def resolve_resources(self, spec=None):
+        """Limits for deployConfig.resources: a class name, or a class plus overrides"""
+        if isinstance(spec, str):
+            spec = {"class": spec}
+        spec = spec or {}
+        class_name = spec.get("class") or CONFIG["default_resource_class"]
+        if class_name not in CONFIG["resource_classes"]:
+            raise ValueError(f"Unknown resource class: {class_name}")
+
+        limits = dict(CONFIG["resource_classes"][class_name])
+        for key, name in [
+            ("memoryMax", "memory_max"),
+            ("cpuWeight", "cpu_weight"),
+            ("tasksMax", "tasks_max"),
+            ("ioWeight", "io_weight"),
+        ]:
+            if spec.get(key) is not None:
+                limits[name] = spec[key]
+
+        memory_max = self.parse_size(limits["memory_max"])
+        return {
+            "class": class_name,
+            "memory_max": memory_max,
+            "memory_high": int(memory_max * CONFIG["memory_high_ratio"]),
+            "cpu_weight": int(limits["cpu_weight"]),
+            "tasks_max": int(limits["tasks_max"]),
+            "io_weight": int(limits["io_weight"]),
+        }
+
+    @staticmethod
+    def parse_size(value):
+        """Bytes from 512M / 1G / 1048576 style sizes"""
+        match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*", str(value), re.I)
+        if not match:
+            raise ValueError(f"Invalid size: {value}")
+        exponent = " KMGT".index(match.group(2).upper() or " ")
+        return int(float(match.group(1)) * 1024**exponent)
+
+    def systemd_resource_directives(self, resources):
+        """[Service] lines putting an instance in the app slice under its limits"""
+        resources = resources or self.resolve_resources()
+        return (
+            f"Slice={CONFIG['app_slice']}\n"
+            f"MemoryHigh={resources['memory_high']}\n"
+            f"MemoryMax={resources['memory_max']}\n"
+            f"CPUWeight={resources['cpu_weight']}\n"
+            f"TasksMax={resources['tasks_max']}\n"
+            f"IOWeight={resources['io_weight']}"
+        )
 
-        try:
-            # 1. Install packages (only if not read-only)
-            if not self.readonly_filesystem:
-                print("\n📦 Installing required packages...")
-                if not self.run_command("apt update", show_output=True):
-                    print("❌ Failed to update package list")
-                    return False
+    def instance_cgroup(self, site_name, instance, info):
+        """cgroup v2 directory of a running instance, or None"""
+        if info.get("process_manager") == "readonly-simple" or self.readonly_filesystem:
+            response = self.supervisor_request(
+                {"action": "status", "site_name": site_name, "port": instance["port"]}
+            )
+            programs = response.get("programs") or [{}]
+            path = programs[0].get("cgroup")
+        else:
+            unit = self.systemd_instance_unit(site_name, instance)
+            result = subprocess.run(
+                [
+                    "systemctl",
+                    "show",
+                    "-p",
+                    "ControlGroup",
+                    "--value",
+                    f"{unit}.service",
+                ],
+                capture_output=True,
+                text=True,
+            )
+            control_group = result.stdout.strip() if result.returncode == 0 else ""
+            if not control_group:
+                slice_name = (
+                    "system.slice" if instance.get("legacy") else CONFIG["app_slice"]
+                )
+                control_group = f"/{self.slice_path(slice_name)}/{unit}.service"
+            path = f"{CONFIG['cgroup_mount']}{control_group}"
+        return path if path and os.path.isdir(path) else None
+
+    @staticmethod
+    def slice_path(slice_name):
+        """cgroup path of a slice: dashes nest, so a-b.slice lives in a.slice"""
+        parts = slice_name[: -len(".slice")].split("-")
+        return "/".join(
+            "-".join(parts[: depth + 1]) + ".slice" for depth in range(len(parts))
+        )
 
-                packages = "nginx sqlite3 certbot python3-certbot-nginx curl git python3-pip nodejs npm"
-                if not self.run_command(f"apt install -y {packages}", show_output=True):
-                    print("❌ Failed to install packages")
-                    return False
-            else:
-                print("\n⚠️  Read-only filesystem - skipping package installation")
-                print("   Assuming packages are already installed")
+    def read_cgroup_usage(self, path):
+        """Memory, CPU, task, IO and pressure figures from a cgroup's stat files"""
 
-            # 2. Ensure nginx is accessible
-            print("\n🔧 Verifying nginx installation...")
-            if not self.ensure_nginx_installed():
-                if not self.readonly_filesystem:
-                    print("❌ Failed to ensure nginx is properly installed")
-                    return False
-                else:
-                    print(
-                        "⚠️  Nginx verification failed but continuing (read-only mode)"
-                    )
+        def read(name):
+            try:
+                with open(f"{path}/{name}", "r") as f:
+                    return f.read()
+            except OSError:
+                return None
+
+        def keyed(text, key):
+            for line in (text or "").splitlines():
+                fields = line.split()
+                if fields and fields[0] == key:
+                    return int(fields[1])
+            return None
 
-            # 3. Install Python packages (only if not read-only)
-            if not self.readonly_filesystem:
-                print("🐍 Installing Python packages...")
-                python_packages = ["flask", "flask-cors", "gunicorn"]
-                for package in python_packages:
-                    result = subprocess.run(
-                        ["pip3", "install", package], capture_output=True, text=True
-                    )
-                    if result.returncode == 0:
-                        print(f"   ✅ {package} installed")
-                    else:
-                        print(f"   ⚠️  {package} installation failed: {result.stderr}")
+        def pressure(text):
+            # "some avg10=0.12 avg60=..." - share of time stalled, last 10s
+            for line in (text or "").splitlines():
+                if line.startswith("some "):
+                    return float(line.split()[1].split("=")[1])
+            return None
 
-            # 4. Create directory structure
-            print("\n📁 Creating directory structure...")
+        memory_current = read("memory.current")
+        if memory_current is None:
+            return None
+        io_read = io_write = 0
+        for line in (read("io.stat") or "").splitlines():
+            for field in line.split()[1:]:
+                key, _, value = field.partition("=")
+                if key == "rbytes":
+                    io_read += int(value)
+                elif key == "wbytes":
+                    io_write += int(value)
+        peak = read("memory.peak")
+        pids = read("pids.current")
+        return {
+            "memory_current": int(memory_current),
+            "memory_peak": int(peak) if peak else None,
+            "cpu_usage_usec": keyed(read("cpu.stat"), "usage_usec"),
+            "cpu_throttled_usec": keyed(read("cpu.stat"), "throttled_usec"),
+            "tasks": int(pids) if pids else None,
+            "io_read_bytes": io_read,
+            "io_write_bytes": io_write,
+            "oom_kills": keyed(read("memory.events"), "oom_kill"),
+            "memory_pressure_avg10": pressure(read("memory.pressure")),
+            "cpu_pressure_avg10": pressure(read("cpu.pressure")),
+        }
+
+    def app_resource_usage(self, site_name, info=None):
+        """An app's limits and the actual usage of its instances, summed"""
+        info = info or self.load_deployment_info(site_name) or {}
+        instances = []
+        totals = {}
+        for instance in self.app_instances(site_name, info):
+            cgroup = self.instance_cgroup(site_name, instance, info)
+            usage = self.read_cgroup_usage(cgroup) if cgroup else None
+            instances.append(
+                {"port": instance["port"], "cgroup": cgroup, "usage": usage}
+            )
+            for key, value in (usage or {}).items():
+                if isinstance(value, int) and not key.endswith("_avg10"):
+                    totals[key] = totals.get(key, 0) + value
+        return {
+            "site_name": site_name,
+            "resources": info.get("resources"),
+            "instances": instances,
+            "totals": totals,
+        }
+
+    def resource_report(self):
+        """Limits and usage of every deployed app, heaviest memory first"""
+        apps_dir = self.deployment_apps_dir()
+        report = []
+        for site_name in (
+            sorted(os.listdir(apps_dir)) if os.path.isdir(apps_dir) else []
+        ):
+            info = self.load_deployment_info(site_name)
+            if info:
+                report.append(self.app_resource_usage(site_name, info))
+        report.sort(key=lambda app: -app["totals"].get("memory_current", 0))
+        return report
+
+    def host_memory_bytes(self):
+        """Memory the apps are placed against: CONFIG host_memory or physical RAM"""
+        if CONFIG["host_memory"]:
+            return self.parse_size(CONFIG["host_memory"])
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+
+    def node_memory_settings(self, site_name, resources, instance_count):
+        """NODE_OPTIONS for one instance from host memory, density and class"""
+        # Every placed instance counts, hibernated ones too: they come back
+        # on the next request without a chance to resize anyone else
+        placed = {site_name: (resources["memory_max"], instance_count)}
+        apps_dir = self.deployment_apps_dir()
+        for name in sorted(os.listdir(apps_dir)) if os.path.isdir(apps_dir) else []:
+            info = self.load_deployment_info(name)
+            if info and name != site_name:
+                limits = info.get("resources") or self.resolve_resources()
+                placed[name] = (
+                    limits["memory_max"],
+                    len(self.app_instances(name, info)),
+                )
 
-            directories = [
-                (CONFIG["web_root"], "www-data", 0o755),
-                (os.path.dirname(CONFIG["database_path"]), "www-data", 0o755),
-                (CONFIG["log_dir"], "www-data", 0o755),
-                ("/tmp/pm2-home", "www-data", 0o755),
-                ("/tmp/nodejs-apps", "www-data", 0o755),
-            ]
+        host_memory = self.host_memory_bytes()
+        usable = host_memory * (1 - CONFIG["host_memory_reserve_ratio"])
+        weight = sum(memory_max * count for memory_max, count in placed.values())
+        share = usable * resources["memory_max"] / max(weight, 1)
+        budget = int(min(share, resources["memory_high"]))
 
-            for directory, owner, mode in directories:
-                if not self.create_directory_with_permissions(directory, owner, mode):
-                    print(f"⚠️  Could not create {directory}")
+        heap_mb = max(
+            CONFIG["node_min_heap_mb"],
+            int(budget * CONFIG["node_heap_ratio"]) // 1048576,
+        )
+        semi_space_mb = min(
+            CONFIG["node_max_semi_space_mb"],
+            1
+            << (max(1, heap_mb // CONFIG["node_semi_space_divisor"]).bit_length() - 1),
+        )
+        return {
+            "node_options": f"--max-old-space-size={heap_mb} --max-semi-space-size={semi_space_mb}",
+            "heap_mb": heap_mb,
+            "semi_space_mb": semi_space_mb,
+            "budget_bytes": budget,
+            "host_memory": host_memory,
+            "placed_apps": len(placed),
+            "placed_instances": sum(count for _, count in placed.values()),
+        }
+
+    def node_env_file(self, site_name):
+        """Environment file with the app's NODE_OPTIONS, read at every start"""
+        return f"{self.deployment_info_dir(site_name)}/node.env"
+
+    def write_node_env(self, site_name, node_memory):
+        """Write (or, for None, remove) the app's NODE_OPTIONS file"""
+        env_file = self.node_env_file(site_name)
+        if not node_memory:
+            if os.path.exists(env_file):
+                os.remove(env_file)
+            return
+        os.makedirs(os.path.dirname(env_file), mode=0o755, exist_ok=True)
+        with open(f"{env_file}.tmp", "w") as f:
+            f.write(f"NODE_OPTIONS={node_memory['node_options']}\n")
+        os.replace(f"{env_file}.tmp", env_file)
+
+    def read_node_env(self, site_name):
+        """The app's node.env as a dict, for the supervisor"""
+        env = {}
+        try:
+            with open(self.node_env_file(site_name), "r") as f:
+                for line in f:
+                    if "=" in line:
+                        key, value = line.rstrip("\n").split("=", 1)
+                        env[key] = value
+        except OSError:
+            pass
+        return env
 
-            # 5. Setup nginx permissions (only if not read-only)
-            if not self.readonly_filesystem:
-                print("\n🔐 Setting up nginx permissions...")
+    def instance_pids(self, site_name, instance, info):
+        """Every process of a running instance, or None if it can't be read"""
+        if info.get("process_manager") == "readonly-simple" or self.readonly_filesystem:
+            response = self.supervisor_request(
+                {"action": "status", "site_name": site_name, "port": instance["port"]}
+            )
+            program = (response.get("programs") or [{}])[0]
+            cgroup, pgid = program.get("cgroup"), program.get("pid")
+        else:
+            cgroup, pgid = self.instance_cgroup(site_name, instance, info), None
 
-                os.makedirs("/etc/nginx/sites-available", exist_ok=True)
-                os.makedirs("/etc/nginx/sites-enabled", exist_ok=True)
+        if cgroup:
+            try:
+                with open(f"{cgroup}/cgroup.procs", "r") as f:
+                    return [int(pid) for pid in f.read().split()]
+            except OSError:
+                pass
+        if not pgid:
+            return None
+        # No cgroup: the supervisor starts each program in its own process group
+        pids = []
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat", "r") as f:
+                    # Fields after the parenthesised command: state, ppid, pgrp
+                    fields = f.read().rsplit(")", 1)[1].split()
+            except (OSError, IndexError):
+                continue
+            if int(fields[2]) == pgid:
+                pids.append(int(entry))
+        return pids
+
+    @staticmethod
+    def process_memory(pid):
+        """Rss and Pss of one process in bytes, from /proc/<pid>/smaps_rollup"""
+        memory = {"rss": 0, "pss": 0}
+        try:
+            with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+                for line in f:
+                    key, _, value = line.partition(":")
+                    if key in ("Rss", "Pss"):
+                        memory[key.lower()] = int(value.split()[0]) * 1024
+        except (OSError, ValueError):
+            pass
+        return memory
+
+    def node_memory_report(self):
+        """Applied heap settings, the current ideal and measured RSS per app"""
+        report = []
+        apps_dir = self.deployment_apps_dir()
+        for site_name in (
+            sorted(os.listdir(apps_dir)) if os.path.isdir(apps_dir) else []
+        ):
+            info = self.load_deployment_info(site_name)
+            if not info:
+                continue
+            instances = self.app_instances(site_name, info)
+            applied = info.get("node_memory")
+            ideal = self.node_memory_settings(
+                site_name,
+                info.get("resources") or self.resolve_resources(),
+                len(instances),
+            )
+            measured = []
+            if not info.get("hibernated_at"):
+                for instance in instances:
+                    pids = self.instance_pids(site_name, instance, info)
+                    if pids is None:
+                        measured.append(
+                            {
+                                "port": instance["port"],
+                                "pids": None,
+                                "rss": None,
+                                "pss": None,
+                                "budget_used": None,
+                            }
+                        )
+                        continue
+                    memory = [self.process_memory(pid) for pid in pids]
+                    rss = sum(m["rss"] for m in memory)
+                    measured.append(
+                        {
+                            "port": instance["port"],
+                            "pids": pids,
+                            "rss": rss,
+                            "pss": sum(m["pss"] for m in memory),
+                            "budget_used": (
+                                round(rss / applied["budget_bytes"], 3)
+                                if applied
+                                else None
+                            ),
+                        }
+                    )
+            report.append(
+                {
+                    "site_name": site_name,
+                    "applied": applied,
+                    "ideal": ideal,
+                    "stale": self.node_memory_stale(applied, ideal),
+                    "instances": measured,
+                    "over_budget": any((m["budget_used"] or 0) > 1 for m in measured),
+                    "unmeasured": [m["port"] for m in measured if m["pids"] is None],
+                }
+            )
+        return report
 
-                if self.is_root:
-                    uid, gid = self.get_user_info("www-data")
-                    try:
-                        os.chown("/etc/nginx/sites-available", uid, gid)
-                        os.chown("/etc/nginx/sites-enabled", uid, gid)
-                        os.chmod("/etc/nginx/sites-available", 0o755)
-                        os.chmod("/etc/nginx/sites-enabled", 0o755)
-                        print("   ✅ Nginx directories owned by www-data")
-                    except:
-                        print("   ⚠️  Could not set nginx directory ownership")
+    @staticmethod
+    def node_memory_stale(applied, ideal):
+        """Whether an app's running heap size is far enough off to restart it"""
+        if not applied:
+            return True
+        drift = abs(applied["heap_mb"] - ideal["heap_mb"]) / ideal["heap_mb"]
+        return drift > CONFIG["node_retune_threshold"]
+
+    def retune_apps(self, site_name=None):
+        """Rolling-restart apps whose heap no longer fits the host's density"""
+        retuned = []
+        for app in self.node_memory_report():
+            if not app["stale"] or site_name not in (None, app["site_name"]):
+                continue
+            with self.app_lock(app["site_name"]):
+                info = self.load_deployment_info(app["site_name"])
+                if not info:
+                    continue  # Removed since the density scan
+                parked = info.get("hibernated_at") or info.get("quarantine")
+                if parked:
+                    # Not running: the next wake or start reads the new file
+                    info["node_memory"] = app["ideal"]
+                    self.write_node_env(app["site_name"], app["ideal"])
+                    self.save_deployment_info(app["site_name"], info)
+            if parked:
+                retuned.append(app["site_name"])
+                continue
+            if app["unmeasured"]:
+                # No cgroup to read: don't restart an instance we can't see
+                print(
+                    f"   ⚠️  Skipping {app['site_name']}: no usage for port(s) {', '.join(map(str, app['unmeasured']))}"
+                )
+                continue
+            with self.app_lock(app["site_name"]):
+                if self.restart_app_rolling(app["site_name"]):
+                    retuned.append(app["site_name"])
+        return retuned
+
+    def stop_app_instance(self, site_name, instance, process_manager):
+        """Stop one instance for good, drop its port link and free its port"""
+        if process_manager == "readonly-simple" or self.readonly_filesystem:
+            stopped = self.readonly_instance_control(site_name, instance, "stop")
+            if not instance.get("legacy"):
+                control_script = (
+                    f"/tmp/nodejs-apps/{site_name}/control-{instance['port']}.sh"
+                )
+                if os.path.exists(control_script):
+                    os.remove(control_script)
+            self.release_ports(site_name, [instance["port"]])
+            return stopped
+
+        unit = self.systemd_instance_unit(site_name, instance)
+        result = subprocess.run(
+            ["systemctl", "disable", "--now", unit], capture_output=True, text=True
+        )
+        if instance.get("legacy"):
+            legacy_file = f"/etc/systemd/system/{unit}.service"
+            if os.path.exists(legacy_file):
+                os.remove(legacy_file)
+                subprocess.run(["systemctl", "daemon-reload"], capture_output=True)
+        else:
+            link = f"{self.deployment_info_dir(site_name)}/instances/{instance['port']}"
+            if os.path.islink(link):
+                os.remove(link)
+        self.release_ports(site_name, [instance["port"]])
+        return result.returncode == 0
+
+    def remove_app(self, site_name):
+        """Stop every instance of an app, drop its units and reclaim its ports"""
+        info = self.load_deployment_info(site_name)
+        if not info:
+            return False
 
-                # Setup sudo permissions
-                print("\n🔧 Setting up sudo permissions...")
+        process_manager = info.get("process_manager")
+        for instance in self.app_instances(site_name, info):
+            self.stop_app_instance(site_name, instance, process_manager)
+        for instance in info.get("draining", []):
+            self.stop_app_instance(site_name, instance, instance.get("process_manager"))
+        print(f"   ✅ Stopped {site_name} and freed its ports")
+
+        if not self.readonly_filesystem:
+            unit_file = f"/etc/systemd/system/nodejs-{site_name}@.service"
+            if os.path.exists(unit_file):
+                os.remove(unit_file)
+                subprocess.run(["systemctl", "daemon-reload"], capture_output=True)
+                print(f"   ✅ Removed systemd service file: {unit_file}")
+
+        shutil.rmtree(self.deployment_info_dir(site_name), ignore_errors=True)
+        return True
+
+    def port_is_free(self, port):
+        """True if nothing is listening on the port (test bind on loopback)"""
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            # Like Node, ignore TIME_WAIT leftovers; only a live listener counts
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            try:
+                sock.bind(("127.0.0.1", port))
+                return True
+            except OSError:
+                return False
 
-                sudoers_content = """# Simple Hosting API - Read-only filesystem safe
-www-data ALL=(ALL) NOPASSWD: /usr/sbin/nginx -t
-www-data ALL=(ALL) NOPASSWD: /usr/sbin/nginx -t -p /tmp
-www-data ALL=(ALL) NOPASSWD: /usr/bin/nginx -t
-www-data ALL=(ALL) NOPASSWD: /usr/bin/nginx -t -p /tmp
-www-data ALL=(ALL) NOPASSWD: /bin/systemctl reload nginx
-www-data ALL=(ALL) NOPASSWD: /bin/systemctl restart nginx
-www-data ALL=(ALL) NOPASSWD: /bin/systemctl start nginx
-www-data ALL=(ALL) NOPASSWD: /bin/systemctl stop nginx
-www-data ALL=(ALL) NOPASSWD: /usr/sbin/certbot*
-www-data ALL=(ALL) NOPASSWD: /bin/ln -s /etc/nginx/sites-available/* /etc/nginx/sites-enabled/*
-www-data ALL=(ALL) NOPASSWD: /bin/rm /etc/nginx/sites-enabled/*
-www-data ALL=(ALL) NOPASSWD: /usr/bin/npm *
-www-data ALL=(ALL) NOPASSWD: /bin/systemctl * nodejs-*
-"""
+    def ensure_port_pool(self, conn):
+        """Seed the configured port range and reconcile it with deployed apps"""
+        if self.port_pool_ready:
+            return
+        start, end = CONFIG["app_port_range"]
+        conn.executemany(
+            "INSERT OR IGNORE INTO port_allocations (port) VALUES (?)",
+            ((port,) for port in range(start, end + 1)),
+        )
 
-                try:
-                    sudoers_file = "/etc/sudoers.d/hosting-api"
-                    with open(sudoers_file, "w") as f:
-                        f.write(sudoers_content)
-                    os.chmod(sudoers_file, 0o440)
+        # Ports seen in use by something else get another chance, and every
+        # instance recorded on disk keeps its port
+        conn.execute(
+            "UPDATE port_allocations SET site_name = NULL, state = 'free' WHERE state = 'external'"
+        )
+        apps_dir = self.deployment_apps_dir()
+        if os.path.isdir(apps_dir):
+            for site_name in os.listdir(apps_dir):
+                info = self.load_deployment_info(site_name)
+                if not info:
+                    continue
+                instances = self.app_instances(site_name, info)
+                instances += info.get("draining", [])
+                conn.executemany(
+                    """
+                    INSERT INTO port_allocations (port, site_name, state)
+                    VALUES (?, ?, 'reserved')
+                    ON CONFLICT(port) DO UPDATE SET site_name = excluded.site_name,
+                        state = 'reserved', updated_at = CURRENT_TIMESTAMP
+                """,
+                    [(instance["port"], site_name) for instance in instances],
+                )
+        conn.commit()
+        self.port_pool_ready = True
 
-                    result = subprocess.run(
-                        ["visudo", "-c"], capture_output=True, text=True
+    def allocate_ports(self, site_name, count, requested_port=None, exclude=()):
+        """Reserve ports for a site; a free requested port is honoured first"""
+        conn = self.get_database_connection()
+        if not conn:
+            raise RuntimeError("Database unavailable - cannot allocate ports")
+
+        ports = []
+        try:
+            self.ensure_port_pool(conn)
+            conn.isolation_level = None  # Explicit transactions below
+
+            while len(ports) < count:
+                # BEGIN IMMEDIATE takes the write lock up front, so two deploys
+                # can never pick the same free port
+                conn.execute("BEGIN IMMEDIATE")
+                port = None
+                if requested_port and requested_port not in exclude:
+                    row = conn.execute(
+                        "SELECT site_name FROM port_allocations WHERE port = ?",
+                        (requested_port,),
+                    ).fetchone()
+                    if row is None or row[0] is None:
+                        port = requested_port
+                    requested_port = None  # Only ever tried for the first instance
+
+                if port is None:
+                    # Lowest free port via the partial index over free rows
+                    row = conn.execute(
+                        "SELECT port FROM port_allocations WHERE site_name IS NULL ORDER BY port LIMIT 1"
+                    ).fetchone()
+                    if row is None:
+                        conn.execute("ROLLBACK")
+                        raise RuntimeError("App port pool exhausted")
+                    port = row[0]
+
+                conn.execute(
+                    """
+                    INSERT INTO port_allocations (port, site_name, state)
+                    VALUES (?, ?, 'reserved')
+                    ON CONFLICT(port) DO UPDATE SET site_name = excluded.site_name,
+                        state = 'reserved', updated_at = CURRENT_TIMESTAMP
+                """,
+                    (port, site_name),
+                )
+                conn.execute("COMMIT")
+
+                # Something outside our bookkeeping may already be listening
+                if not self.port_is_free(port):
+                    conn.execute(
+                        "UPDATE port_allocations SET site_name = '', state = 'external' WHERE port = ?",
+                        (port,),
                     )
-                    if result.returncode != 0:
-                        print("❌ Sudoers syntax error")
-                        os.remove(sudoers_file)
-                        return False
+                    print(
+                        f"   ⚠️  Port {port} is in use outside the allocator - skipped"
+                    )
+                    continue
+                ports.append(port)
+            return ports
+        except Exception:
+            if ports:
+                self.release_ports(site_name, ports)
+            raise
+        finally:
+            conn.close()
 
-                    print("   ✅ Sudo permissions configured")
-                except:
-                    print("   ⚠️  Could not set sudo permissions")
+    def release_ports(self, site_name, ports):
+        """Return a site's ports to the free list (ports outside the pool are dropped)"""
+        conn = self.get_database_connection()
+        if not conn:
+            return
+        start, end = CONFIG["app_port_range"]
+        for port in ports:
+            if start <= port <= end:
+                conn.execute(
+                    """
+                    UPDATE port_allocations
+                    SET site_name = NULL, state = 'free', updated_at = CURRENT_TIMESTAMP
+                    WHERE port = ? AND site_name = ?
+                """,
+                    (port, site_name),
+                )
             else:
-                print("\n⚠️  Read-only filesystem - skipping nginx permission setup")
-
-            # 6. Setup database
-            print("\n💾 Setting up database...")
-            if not self.setup_database():
-                return False
-            print("✅ Database ready")
+                conn.execute(
+                    "DELETE FROM port_allocations WHERE port = ? AND site_name = ?",
+                    (port, site_name),
+                )
+        conn.commit()
+        conn.close()
+
+    def default_instance_count(self, site_name):
+        """Share the CPUs between the deployed apps, capped per site"""
+        if CONFIG["default_instances"]:
+            return CONFIG["default_instances"]
+
+        apps_dir = self.deployment_apps_dir()
+        apps = {site_name}
+        if os.path.isdir(apps_dir):
+            apps |= {
+                name
+                for name in os.listdir(apps_dir)
+                if os.path.exists(f"{apps_dir}/{name}/deployment.json")
+            }
+        cpus = os.cpu_count() or 1
+        return max(1, min(CONFIG["max_instances_per_site"], cpus // len(apps)))
+
+    def release_app(
+        self,
+        site_name,
+        release_dir,
+        requested_port,
+        readiness_path=None,
+        readiness_timeout=None,
+        instances=None,
+        hibernate_after=None,
+        resources=None,
+    ):
+        """Blue/green: start a release beside the live one, switch nginx, drain old"""
+        info = self.load_deployment_info(site_name) or {}
+        self.reap_drained_instances(site_name, info)
+        # Without deployConfig.resources a redeploy keeps the app's limits
+        if resources is not None or not info.get("resources"):
+            resources = self.resolve_resources(resources)
+        else:
+            resources = info["resources"]
+
+        old_instances = self.app_instances(site_name, info)
+        old_process_manager = info.get("process_manager")
+        live_ports = {instance["port"] for instance in old_instances}
+        # deployConfig.instances: a positive number, or "auto"/absent for the default
+        if isinstance(instances, int) and instances > 0:
+            count = instances
+        else:
+            count = self.default_instance_count(site_name)
+        ports = self.allocate_ports(site_name, count, requested_port, live_ports)
+        process_manager = "readonly-simple" if self.readonly_filesystem else "systemd"
+        # Old instances only read node.env when they start, so it can be
+        # rewritten while they keep serving
+        node_memory = self.node_memory_settings(site_name, resources, count)
+        self.write_node_env(site_name, node_memory)
+        print(f"   🧠 NODE_OPTIONS={node_memory['node_options']}")
+
+        print(
+            f"🟢 Starting release {os.path.basename(release_dir)} x{count} on ports {ports}"
+        )
+        if old_instances:
+            print(f"   🔵 Live instance(s) keep serving on {sorted(live_ports)}")
+
+        new_instances = [{"port": port, "release": release_dir} for port in ports]
+        with ThreadPoolExecutor(max_workers=count) as pool:
+            ready = list(
+                pool.map(
+                    lambda port: self.start_app_instance(
+                        site_name,
+                        release_dir,
+                        port,
+                        readiness_path,
+                        readiness_timeout,
+                        resources,
+                    ),
+                    ports,
+                )
+            )
+
+        if not all(ready):
+            print("   ❌ New release never became ready - live release untouched")
+            for instance in new_instances:
+                self.stop_app_instance(site_name, instance, process_manager)
+            self.write_node_env(site_name, info.get("node_memory"))
+            return None
+
+        # The reload is graceful: old workers finish in-flight requests against
+        # the old ports while new connections go to the new release
+        if (
+            not self.setup_nginx_proxy(site_name, ports, release_dir)
+            and not self.readonly_filesystem
+        ):
+            print("   ❌ nginx switch failed - keeping the live release")
+            for instance in new_instances:
+                self.stop_app_instance(site_name, instance, process_manager)
+            self.write_node_env(site_name, info.get("node_memory"))
+            return None
+
+        drain_at = time.time() + CONFIG["release_drain_seconds"]
+        draining = info.get("draining", [])
+        draining += [
+            {**instance, "process_manager": old_process_manager, "stop_after": drain_at}
+            for instance in old_instances
+        ]
+
+        info.update(
+            {
+                "site_name": site_name,
+                "port": ports[0],
+                "cwd": release_dir,
+                "process_manager": process_manager,
+                "instance_count": count,
+                "instances": new_instances,
+                "draining": draining,
+                "readiness_path": readiness_path or CONFIG["readiness_path"],
+                "readiness_timeout": readiness_timeout,
+                "resources": resources,
+                "node_memory": node_memory,
+                "released_at": datetime.now().isoformat(),
+                "readonly_mode": self.readonly_filesystem,
+            }
+        )
+        info.setdefault("created_at", info["released_at"])
+        info.pop("hibernated_at", None)  # The new release is running
+        info.pop("quarantine", None)  # New code gets a fresh restart budget
+        self.reset_restart_counters(site_name, ports)
+        if hibernate_after is not None:
+            info["hibernate_after"] = hibernate_after
+        self.save_deployment_info(site_name, info)
+
+        if draining:
+            print(
+                f"   ⏳ Draining {len(draining)} old instance(s) for {CONFIG['release_drain_seconds']}s"
+            )
+            self.schedule_drain_reap(site_name)
+
+        print(f"✅ Release live on port(s) {ports}")
+        return info
+
+    def restart_app_rolling(self, site_name):
+        """Restart an app's instances one at a time, each gated on readiness
+
+        Callers hold the app lock: this rewrites deployment.json.
+        """
+        info = self.load_deployment_info(site_name)
+        if not info:
+            print(f"❌ No deployment found for {site_name}")
+            return False
+        if info.get("hibernated_at") or info.get("quarantine"):
+            # Starting it here would leave hibernated_at/quarantine stale
+            print(f"❌ {site_name} is hibernated or quarantined - wake or start it")
+            return False
+
+        instances = self.app_instances(site_name, info)
+        print(f"🔄 Rolling restart of {site_name} ({len(instances)} instance(s))")
+
+        # Density may have changed since the last start: resize the heap
+        info["node_memory"] = self.node_memory_settings(
+            site_name,
+            info.get("resources") or self.resolve_resources(),
+            len(instances),
+        )
+        self.write_node_env(site_name, info["node_memory"])
+        self.save_deployment_info(site_name, info)
+        print(f"   🧠 NODE_OPTIONS={info['node_memory']['node_options']}")
+
+        # A lone instance has nobody to take over: start a temporary one
+        surge = None
+        if len(instances) == 1:
+            surge = self.start_surge_instance(site_name, instances[0], info)
+            if not surge:
+                print("   ⚠️  No temporary instance - restarting the only one in place")
+
+        # nginx retries the next upstream server on connection errors, so the
+        # others absorb traffic while one instance restarts
+        for instance in instances:
+            if not self.bring_up_instance(site_name, instance, info, restart=True):
+                print(f"   ❌ Instance on port {instance['port']} did not come back")
+                if surge:
+                    # Keep the temporary instance serving instead of going dark
+                    info["instances"].append(surge)
+                    self.save_deployment_info(site_name, info)
+                    print(f"   🟡 Port {surge['port']} stays live in its place")
+                return False
+
+        if surge:
+            self.retire_surge_instance(site_name, info, instances[0], surge)
+        elif len(instances) == 1:
+            print(f"✅ {site_name} restarted in place")
+            return True
+        print(f"✅ {site_name} restarted without downtime")
+        return True
+
+    def start_surge_instance(self, site_name, instance, info):
+        """Serve a single-instance app from a temporary second instance too"""
+        release_dir = instance.get("release") or info.get("cwd")
+        if instance.get("legacy") or not release_dir:
+            return None
+        try:
+            port = self.allocate_ports(site_name, 1, exclude={instance["port"]})[0]
+        except RuntimeError as e:
+            print(f"   ⚠️  {e}")
+            return None
+        surge = {"port": port, "release": release_dir}
+        print(f"   ➕ Temporary instance on port {port} covers the restart")
+        ready = self.start_app_instance(
+            site_name,
+            release_dir,
+            port,
+            info.get("readiness_path"),
+            info.get("readiness_timeout"),
+            info.get("resources"),
+        )
+        if ready and (
+            self.setup_nginx_proxy(site_name, [instance["port"], port], release_dir)
+            or self.readonly_filesystem
+        ):
+            return surge
+        self.stop_app_instance(site_name, surge, info.get("process_manager"))
+        return None
+
+    def retire_surge_instance(self, site_name, info, instance, surge):
+        """Take the temporary instance out of nginx and let it drain"""
+        release_dir = instance.get("release") or info.get("cwd")
+        self.setup_nginx_proxy(site_name, [instance["port"]], release_dir)
+        info.setdefault("draining", []).append(
+            {
+                **surge,
+                "process_manager": info.get("process_manager"),
+                "stop_after": time.time() + CONFIG["release_drain_seconds"],
+            }
+        )
+        self.save_deployment_info(site_name, info)
+        self.schedule_drain_reap(site_name)
+
+    def bring_up_instance(self, site_name, instance, info, restart=False):
+        """(Re)start one recorded instance and wait until it is serving"""
+        readonly = (
+            info.get("process_manager") == "readonly-simple" or self.readonly_filesystem
+        )
+        if readonly:
+            self.readonly_instance_control(
+                site_name, instance, "start", info.get("resources")
+            )
+            is_alive = lambda: self.readonly_instance_control(
+                site_name, instance, "status"
+            )
+        else:
+            unit = self.systemd_instance_unit(site_name, instance)
+            action = "restart" if restart else "start"
+            subprocess.run(["systemctl", action, unit], capture_output=True)
+            is_alive = lambda: self.systemd_unit_alive(unit)
+
+        return self.wait_for_app_ready(
+            instance["port"],
+            info.get("readiness_path"),
+            info.get("readiness_timeout"),
+            is_alive=is_alive,
+        )
+
+    def halt_instances(self, site_name, info):
+        """Stop every instance but keep ports, links and the nginx upstream"""
+        readonly = (
+            info.get("process_manager") == "readonly-simple" or self.readonly_filesystem
+        )
+        for instance in self.app_instances(site_name, info):
+            if readonly:
+                self.readonly_instance_control(site_name, instance, "stop")
+            else:
+                # Disabled too, so a reboot does not bring it back on its own
+                unit = self.systemd_instance_unit(site_name, instance)
+                subprocess.run(
+                    ["systemctl", "disable", "--now", unit], capture_output=True
+                )
+        self.reset_restart_counters(site_name)
+
+    def resume_instances(self, site_name, info):
+        """Start every halted instance in parallel; True once all are serving"""
+        instances = self.app_instances(site_name, info)
+        if info.get("process_manager") == "systemd" and not self.readonly_filesystem:
+            units = [
+                self.systemd_instance_unit(site_name, instance)
+                for instance in instances
+            ]
+            subprocess.run(["systemctl", "enable", *units], capture_output=True)
+        self.reset_restart_counters(site_name, [i["port"] for i in instances])
+        with ThreadPoolExecutor(max_workers=max(1, len(instances))) as pool:
+            return all(
+                pool.map(
+                    lambda instance: self.bring_up_instance(site_name, instance, info),
+                    instances,
+                )
+            )
+
+    def app_lock(self, site_name):
+        """The lock serializing lifecycle changes (release/hibernate/wake) of one app"""
+        with self.app_locks_guard:
+            return self.app_locks.setdefault(site_name, threading.Lock())
+
+    def wait_for_deploy_slot(self, site_name, job_id):
+        """Wait until no other deploy of the site runs; latest pending one wins
+
+        Returns None once this deploy may run, or the id of the newer deploy
+        that replaced it while it was waiting.
+        """
+        with self.deploy_slots_condition:
+            slot = self.deploy_slots.setdefault(
+                site_name, {"running": None, "pending": None}
+            )
+            if slot["running"] is None:
+                slot["running"] = job_id
+                return None
+            # Any deploy already waiting is stale now: it never gets to build
+            slot["pending"] = job_id
+            self.deploy_slots_condition.notify_all()
+            # release_deploy_slot hands the slot over, so no newcomer can slip
+            # in between the release and this thread waking up
+            while slot["running"] != job_id and slot["pending"] == job_id:
+                self.deploy_slots_condition.wait()
+            if slot["running"] == job_id:
+                return None
+            return slot["pending"] or slot["running"]
+
+    def release_deploy_slot(self, site_name, job_id):
+        """Hand the site's slot to its pending deploy, or free it"""
+        with self.deploy_slots_condition:
+            slot = self.deploy_slots.get(site_name)
+            if not slot or slot["running"] != job_id:
+                return
+            if slot["pending"] is None:
+                del self.deploy_slots[site_name]
+            else:
+                slot.update(running=slot["pending"], pending=None)
+            self.deploy_slots_condition.notify_all()
+
+    def cancel_pending_deploy(self, site_name, job_id):
+        """Withdraw a deploy still waiting for its site; True if it was waiting"""
+        with self.deploy_slots_condition:
+            slot = self.deploy_slots.get(site_name)
+            if not slot or slot["pending"] != job_id:
+                return False
+            slot["pending"] = None
+            self.deploy_slots_condition.notify_all()
+            return True
+
+    def deploy_waiting_behind(self, site_name, job_id):
+        """The deploy a pending deploy of the same site is waiting for"""
+        with self.deploy_slots_condition:
+            slot = self.deploy_slots.get(site_name) or {}
+            return slot.get("running") if slot.get("pending") == job_id else None
+
+    def app_access_log(self, site_name):
+        """The per-app nginx access log whose mtime marks the last request"""
+        return f"{CONFIG['app_access_log_dir']}/{site_name}.log"
+
+    def app_last_request(self, site_name, info):
+        """Unix time of an app's last request, or of its last start if later"""
+        times = [info.get("woken_at") or 0]
+        if info.get("released_at"):
+            times.append(datetime.fromisoformat(info["released_at"]).timestamp())
+        try:
+            times.append(os.stat(self.app_access_log(site_name)).st_mtime)
+        except OSError:
+            pass
+        return max(times)
+
+    def trim_app_access_log(self, site_name):
+        """Truncate an oversized app access log without losing its mtime"""
+        log_path = self.app_access_log(site_name)
+        try:
+            stat = os.stat(log_path)
+            if stat.st_size > CONFIG["app_access_log_max_bytes"]:
+                # nginx appends with O_APPEND, so truncating in place is safe
+                os.truncate(log_path, 0)
+                os.utime(log_path, (stat.st_atime, stat.st_mtime))
+        except OSError:
+            pass
+
+    def hibernate_app(self, site_name):
+        """Stop an idle app's instances; ports and nginx upstream stay in place"""
+        with self.app_lock(site_name):
+            info = self.load_deployment_info(site_name)
+            if not info or info.get("hibernated_at"):
+                return False
+
+            self.halt_instances(site_name, info)
+            info["hibernated_at"] = time.time()
+            self.save_deployment_info(site_name, info)
+
+        print(f"   💤 Hibernated {site_name} - next request wakes it")
+        return True
+
+    def wake_app(self, site_name):
+        """Start a hibernated app, wait for readiness and record the cold start"""
+        with self.app_lock(site_name):
+            info = self.load_deployment_info(site_name)
+            if not info:
+                return None
+            instances = self.app_instances(site_name, info)
+            ports = [instance["port"] for instance in instances]
+            if not info.get("hibernated_at"):
+                # Awake already - woken by a concurrent request, or never slept
+                return {
+                    "woken": False,
+                    "ready": True,
+                    "cold_start": 0.0,
+                    "ports": ports,
+                }
+
+            print(f"⏰ Waking {site_name} on port(s) {ports}")
+            started = time.monotonic()
+            ready = self.resume_instances(site_name, info)
+            cold_start = time.monotonic() - started
+            self.record_wake(site_name, cold_start, ready)
+
+            if ready:
+                info.pop("hibernated_at")
+                info["woken_at"] = time.time()
+                self.save_deployment_info(site_name, info)
+
+        if ready:
+            print(f"   ✅ {site_name} awake after {cold_start:.2f}s cold start")
+        else:
+            print(f"   ❌ {site_name} did not become ready within its timeout")
+        return {"woken": True, "ready": ready, "cold_start": cold_start, "ports": ports}
+
+    def record_wake(self, site_name, cold_start, ready):
+        """Keep a wake's cold start latency for the hibernation report"""
+        conn = self.get_database_connection()
+        if not conn:
+            return
+        conn.execute(
+            "INSERT INTO app_wakes (site_name, cold_start_ms, ready) VALUES (?, ?, ?)",
+            (site_name, int(cold_start * 1000), ready),
+        )
+        conn.commit()
+        conn.close()
+
+    def hibernate_after(self, info):
+        """Idle seconds before an app hibernates (0 = never)"""
+        return info.get("hibernate_after", CONFIG["hibernate_after_seconds"]) or 0
+
+    def run_hibernation_pass(self):
+        """Hibernate every app idle past its threshold"""
+        summary = {"checked": 0, "hibernated": []}
+        apps_dir = self.deployment_apps_dir()
+        if not os.path.isdir(apps_dir):
+            return summary
+
+        for site_name in sorted(os.listdir(apps_dir)):
+            info = self.load_deployment_info(site_name)
+            # Apps mid-release keep running until their old instances drained
+            if (
+                not info
+                or info.get("hibernated_at")
+                or info.get("draining")
+                or info.get("quarantine")
+            ):
+                continue
+            hibernate_after = self.hibernate_after(info)
+            if not hibernate_after:
+                continue
+
+            summary["checked"] += 1
+            self.trim_app_access_log(site_name)
+            idle = time.time() - self.app_last_request(site_name, info)
+            if idle >= hibernate_after and self.hibernate_app(site_name):
+                summary["hibernated"].append(site_name)
+
+        if summary["hibernated"]:
+            print(
+                f"💤 Hibernated {len(summary['hibernated'])} of {summary['checked']} app(s)"
+            )
+        return summary
+
+    def start_hibernation_scheduler(self):
+        """Run hibernation passes in a daemon thread until hibernation_stop is set"""
+
+        def loop():
+            while not self.hibernation_stop.wait(CONFIG["hibernate_check_interval"]):
+                try:
+                    self.run_hibernation_pass()
+                except Exception as e:
+                    print(f"⚠️  Hibernation pass failed: {e}")
+
+        thread = threading.Thread(target=loop, name="app-hibernation", daemon=True)
+        thread.start()
+        return thread
+
+    def hibernation_report(self):
+        """Per-app hibernation state, idle time and cold start latency"""
+        cold_starts = {}
+        conn = self.get_database_connection()
+        if conn:
+            rows = conn.execute(
+                """
+                SELECT site_name, cold_start_ms FROM app_wakes
+                WHERE ready = 1 AND created_at >= datetime('now', '-7 days')
+                ORDER BY site_name, cold_start_ms
+            """
+            ).fetchall()
+            conn.close()
+            for site_name, cold_start_ms in rows:
+                cold_starts.setdefault(site_name, []).append(cold_start_ms)
+
+        report = []
+        apps_dir = self.deployment_apps_dir()
+        for site_name in (
+            sorted(os.listdir(apps_dir)) if os.path.isdir(apps_dir) else []
+        ):
+            info = self.load_deployment_info(site_name)
+            if not info:
+                continue
+            samples = cold_starts.get(site_name, [])
+            report.append(
+                {
+                    "site_name": site_name,
+                    "state": "hibernated" if info.get("hibernated_at") else "awake",
+                    "idle_seconds": int(
+                        time.time() - self.app_last_request(site_name, info)
+                    ),
+                    "hibernate_after": self.hibernate_after(info),
+                    "wakes_7d": len(samples),
+                    "cold_start_p50_ms": (
+                        samples[len(samples) // 2] if samples else None
+                    ),
+                    "cold_start_p95_ms": (
+                        samples[int(len(samples) * 0.95)] if samples else None
+                    ),
+                }
+            )
+        return report
+
+    def reset_restart_counters(self, site_name, ports=()):
+        """Restart baselines after a manual start: both process managers count from 0"""
+        for key in [key for key in self.restart_counters if key[0] == site_name]:
+            self.restart_counters.pop(key, None)
+        for port in ports:
+            self.restart_counters[(site_name, port)] = 0
+
+    def instance_restart_stats(self, site_name, info):
+        """Automatic restart count, last exit code and give-up state per port"""
+        stats = {}
+        if info.get("process_manager") == "readonly-simple" or self.readonly_filesystem:
+            response = self.supervisor_request(
+                {"action": "status", "site_name": site_name}
+            )
+            for program in response.get("programs", []):
+                last_exit = program.get("last_exit") or {}
+                stats[program["port"]] = {
+                    "restarts": program["restarts"],
+                    "exit_code": last_exit.get("code"),
+                    "gave_up": False,
+                }
+            return stats
+
+        units = {
+            f"{self.systemd_instance_unit(site_name, instance)}.service": instance[
+                "port"
+            ]
+            for instance in self.app_instances(site_name, info)
+        }
+        if not units:
+            return stats
+        result = subprocess.run(
+            ["systemctl", "show"]
+            + ["-p", "Id", "-p", "NRestarts", "-p", "ExecMainStatus"]
+            + ["-p", "ActiveState", "-p", "Result"]
+            + list(units),
+            capture_output=True,
+            text=True,
+        )
+        for block in result.stdout.strip().split("\n\n"):
+            props = dict(
+                line.split("=", 1) for line in block.splitlines() if "=" in line
+            )
+            port = units.get(props.get("Id"))
+            if port is not None:
+                stats[port] = {
+                    "restarts": int(props.get("NRestarts") or 0),
+                    "exit_code": int(props.get("ExecMainStatus") or 0),
+                    # Units written before StartLimitIntervalSec=0 stop restarting
+                    "gave_up": props.get("ActiveState") == "failed"
+                    and props.get("Result") == "start-limit-hit",
+                }
+        return stats
+
+    def app_crash_reason(self, site_name, info, port):
+        """The last log lines of a crashing instance and the one that explains it"""
+        if info.get("process_manager") == "readonly-simple" or self.readonly_filesystem:
+            response = self.supervisor_request(
+                {
+                    "action": "logs",
+                    "site_name": site_name,
+                    "port": port,
+                    "lines": CONFIG["crash_log_lines"] * 2,
+                    "log_file": f"/tmp/nodejs-apps/{site_name}/{site_name}-{port}.log",
+                }
+            )
+            lines = response.get("lines", [])
+        else:
+            unit = self.systemd_instance_unit(
+                site_name, {"port": port, "legacy": info.get("instances") is None}
+            )
+            result = subprocess.run(
+                [
+                    "journalctl",
+                    "-u",
+                    unit,
+                    "-n",
+                    str(CONFIG["crash_log_lines"] * 2),
+                    "--no-pager",
+                    "-o",
+                    "cat",
+                ],
+                capture_output=True,
+                text=True,
+            )
+            lines = result.stdout.splitlines()
+
+        lines = [
+            line.rstrip()
+            for line in lines
+            if line.strip() and not line.startswith("[supervisor")
+        ][-CONFIG["crash_log_lines"] :]
+        reason = next(
+            (line for line in reversed(lines) if self.CRASH_LINE_PATTERN.search(line)),
+            lines[-1] if lines else "exited without output",
+        )
+        return reason.strip()[:500], lines
+
+    def record_restarts(self, site_name, restarts, reason, lines):
+        """Store new restart events: (port, count, exit code) tuples"""
+        conn = self.get_database_connection()
+        if not conn:
+            return
+        conn.executemany(
+            """
+            INSERT INTO app_restart_events (site_name, port, restarts, exit_code, reason, log_tail)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """,
+            [
+                (site_name, port, count, exit_code, reason, "\n".join(lines))
+                for port, count, exit_code in restarts
+            ],
+        )
+        conn.commit()
+        conn.close()
+
+    def classify_restarts(self, site_name):
+        """healthy, flapping or crash-loop, from restarts inside the window"""
+        conn = self.get_database_connection()
+        if not conn:
+            return "healthy", 0
+        row = conn.execute(
+            """
+            SELECT COALESCE(SUM(restarts), 0) FROM app_restart_events
+            WHERE site_name = ? AND created_at >= datetime('now', ?)
+        """,
+            (site_name, f"-{CONFIG['crash_loop_window']} seconds"),
+        ).fetchone()
+        conn.close()
+        restarts = row[0]
+        if restarts >= CONFIG["crash_loop_threshold"]:
+            return "crash-loop", restarts
+        if restarts:
+            return "flapping", restarts
+        return "healthy", 0
+
+    def quarantine_app(self, site_name, reason):
+        """Stop a crash-looping app for a hold that doubles on every relapse"""
+        with self.app_lock(site_name):
+            info = self.load_deployment_info(site_name)
+            if not info:
+                return False
+            level = (info.get("quarantine") or {}).get("level", 0) + 1
+            hold = min(
+                CONFIG["quarantine_max_seconds"],
+                CONFIG["quarantine_base_seconds"] * 2 ** (level - 1),
+            )
+            self.halt_instances(site_name, info)
+            info["quarantine"] = {
+                "level": level,
+                "reason": reason,
+                "since": time.time(),
+                "until": time.time() + hold,
+            }
+            self.save_deployment_info(site_name, info)
+
+        self.log_app_event(site_name, "quarantine", "error", f"{reason} (hold {hold}s)")
+        print(f"   🚫 Quarantined {site_name} for {hold}s: {reason}")
+        return True
+
+    def probe_quarantined_app(self, site_name):
+        """Start a quarantined app again once its hold is over (probation)"""
+        with self.app_lock(site_name):
+            info = self.load_deployment_info(site_name)
+            quarantine = (info or {}).get("quarantine")
+            if not quarantine or not quarantine.get("until"):
+                return False
+            print(f"🩺 Quarantine over for {site_name} - starting it on probation")
+            ready = self.resume_instances(site_name, info)
+            quarantine.update(until=None, probation_since=time.time())
+            self.save_deployment_info(site_name, info)
+
+        if not ready:
+            reason, _ = self.app_crash_reason(
+                site_name, info, self.app_instances(site_name, info)[0]["port"]
+            )
+            return self.quarantine_app(site_name, reason)
+        return True
+
+    def lift_quarantine(self, site_name):
+        """Forget an app's quarantine (manual start or a new release)"""
+        with self.app_lock(site_name):
+            info = self.load_deployment_info(site_name)
+            if not info or not info.pop("quarantine", None):
+                return False
+            self.save_deployment_info(site_name, info)
+        self.reset_restart_counters(site_name)
+        print(f"   ✅ Quarantine lifted for {site_name}")
+        return True
+
+    def log_app_event(self, site_name, action, status, message):
+        conn = self.get_database_connection()
+        if not conn:
+            return
+        conn.execute(
+            """
+            INSERT INTO deployment_logs (domain_name, action, status, message)
+            VALUES (?, ?, ?, ?)
+        """,
+            (site_name, action, status, message),
+        )
+        conn.commit()
+        conn.close()
+
+    def run_crash_watch_pass(self):
+        """Record new restarts per app and quarantine the ones crash-looping"""
+        summary = {"restarts": 0, "quarantined": [], "probed": []}
+        apps_dir = self.deployment_apps_dir()
+        if not os.path.isdir(apps_dir):
+            return summary
+
+        for site_name in sorted(os.listdir(apps_dir)):
+            info = self.load_deployment_info(site_name)
+            if not info or info.get("hibernated_at"):
+                continue
+            quarantine = info.get("quarantine")
+            if quarantine and quarantine.get("until"):
+                if time.time() >= quarantine["until"]:
+                    self.probe_quarantined_app(site_name)
+                    summary["probed"].append(site_name)
+                continue
+
+            restarts = []
+            gave_up = False
+            for port, stat in self.instance_restart_stats(site_name, info).items():
+                previous = self.restart_counters.get((site_name, port))
+                self.restart_counters[(site_name, port)] = stat["restarts"]
+                if stat["gave_up"]:
+                    # The process manager stopped restarting it: already a crash loop
+                    gave_up = True
+                    restarts.append(
+                        (
+                            port,
+                            max(stat["restarts"] - (previous or 0), 0),
+                            stat["exit_code"],
+                        )
+                    )
+                    continue
+                if previous is None:
+                    continue  # First look: only a baseline
+                # A lower count means the process manager reset it on a manual start
+                count = stat["restarts"] - (
+                    previous if stat["restarts"] >= previous else 0
+                )
+                if count > 0:
+                    restarts.append((port, count, stat["exit_code"]))
+
+            if not restarts:
+                # A full quiet window on probation clears the quarantine history
+                if (
+                    quarantine
+                    and time.time() - quarantine.get("probation_since", 0)
+                    > CONFIG["crash_loop_window"]
+                ):
+                    self.lift_quarantine(site_name)
+                continue
+
+            reason, lines = self.app_crash_reason(site_name, info, restarts[0][0])
+            self.record_restarts(site_name, restarts, reason, lines)
+            summary["restarts"] += sum(count for _, count, _ in restarts)
+            classification, _ = self.classify_restarts(site_name)
+            if gave_up:
+                classification = "crash-loop"
+            print(f"   ⚠️  {site_name} restarted ({classification}): {reason}")
+
+            # Any relapse on probation goes straight back, for twice as long
+            if classification == "crash-loop" or quarantine:
+                if self.quarantine_app(site_name, reason):
+                    summary["quarantined"].append(site_name)
+
+        return summary
+
+    def start_crash_watch(self):
+        """Run crash watch passes in a daemon thread until crash_watch_stop is set"""
+
+        def loop():
+            while not self.crash_watch_stop.wait(CONFIG["crash_watch_interval"]):
+                try:
+                    self.run_crash_watch_pass()
+                except Exception as e:
+                    print(f"⚠️  Crash watch pass failed: {e}")
+
+        thread = threading.Thread(target=loop, name="crash-watch", daemon=True)
+        thread.start()
+        return thread
+
+    def app_crash_report(self, site_name):
+        """Classification, quarantine state and recent restart events of an app"""
+        info = self.load_deployment_info(site_name) or {}
+        classification, restarts = self.classify_restarts(site_name)
+        events = []
+        conn = self.get_database_connection()
+        if conn:
+            rows = conn.execute(
+                """
+                SELECT port, restarts, exit_code, reason, log_tail, created_at
+                FROM app_restart_events WHERE site_name = ?
+                ORDER BY id DESC LIMIT 50
+            """,
+                (site_name,),
+            ).fetchall()
+            conn.close()
+            events = [
+                {
+                    "port": port,
+                    "restarts": count,
+                    "exit_code": exit_code,
+                    "reason": reason,
+                    "log_tail": log_tail.splitlines() if log_tail else [],
+                    "created_at": created_at,
+                }
+                for port, count, exit_code, reason, log_tail, created_at in rows
+            ]
+        quarantine = info.get("quarantine")
+        if quarantine and quarantine.get("until"):
+            classification = "quarantined"
+        return {
+            "site_name": site_name,
+            "classification": classification,
+            "restarts_in_window": restarts,
+            "quarantine": quarantine,
+            "events": events,
+        }
+
+    def schedule_drain_reap(self, site_name):
+        """Reap the site's draining instances once the drain period is over"""
+        timer = threading.Timer(
+            CONFIG["release_drain_seconds"] + 1,
+            self.reap_drained_instances,
+            args=(site_name,),
+        )
+        timer.daemon = True
+        timer.start()
+
+    def reap_drained_instances(self, site_name, info=None):
+        """Stop old instances whose drain period is over and prune old releases"""
+        if info is None:
+            # Drain timer: hold the app lock across the deployment.json update
+            with self.app_lock(site_name):
+                info = self.load_deployment_info(site_name)
+                if info and info.get("draining"):
+                    self.reap_drained_instances(site_name, info)
+                    self.save_deployment_info(site_name, info)
+            return
+        if not info.get("draining"):
+            return
+
+        live_ports = {
+            instance["port"] for instance in self.app_instances(site_name, info)
+        }
+        remaining = []
+        for instance in info["draining"]:
+            if instance["stop_after"] > time.time():
+                remaining.append(instance)
+                continue
+            # A port reused by the live release must not be stopped
+            if instance["port"] not in live_ports or instance.get("legacy"):
+                self.stop_app_instance(
+                    site_name, instance, instance.get("process_manager")
+                )
+                print(f"   🛑 Drained {site_name} instance on port {instance['port']}")
+        info["draining"] = remaining
+
+        if not remaining:
+            self.prune_releases(site_name, info)
+
+    def prune_releases(self, site_name, info):
+        """Keep the newest releases_to_keep release dirs, never one still in use"""
+        current = info.get("cwd")
+        if not current or os.path.basename(os.path.dirname(current)) != "releases":
+            return
+        releases_dir = os.path.dirname(current)
+        in_use = {instance.get("release") for instance in info.get("instances", [])}
+        in_use |= {instance.get("release") for instance in info.get("draining", [])}
+
+        releases = sorted(os.listdir(releases_dir), reverse=True)
+        for name in releases[CONFIG["releases_to_keep"] :]:
+            path = f"{releases_dir}/{name}"
+            if path not in in_use and path != current:
+                shutil.rmtree(path, ignore_errors=True)
+                print(f"   🧹 Pruned old release {path}")
+
+    def setup_system(self):
+        """Complete system setup with read-only filesystem support"""
+        print("🚀 Starting simple multi-domain hosting setup v2.6...")
+        print("   🔒 FULL READ-ONLY FILESYSTEM SUPPORT!")
+
+        if self.readonly_filesystem:
+            print("🔒 Read-only filesystem detected - using safe deployment mode")
+
+        if not self.is_root:
+            print("❌ Root privileges required for initial setup")
+            print("   Run: sudo python3 simple-hosting.py --setup")
+            return False
+
+        try:
+            # 1. Install packages (only if not read-only)
+            if not self.readonly_filesystem:
+                print("\n📦 Installing required packages...")
+                if not self.run_command("apt update", show_output=True):
+                    print("❌ Failed to update package list")
+                    return False
+
+                packages = "nginx sqlite3 certbot python3-certbot-nginx curl git python3-pip nodejs npm"
+                if not self.run_command(f"apt install -y {packages}", show_output=True):
+                    print("❌ Failed to install packages")
+                    return False
+            else:
+                print("\n⚠️  Read-only filesystem - skipping package installation")
+                print("   Assuming packages are already installed")
+
+            # 2. Ensure nginx is accessible
+            print("\n🔧 Verifying nginx installation...")
+            if not self.ensure_nginx_installed():
+                if not self.readonly_filesystem:
+                    print("❌ Failed to ensure nginx is properly installed")
+                    return False
+                else:
+                    print(
+                        "⚠️  Nginx verification failed but continuing (read-only mode)"
+                    )
+
+            # 3. Install Python packages (only if not read-only)
+            if not self.readonly_filesystem:
+                print("🐍 Installing Python packages...")
+                python_packages = ["flask", "flask-cors", "gunicorn", "brotli"]
+                for package in python_packages:
+                    result = subprocess.run(
+                        ["pip3", "install", package], capture_output=True, text=True
+                    )
+                    if result.returncode == 0:
+                        print(f"   ✅ {package} installed")
+                    else:
+                        print(f"   ⚠️  {package} installation failed: {result.stderr}")
+
+            # 4. Create directory structure
+            print("\n📁 Creating directory structure...")
+
+            directories = [
+                (CONFIG["web_root"], "www-data", 0o755),
+                (os.path.dirname(CONFIG["database_path"]), "www-data", 0o755),
+                (CONFIG["log_dir"], "www-data", 0o755),
+                ("/tmp/pm2-home", "www-data", 0o755),
+                ("/tmp/nodejs-apps", "www-data", 0o755),
+            ]
+
+            for directory, owner, mode in directories:
+                if not self.create_directory_with_permissions(directory, owner, mode):
+                    print(f"⚠️  Could not create {directory}")
+
+            # 5. Setup nginx permissions (only if not read-only)
+            if not self.readonly_filesystem:
+                print("\n🔐 Setting up nginx permissions...")
+
+                os.makedirs("/etc/nginx/sites-available", exist_ok=True)
+                os.makedirs("/etc/nginx/sites-enabled", exist_ok=True)
+
+                if self.is_root:
+                    uid, gid = self.get_user_info("www-data")
+                    try:
+                        os.chown("/etc/nginx/sites-available", uid, gid)
+                        os.chown("/etc/nginx/sites-enabled", uid, gid)
+                        os.chmod("/etc/nginx/sites-available", 0o755)
+                        os.chmod("/etc/nginx/sites-enabled", 0o755)
+                        print("   ✅ Nginx directories owned by www-data")
+                    except:
+                        print("   ⚠️  Could not set nginx directory ownership")
+
+                # Setup sudo permissions
+                print("\n🔧 Setting up sudo permissions...")
+
+                sudoers_content = """# Simple Hosting API - Read-only filesystem safe
+www-data ALL=(ALL) NOPASSWD: /usr/sbin/nginx -t
+www-data ALL=(ALL) NOPASSWD: /usr/sbin/nginx -t -p /tmp
+www-data ALL=(ALL) NOPASSWD: /usr/bin/nginx -t
+www-data ALL=(ALL) NOPASSWD: /usr/bin/nginx -t -p /tmp
+www-data ALL=(ALL) NOPASSWD: /bin/systemctl reload nginx
+www-data ALL=(ALL) NOPASSWD: /bin/systemctl restart nginx
+www-data ALL=(ALL) NOPASSWD: /bin/systemctl start nginx
+www-data ALL=(ALL) NOPASSWD: /bin/systemctl stop nginx
+www-data ALL=(ALL) NOPASSWD: /usr/sbin/certbot*
+www-data ALL=(ALL) NOPASSWD: /bin/ln -s /etc/nginx/sites-available/* /etc/nginx/sites-enabled/*
+www-data ALL=(ALL) NOPASSWD: /bin/rm /etc/nginx/sites-enabled/*
+www-data ALL=(ALL) NOPASSWD: /usr/bin/npm *
+www-data ALL=(ALL) NOPASSWD: /bin/systemctl * nodejs-*
+"""
+
+                try:
+                    sudoers_file = "/etc/sudoers.d/hosting-api"
+                    with open(sudoers_file, "w") as f:
+                        f.write(sudoers_content)
+                    os.chmod(sudoers_file, 0o440)
+
+                    result = subprocess.run(
+                        ["visudo", "-c"], capture_output=True, text=True
+                    )
+                    if result.returncode != 0:
+                        print("❌ Sudoers syntax error")
+                        os.remove(sudoers_file)
+                        return False
+
+                    print("   ✅ Sudo permissions configured")
+                except:
+                    print("   ⚠️  Could not set sudo permissions")
+            else:
+                print("\n⚠️  Read-only filesystem - skipping nginx permission setup")
+
+            # 6. Setup database
+            print("\n💾 Setting up database...")
+            if not self.setup_database():
+                return False
+            print("✅ Database ready")
 
             # 7. Configure nginx
             print("\n🌐 Configuring nginx...")
@@ -1259,59 +4542,1168 @@ www-data ALL=(ALL) NOPASSWD: /bin/systemctl * nodejs-*
 
         return deploy_env, npm_cache_dir, npm_prefix_dir
 
-    def run_npm_install_safely(self, temp_dir, deploy_env, npm_cache_dir):
-        """Run npm install with proper error handling and fallbacks"""
+    def build_ticket(self, job_id, site_name, project_dir, tenant=None):
+        """Admission ticket for a deploy's install/build stages, sized by app type"""
+        job_class = self.classify_build(project_dir)
+        memory = CONFIG["build_memory_estimate"]
+        if job_class == "nextjs-build":
+            memory = CONFIG["nextjs_build_memory_estimate"]
+        return {
+            "id": job_id,
+            "site_name": site_name,
+            "tenant": self.deploy_tenant(site_name, tenant),
+            "job_class": job_class,
+            "cost": self.estimate_build_cost(site_name, job_class),
+            "memory": self.parse_size(memory),
+        }
+
+    def classify_build(self, project_dir):
+        """install (no build script), build, or nextjs-build"""
+        try:
+            with open(os.path.join(project_dir, "package.json"), "r") as f:
+                package_data = json.load(f)
+            if "build" not in package_data.get("scripts", {}):
+                return "install"
+            dependencies = {
+                **package_data.get("dependencies", {}),
+                **package_data.get("devDependencies", {}),
+            }
+        except (OSError, ValueError, AttributeError):
+            return "install"
+        return "nextjs-build" if "next" in dependencies else "build"
+
+    def deploy_tenant(self, site_name, tenant=None):
+        """Who a deploy is scheduled fairly against: explicit, else the site's domain"""
+        if tenant:
+            return str(tenant)
+        if site_name and "." in site_name:
+            return self.registrable_domain(site_name)
+        return site_name
+
+    def estimate_build_cost(self, site_name, job_class):
+        """Expected install+build seconds: median of the site's recent runs of this class"""
+        conn = self.get_database_connection()
+        if conn:
+            for where, args in [
+                ("site_name = ? AND job_class = ?", (site_name, job_class)),
+                ("job_class = ?", (job_class,)),
+            ]:
+                rows = conn.execute(
+                    f"""
+                    SELECT seconds FROM deploy_stage_timings
+                    WHERE {where} AND stage = 'build_total'
+                    ORDER BY id DESC LIMIT ?
+                """,
+                    (*args, CONFIG["build_cost_history"]),
+                ).fetchall()
+                if rows:
+                    conn.close()
+                    samples = sorted(row[0] for row in rows)
+                    return samples[len(samples) // 2]
+            conn.close()
+        return CONFIG["build_cost_defaults"][job_class]
+
+    def record_stage_timings(self, job):
+        """Keep a finished deploy's stage durations as cost history"""
+        timings = dict(job.get("stage_seconds") or {})
+        if not job.get("job_class") or "install" not in timings:
+            return
+        timings["build_total"] = timings["install"] + timings.get("build", 0)
+        conn = self.get_database_connection()
+        if not conn:
+            return
+        conn.executemany(
+            """
+            INSERT INTO deploy_stage_timings (site_name, tenant, job_class, stage, seconds)
+            VALUES (?, ?, ?, ?, ?)
+        """,
+            [
+                (job["site_name"], job.get("tenant"), job["job_class"], stage, seconds)
+                for stage, seconds in timings.items()
+            ],
+        )
+        conn.commit()
+        conn.close()
+
+    def build_command(self, command):
+        """Wrap a build step to run at low CPU/IO priority, in the build slice if we can"""
+        prefix = ["nice", "-n", str(CONFIG["build_nice"])]
+        if shutil.which("ionice"):
+            prefix += ["ionice", "-c", "2", "-n", "7"]
+        if (
+            self.is_root
+            and not self.readonly_filesystem
+            and shutil.which("systemd-run")
+        ):
+            # A transient scope: a runaway build is OOM-killed inside its own
+            # cgroup instead of taking live apps with it
+            prefix = [
+                "systemd-run",
+                "--scope",
+                "--quiet",
+                "--collect",
+                f"--slice={CONFIG['build_slice']}",
+                "-p",
+                f"MemoryMax={self.parse_size(CONFIG['build_memory_max'])}",
+                "-p",
+                f"CPUWeight={CONFIG['build_cpu_weight']}",
+                "-p",
+                f"IOWeight={CONFIG['build_io_weight']}",
+            ] + prefix
+        return prefix + command
+
+    def run_build_step(self, command, cwd, env, timeout, cancel=None):
+        """Run one build step in its own process group; timeout or cancel kills the whole tree
+
+        Raises subprocess.TimeoutExpired past the timeout; a cancelled step
+        returns with the signal as its (negative) return code.
+        """
+        process = subprocess.Popen(
+            self.build_command(command),
+            cwd=cwd,
+            env=env,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            start_new_session=True,
+        )
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                stdout, stderr = process.communicate(
+                    timeout=max(0, min(0.5, deadline - time.monotonic()))
+                )
+                return subprocess.CompletedProcess(
+                    process.args, process.returncode, stdout, stderr
+                )
+            except subprocess.TimeoutExpired:
+                pass
+            timed_out = time.monotonic() >= deadline
+            if timed_out or (cancel and cancel.is_set()):
+                print(
+                    f"   🛑 {'Timed out' if timed_out else 'Cancelled'} - killing process group {process.pid}"
+                )
+                self.kill_process_group(process)
+                stdout, stderr = process.communicate()
+                if timed_out:
+                    raise subprocess.TimeoutExpired(
+                        process.args, timeout, stdout, stderr
+                    )
+                return subprocess.CompletedProcess(
+                    process.args, process.returncode, stdout, stderr
+                )
+
+    def kill_process_group(self, process):
+        """SIGTERM a step's process group, SIGKILL whatever outlives the grace"""
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            return
+        deadline = time.monotonic() + CONFIG["build_kill_grace"]
+        # npm's children are in the group too: wait for all, not just npm
+        while (
+            AppSupervisor.process_group_alive(process.pid)
+            and time.monotonic() < deadline
+        ):
+            process.poll()  # Reap npm itself: a zombie still counts as alive
+            time.sleep(0.1)
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
 
-        install_strategies = [
-            [
+    def npm_install_strategies(self, project_dir, npm_cache_dir):
+        """Install commands that apply to a project, in default order"""
+        strategies = OrderedDict()
+        # npm ci needs a lockfile, and is the fastest way to honour one
+        if self.npm_lockfile(project_dir):
+            strategies["ci"] = [
                 "npm",
-                "install",
+                "ci",
                 "--cache",
                 npm_cache_dir,
+                "--prefer-offline",
                 "--no-audit",
                 "--no-fund",
-                "--prefer-offline",
                 "--silent",
-            ],
-            ["npm", "install", "--no-audit", "--no-fund", "--silent"],
-            ["npm", "ci", "--cache", npm_cache_dir, "--silent"],
-            ["npm", "install"],
+            ]
+        strategies["install-offline"] = [
+            "npm",
+            "install",
+            "--cache",
+            npm_cache_dir,
+            "--no-audit",
+            "--no-fund",
+            "--prefer-offline",
+            "--silent",
+        ]
+        strategies["install"] = [
+            "npm",
+            "install",
+            "--no-audit",
+            "--no-fund",
+            "--silent",
         ]
+        strategies["install-plain"] = ["npm", "install"]
+        return strategies
+
+    @staticmethod
+    def npm_lockfile(project_dir):
+        """The project's lockfile path, or None"""
+        for name in ("npm-shrinkwrap.json", "package-lock.json"):
+            path = os.path.join(project_dir, name)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def npm_install_key(self, project_dir, template=None):
+        """(template, lockfile hash) that install history is kept under
 
-        for i, strategy in enumerate(install_strategies, 1):
-            print(f"   🔄 Trying npm install strategy {i}...")
+        Without a template id from deployConfig, projects are keyed by a hash
+        of their declared dependencies, which is what a template fixes.
+        """
+        if not template:
+            template = f"deps:{self.dependency_hash(project_dir)[:16]}"
+        return str(template), self.lockfile_hash(project_dir)
+
+    @staticmethod
+    def dependency_hash(project_dir):
+        """sha256 of the project's declared dependencies and devDependencies"""
+        try:
+            with open(os.path.join(project_dir, "package.json"), "r") as f:
+                package_data = json.load(f)
+            dependencies = {
+                **package_data.get("dependencies", {}),
+                **package_data.get("devDependencies", {}),
+            }
+        except (OSError, ValueError, AttributeError):
+            dependencies = {}
+        return hashlib.sha256(
+            json.dumps(dependencies, sort_keys=True).encode()
+        ).hexdigest()
+
+    def lockfile_hash(self, project_dir):
+        """sha256 of the project's lockfile, or None without one"""
+        lockfile = self.npm_lockfile(project_dir)
+        if not lockfile:
+            return None
+        with open(lockfile, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    def order_npm_strategies(self, strategies, template, lockfile_hash):
+        """Strategies whose last run worked (fastest first), then untried, then the rest"""
+        rows = []
+        conn = self.get_database_connection()
+        if conn:
+            # The exact lockfile first, else the template's other lockfiles (or
+            # its lockfile-less runs): npm ci only exists with a lockfile
+            for where, args in [
+                ("template = ? AND lockfile_hash IS ?", (template, lockfile_hash)),
+                (
+                    "template = ? AND (lockfile_hash IS NULL) = ?",
+                    (template, lockfile_hash is None),
+                ),
+            ]:
+                rows = conn.execute(
+                    f"""
+                    SELECT strategy, success, seconds FROM npm_install_history
+                    WHERE {where} ORDER BY id DESC LIMIT ?
+                """,
+                    (*args, CONFIG["npm_history_runs"]),
+                ).fetchall()
+                if rows:
+                    break
+            conn.close()
+
+        history = {}
+        for strategy, success, seconds in rows:
+            # Rows are newest first: the first one is the latest outcome
+            entry = history.setdefault(
+                strategy, {"ok": [], "failed": 0, "last": success}
+            )
+            if success:
+                entry["ok"].append(seconds)
+            else:
+                entry["failed"] += 1
+
+        def rank(item):
+            index, name = item
+            entry = history.get(name)
+            if not entry:
+                return (1, 0, index)
+            if entry["last"]:
+                times = sorted(entry["ok"])
+                return (0, times[len(times) // 2], index)
+            return (2, 0, index)
+
+        ordered = sorted(enumerate(strategies), key=rank)
+        return [name for _, name in ordered]
+
+    def record_npm_install(self, template, lockfile_hash, strategy, success, seconds):
+        """Remember how a strategy did for this template and lockfile"""
+        conn = self.get_database_connection()
+        if not conn:
+            return
+        conn.execute(
+            """
+            INSERT INTO npm_install_history (template, lockfile_hash, strategy, success, seconds)
+            VALUES (?, ?, ?, ?, ?)
+        """,
+            (template, lockfile_hash, strategy, success, round(seconds, 2)),
+        )
+        conn.commit()
+        conn.close()
+
+    def run_npm_install_safely(
+        self,
+        temp_dir,
+        deploy_env,
+        npm_cache_dir,
+        timeout=None,
+        cancel=None,
+        template=None,
+    ):
+        """Run npm install with proper error handling and fallbacks"""
+        if timeout is None:
+            timeout = CONFIG["deploy_stage_timeouts"]["install"]
+        deadline = time.monotonic() + timeout
+
+        install_strategies = self.npm_install_strategies(temp_dir, npm_cache_dir)
+        template, lockfile_hash = self.npm_install_key(temp_dir, template)
+        order = self.order_npm_strategies(install_strategies, template, lockfile_hash)
+        print(f"   📚 Install order for {template}: {', '.join(order)}")
+
+        error_msg = ""
+        for i, name in enumerate(order, 1):
+            if cancel and cancel.is_set():
+                return False, "Deploy cancelled"
+            print(f"   🔄 Trying npm install strategy {name}...")
+            started = time.monotonic()
 
             try:
-                result = subprocess.run(
-                    strategy,
-                    cwd=temp_dir,
-                    env=deploy_env,
-                    capture_output=True,
-                    text=True,
-                    timeout=300,
+                # Strategies share the stage budget rather than getting one each
+                result = self.run_build_step(
+                    install_strategies[name],
+                    temp_dir,
+                    deploy_env,
+                    deadline - time.monotonic(),
+                    cancel,
+                )
+                if cancel and cancel.is_set():
+                    return False, "Deploy cancelled"
+                self.record_npm_install(
+                    template,
+                    lockfile_hash,
+                    name,
+                    result.returncode == 0,
+                    time.monotonic() - started,
                 )
 
                 if result.returncode == 0:
-                    print(f"   ✅ npm install successful with strategy {i}")
+                    print(f"   ✅ npm install successful with strategy {name}")
                     return True, ""
                 else:
                     error_msg = result.stderr or result.stdout
-                    print(f"   ⚠️  Strategy {i} failed: {error_msg[:100]}...")
-
-                    if i == len(install_strategies):
-                        return False, error_msg
+                    print(f"   ⚠️  Strategy {name} failed: {error_msg[:100]}...")
 
             except subprocess.TimeoutExpired:
-                print(f"   ⏰ Strategy {i} timed out")
-                if i == len(install_strategies):
-                    return False, "npm install timed out"
+                self.record_npm_install(
+                    template, lockfile_hash, name, False, time.monotonic() - started
+                )
+                print(
+                    f"   ⏰ Strategy {name} used up the install budget ({timeout:.0f}s)"
+                )
+                return False, "npm install timed out"
 
             except Exception as e:
-                print(f"   ❌ Strategy {i} error: {e}")
-                if i == len(install_strategies):
-                    return False, str(e)
+                print(f"   ❌ Strategy {name} error: {e}")
+                error_msg = str(e)
+
+        return False, error_msg or "All npm install strategies failed"
+
+    # Files that fix a template's dependencies and build configuration
+    GOLDEN_TEMPLATE_FILES = (
+        "package.json",
+        "next.config.mjs",
+        "jsconfig.json",
+        "postcss.config.cjs",
+        "tailwind.config.js",
+        "app/globals.css",
+    )
+    GENERATOR_FIELD_PATTERN = re.compile(r"\{\{\s*([\w.]+)\s*\}\}")
+    GOLDEN_LAYOUT = """import './globals.css';
+
+export default function RootLayout({ children }) {
+  return (
+    <html lang="en">
+      <body>{children}</body>
+    </html>
+  );
+}
+"""
+    GOLDEN_PAGE = """export default function Page() {
+  return <main className="p-4 font-sans text-primary">golden</main>;
+}
+"""
+
+    @staticmethod
+    def generator_template_path(template, relative):
+        """A template's own source for a project file (top level or config/), or None"""
+        root = os.path.join(CONFIG["generator_templates_dir"], template)
+        for candidate in (relative, os.path.join("config", relative)):
+            path = os.path.join(root, f"{candidate}.template")
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def generator_templates(self):
+        """Templates with their own package.json: the ones a golden env can exist for"""
+        try:
+            names = sorted(os.listdir(CONFIG["generator_templates_dir"]))
+        except OSError:
+            return []
+        return [
+            name for name in names if self.generator_template_path(name, "package.json")
+        ]
+
+    def golden_template_files(self, template):
+        """Project files of a template's golden env, falling back to base's
+
+        Only the dependency and build configuration is rendered; the pages are
+        the generator's job, so a placeholder app warms the compiler cache.
+        """
+        files = {}
+        for relative in self.GOLDEN_TEMPLATE_FILES:
+            path = self.generator_template_path(
+                template, relative
+            ) or self.generator_template_path("base", relative)
+            if not path:
+                continue
+            with open(path, "r") as f:
+                source = f.read()
+            files[relative] = self.GENERATOR_FIELD_PATTERN.sub(
+                lambda match: (
+                    f"golden-{template}" if match.group(1) == "businessName" else ""
+                ),
+                source,
+            )
+        files["app/layout.js"] = self.GOLDEN_LAYOUT
+        files["app/page.js"] = self.GOLDEN_PAGE
+        return files
+
+    @staticmethod
+    def read_golden_manifest(env_dir):
+        try:
+            with open(os.path.join(env_dir, "golden.json"), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def golden_envs(self):
+        """Manifests of every built golden env, newest first"""
+        envs = []
+        root = CONFIG["golden_env_dir"]
+        try:
+            templates = os.listdir(root)
+        except OSError:
+            return []
+        for template in templates:
+            try:
+                versions = os.listdir(os.path.join(root, template))
+            except OSError:
+                continue
+            for version in versions:
+                path = os.path.join(root, template, version)
+                manifest = self.read_golden_manifest(path)
+                if manifest:
+                    envs.append({**manifest, "path": path})
+        envs.sort(key=lambda env: env.get("built_at", ""), reverse=True)
+        return envs
+
+    def prewarm_template(self, template, cancel=None):
+        """Build the golden env for a template's current version, unless it exists"""
+        files = self.golden_template_files(template)
+        if "package.json" not in files:
+            return {"template": template, "success": False, "error": "No package.json"}
+        version = hashlib.sha256(
+            json.dumps(files, sort_keys=True).encode()
+        ).hexdigest()[:12]
+        env_dir = os.path.join(CONFIG["golden_env_dir"], template, version)
+        result = {"template": template, "version": version, "path": env_dir}
+        if self.read_golden_manifest(env_dir):
+            print(f"   ✅ Golden env {template}@{version} already built")
+            return {**result, "success": True, "reused": True}
+
+        print(f"🌟 Building golden env {template}@{version}...")
+        timestamp = int(time.time())
+        build_dir = f"{env_dir}.building-{os.getpid()}-{timestamp}"
+        for relative, content in files.items():
+            path = os.path.join(build_dir, relative)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(content)
+        deploy_env, npm_cache_dir, npm_prefix_dir = (
+            self.get_npm_environment_for_deployment(
+                build_dir, f"golden-{template}", timestamp
+            )
+        )
+
+        # Prewarming competes for build slots like any deploy
+        ticket = self.build_ticket(
+            f"golden-{template}-{version}", f"golden-{template}", build_dir, "golden"
+        )
+        error = None
+        timings = {}
+        if not self.build_admission.admit(ticket, cancel=cancel):
+            error = "Never admitted to a build slot"
+        else:
+            try:
+                started = time.monotonic()
+                success, install_error = self.run_npm_install_safely(
+                    build_dir,
+                    deploy_env,
+                    npm_cache_dir,
+                    cancel=cancel,
+                    template=template,
+                )
+                timings["install"] = round(time.monotonic() - started, 2)
+                if not success:
+                    error = f"npm install failed: {install_error[:500]}"
+                else:
+                    started = time.monotonic()
+                    build = self.run_build_step(
+                        ["npm", "run", "build", "--silent"],
+                        build_dir,
+                        deploy_env,
+                        CONFIG["deploy_stage_timeouts"]["build"],
+                        cancel,
+                    )
+                    timings["build"] = round(time.monotonic() - started, 2)
+                    if build.returncode != 0:
+                        error = (
+                            f"npm build failed: {(build.stderr or build.stdout)[:500]}"
+                        )
+            except subprocess.TimeoutExpired:
+                error = "npm build timed out"
+            finally:
+                self.build_admission.release(ticket)
+
+        for cleanup_dir in [npm_cache_dir, npm_prefix_dir, deploy_env.get("TMPDIR")]:
+            if cleanup_dir and os.path.exists(cleanup_dir):
+                shutil.rmtree(cleanup_dir, ignore_errors=True)
+        if error:
+            print(f"   ❌ Golden env {template}@{version}: {error}")
+            shutil.rmtree(build_dir, ignore_errors=True)
+            return {**result, "success": False, "error": error}
+
+        manifest = {
+            "template": template,
+            "version": version,
+            "deps_hash": self.dependency_hash(build_dir),
+            "lockfile_hash": self.lockfile_hash(build_dir),
+            "built_at": datetime.now().isoformat(),
+            "timings": timings,
+        }
+        with open(os.path.join(build_dir, "golden.json"), "w") as f:
+            json.dump(manifest, f, indent=2)
+        try:
+            os.rename(build_dir, env_dir)
+        except OSError:
+            # Built concurrently by another prewarm: keep theirs
+            shutil.rmtree(build_dir, ignore_errors=True)
+        self.prune_golden_envs(template)
+        print(
+            f"   ✅ Golden env {template}@{version} ready (install {timings['install']}s, build {timings['build']}s)"
+        )
+        return {**result, "success": True, "reused": False, "timings": timings}
+
+    def prewarm_templates(self, templates=None, cancel=None):
+        """Prewarm the given templates (default: all), one after another"""
+        return [
+            self.prewarm_template(template, cancel)
+            for template in (templates or self.generator_templates())
+        ]
+
+    def prune_golden_envs(self, template):
+        """Keep the newest golden_env_keep versions of a template"""
+        envs = [env for env in self.golden_envs() if env["template"] == template]
+        for env in envs[CONFIG["golden_env_keep"] :]:
+            print(f"   🗑️  Pruning golden env {template}@{env['version']}")
+            shutil.rmtree(env["path"], ignore_errors=True)
+
+    def find_golden_env(self, project_dir, template=None):
+        """The golden env a project can start from, or None
+
+        node_modules is only reused when the declared dependencies match and
+        the project has no lockfile of its own or the same one; a template
+        match alone still seeds the build cache.
+        """
+        deps_hash = self.dependency_hash(project_dir)
+        lockfile_hash = self.lockfile_hash(project_dir)
+        best = None
+        for env in self.golden_envs():
+            deps_match = env.get("deps_hash") == deps_hash
+            if not deps_match and env["template"] != template:
+                continue
+            # Newest first: an earlier equal rank wins
+            rank = (deps_match, env["template"] == template)
+            if best is None or rank > best[0]:
+                best = (rank, env)
+        if not best:
+            return None
+        (deps_match, _), env = best
+        node_modules = deps_match and lockfile_hash in (None, env.get("lockfile_hash"))
+        return {**env, "node_modules": node_modules}
+
+    def clone_golden_env(self, golden, project_dir):
+        """Copy-on-write clone a golden env's node_modules and .next/cache into a project
+
+        Returns True when node_modules came along, so the install can be skipped.
+        """
+        parts = [os.path.join(".next", "cache")]
+        if golden["node_modules"]:
+            parts.insert(0, "node_modules")
+        cloned = []
+        for part in parts:
+            source = os.path.join(golden["path"], part)
+            target = os.path.join(project_dir, part)
+            if not os.path.isdir(source) or os.path.exists(target):
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            # Reflinks on btrfs/XFS, a plain copy elsewhere: never hardlinks,
+            # builds write into node_modules/.cache
+            result = subprocess.run(
+                ["cp", "-a", "--reflink=auto", source, target],
+                capture_output=True,
+                text=True,
+            )
+            if result.returncode != 0:
+                print(f"   ⚠️  Could not clone golden {part}: {result.stderr.strip()}")
+                shutil.rmtree(target, ignore_errors=True)
+                continue
+            cloned.append(part)
+        if cloned:
+            print(
+                f"   🌟 Cloned {', '.join(cloned)} from golden env {golden['template']}@{golden['version']}"
+            )
+        return "node_modules" in cloned
+
+    SPEC_RESERVED_KEYS = ("template", "version", "files", "assets")
+    BLOB_DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+    def blob_path(self, digest):
+        return os.path.join(CONFIG["blob_store_dir"], digest[:2], digest[2:])
+
+    def store_blob(self, data):
+        """Store bytes under their sha256 (once) and return the digest"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(digest)
+        if os.path.exists(path):
+            os.utime(path)  # Still in use: keeps it out of the prune
+            return digest
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        # Shared by every project built from it: never written in place
+        os.chmod(temp_path, 0o444)
+        os.replace(temp_path, path)
+        return digest
+
+    def has_blob(self, digest):
+        return bool(self.BLOB_DIGEST_PATTERN.match(digest or "")) and os.path.exists(
+            self.blob_path(digest)
+        )
+
+    @staticmethod
+    def link_or_copy(source, target):
+        """Hardlink a file, copying when the filesystems differ"""
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copy2(source, target)
+        return target
+
+    def prune_blobs(self):
+        """Remove blobs no deploy has stored or used within blob_retention_days"""
+        cutoff = time.time() - CONFIG["blob_retention_days"] * 86400
+        removed = 0
+        for dirpath, _, filenames in os.walk(CONFIG["blob_store_dir"]):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    if os.stat(path).st_mtime < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    continue
+        self.blobs_pruned_at = time.time()
+        if removed:
+            print(f"🗑️  Pruned {removed} unused blob(s)")
+        return removed
+
+    @staticmethod
+    def safe_project_path(relative):
+        """A spec path as a relative project path; ValueError if it escapes the project"""
+        normalized = os.path.normpath(str(relative)).replace(os.sep, "/")
+        if (
+            not relative
+            or os.path.isabs(str(relative))
+            or normalized == ".."
+            or normalized.startswith("../")
+        ):
+            raise ValueError(f"Invalid project path: {relative}")
+        return normalized
+
+    def render_site_spec(self, spec):
+        """Render a site spec into {project path: blob digest}
+
+        The template tree comes from generator_templates_dir, rendered with
+        the spec as its values; spec files are added verbatim and assets are
+        base64 content or the sha256 of a blob already stored. Raises
+        ValueError for an unknown template, a stale version or a bad asset.
+        """
+        if not isinstance(spec, dict) or not spec.get("template"):
+            raise ValueError("Site spec needs a template")
+        template = str(spec["template"])
+        tree = self.site_templates.tree(template)
+        if spec.get("version") and spec["version"] != tree["version"]:
+            raise ValueError(
+                f"Template {template} is at version {tree['version']}, not {spec['version']}"
+            )
+
+        values = {
+            key: value
+            for key, value in spec.items()
+            if key not in self.SPEC_RESERVED_KEYS
+        }
+        values["template"] = template
+        rendered = self.site_templates.render(template, values)
+        for relative, content in (spec.get("files") or {}).items():
+            rendered[self.safe_project_path(relative)] = content
+
+        blobs = {
+            relative: self.store_blob(content.encode("utf-8"))
+            for relative, content in rendered.items()
+        }
+        for relative, asset in (spec.get("assets") or {}).items():
+            relative = self.safe_project_path(relative)
+            if isinstance(asset, dict) and "sha256" in asset:
+                if not self.has_blob(asset["sha256"]):
+                    raise ValueError(
+                        f"Asset {relative}: unknown blob {asset['sha256']}"
+                    )
+                blobs[relative] = asset["sha256"]
+                os.utime(self.blob_path(asset["sha256"]))
+                continue
+            content = asset.get("base64") if isinstance(asset, dict) else asset
+            try:
+                blobs[relative] = self.store_blob(
+                    base64.b64decode(content, validate=True)
+                )
+            except (TypeError, ValueError):
+                raise ValueError(
+                    f"Asset {relative}: expected base64 content or a sha256"
+                )
+
+        if time.time() - self.blobs_pruned_at > 86400:
+            threading.Thread(target=self.prune_blobs, daemon=True).start()
+        return {"template": template, "version": tree["version"], "files": blobs}
+
+    def materialize_blobs(self, blobs, target_dir):
+        """Copy a rendered project's blobs into place, ready to be built
+
+        Reflinks where the filesystem has them, plain copies elsewhere: never
+        hardlinks, since npm and next build (as root) rewrite files in place.
+        """
+        for relative, digest in blobs.items():
+            target = os.path.join(target_dir, relative)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            result = subprocess.run(
+                ["cp", "--reflink=auto", self.blob_path(digest), target],
+                capture_output=True,
+            )
+            if result.returncode != 0:
+                shutil.copyfile(self.blob_path(digest), target)
+            os.chmod(target, 0o644)
+        print(f"📐 Materialized {len(blobs)} files into {target_dir}")
+
+    def relink_blobs(self, blobs, release_dir):
+        """Point a finished release's unchanged spec files back at the blob store
+
+        Only built, read-only releases share blob inodes; a file the build
+        rewrote no longer matches its digest and keeps its own copy.
+        """
+        linked = 0
+        for relative, digest in blobs.items():
+            target = os.path.join(release_dir, relative)
+            try:
+                with open(target, "rb") as f:
+                    if hashlib.sha256(f.read()).hexdigest() != digest:
+                        continue
+                temp_link = f"{target}.blob-{os.getpid()}"
+                os.link(self.blob_path(digest), temp_link)
+                os.replace(temp_link, target)
+                linked += 1
+            except OSError:
+                continue
+        if linked:
+            print(f"   🔗 {linked} release file(s) shared with the blob store")
+        return linked
+
+    NEXT_CONFIG_FILES = ("next.config.js", "next.config.mjs", "next.config.ts")
+    STANDALONE_START_COMMAND = "HOSTNAME=127.0.0.1 node server.js"
+    WRAPPED_CONFIG_PREFIX = "next.config.hosting-user"
+    OUTPUT_CONFIG = """// Generated by simple-hosting.py: the app's own config, built with output: '{output}'
+{import_line}
+
+export default async function config(...args) {{
+  const resolved =
+    typeof userConfig === 'function' ? await userConfig(...args) : userConfig;
+  return {{ ...resolved, output: '{output}'{overrides} }};
+}}
+"""
+    EXPORT_PATTERN = re.compile(r"output\s*:\s*['\"]export['\"]")
+
+    def next_config_file(self, project_dir):
+        """The next.config Next would load (the first that exists), or None"""
+        for name in self.NEXT_CONFIG_FILES:
+            if os.path.exists(os.path.join(project_dir, name)):
+                return name
+        return None
+
+    def wrap_next_config(self, project_dir, output):
+        """Wrap the project's next.config so the build uses this output mode
+
+        False (project untouched) when the config is TypeScript, or when a
+        static export config would be turned into a standalone server.
+        """
+        self.unwrap_next_config(project_dir)
+        name = self.next_config_file(project_dir)
+        import_line = "const userConfig = {};"
+        if name:
+            path = os.path.join(project_dir, name)
+            if name.endswith(".ts"):
+                print(f"   ⚠️  next.config.ts - building without output: '{output}'")
+                return False
+            with open(path, "r") as f:
+                if output != "export" and self.EXPORT_PATTERN.search(f.read()):
+                    print(f"   ⚠️  Static export - building without output: '{output}'")
+                    return False
+            user_config = f"{self.WRAPPED_CONFIG_PREFIX}{os.path.splitext(name)[1]}"
+            os.rename(path, os.path.join(project_dir, user_config))
+            import_line = f"import userConfig from './{user_config}';"
+        # The default image loader needs a server; exported images are served as-is
+        overrides = ""
+        if output == "export":
+            overrides = ", images: { ...resolved.images, unoptimized: true }"
+        with open(os.path.join(project_dir, "next.config.mjs"), "w") as f:
+            f.write(
+                self.OUTPUT_CONFIG.format(
+                    output=output, import_line=import_line, overrides=overrides
+                )
+            )
+        print(f"   📦 Building with output: '{output}'")
+        return True
+
+    def unwrap_next_config(self, project_dir):
+        """Put back the project's own next.config after wrap_next_config"""
+        for name in os.listdir(project_dir):
+            if name.startswith(self.WRAPPED_CONFIG_PREFIX):
+                os.remove(os.path.join(project_dir, "next.config.mjs"))
+                os.rename(
+                    os.path.join(project_dir, name),
+                    os.path.join(
+                        project_dir,
+                        "next.config" + name[len(self.WRAPPED_CONFIG_PREFIX) :],
+                    ),
+                )
+                return True
+        if os.path.exists(os.path.join(project_dir, "next.config.mjs")):
+            with open(os.path.join(project_dir, "next.config.mjs"), "r") as f:
+                generated = f.readline().startswith("// Generated by simple-hosting.py")
+            if generated:
+                os.remove(os.path.join(project_dir, "next.config.mjs"))
+                return True
+        return False
+
+    # Anything here needs a Node server at request time
+    SERVER_FEATURE_PATTERN = re.compile(
+        r"""['"]use server['"]|getServerSideProps|getInitialProps|from\s+['"]next/headers['"]"""
+        r"""|export\s+const\s+(dynamic\s*=\s*['"]force-dynamic|revalidate\s*=)"""
+    )
+    SOURCE_EXTENSIONS = (".js", ".jsx", ".mjs", ".ts", ".tsx")
+
+    def static_export_candidate(self, project_dir):
+        """(exportable, reason): can this Next.js app be served as plain files?"""
+        name = self.next_config_file(project_dir)
+        if name:
+            if name.endswith(".ts"):
+                return False, "next.config.ts cannot be wrapped"
+            with open(os.path.join(project_dir, name), "r") as f:
+                config = f.read()
+            if self.EXPORT_PATTERN.search(config):
+                return True, "next.config sets output: 'export'"
+            if re.search(r"\b(rewrites|redirects|headers)\s*[:(]", config):
+                return False, f"{name} has rewrites, redirects or headers"
+
+        for prefix in ("", "src/"):
+            for extension in self.SOURCE_EXTENSIONS:
+                if os.path.exists(
+                    os.path.join(project_dir, f"{prefix}middleware{extension}")
+                ):
+                    return False, "middleware needs a server"
+
+        for route_root in ("app", "pages", "src/app", "src/pages"):
+            top = os.path.join(project_dir, route_root)
+            pages_router = route_root.endswith("pages")
+            for dirpath, dirnames, filenames in os.walk(top):
+                relative = os.path.relpath(dirpath, project_dir)
+                if (
+                    pages_router
+                    and os.path.relpath(dirpath, top).split(os.sep)[0] == "api"
+                ):
+                    return False, f"{relative} has API routes"
+                # Dynamic segments only export with their params listed
+                dynamic = os.path.basename(dirpath).startswith("[") or any(
+                    filename.startswith("[") for filename in filenames
+                )
+                if dynamic and not self.sources_mention(
+                    dirpath, ("generateStaticParams", "getStaticPaths")
+                ):
+                    return False, f"{relative} has dynamic routes without static params"
+                for filename in filenames:
+                    stem, extension = os.path.splitext(filename)
+                    if extension not in self.SOURCE_EXTENSIONS:
+                        continue
+                    if stem == "route" and not pages_router:
+                        return False, f"{relative}/{filename} is a route handler"
+
+        for dirpath, dirnames, filenames in os.walk(project_dir):
+            dirnames[:] = [
+                d
+                for d in dirnames
+                if d not in ("node_modules", ".next", "out", "public")
+            ]
+            for filename in filenames:
+                if not filename.endswith(self.SOURCE_EXTENSIONS):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    with open(path, "r", errors="ignore") as f:
+                        match = self.SERVER_FEATURE_PATTERN.search(f.read())
+                except OSError:
+                    continue
+                if match:
+                    relative = os.path.relpath(path, project_dir)
+                    return False, f"{relative} uses {match.group(0)}"
+        return True, "no API routes, middleware or server-only features"
+
+    def sources_mention(self, directory, names):
+        """True if any source file under directory mentions one of names"""
+        for dirpath, _, filenames in os.walk(directory):
+            for filename in filenames:
+                if not filename.endswith(self.SOURCE_EXTENSIONS):
+                    continue
+                try:
+                    with open(
+                        os.path.join(dirpath, filename), "r", errors="ignore"
+                    ) as f:
+                        source = f.read()
+                except OSError:
+                    continue
+                if any(name in source for name in names):
+                    return True
+        return False
+
+    def server_output_mode(self, deploy_config):
+        """Output for a Next.js app run by Node: "standalone" or None (full tree)"""
+        requested = deploy_config.get("output")
+        if requested == "standalone" or (
+            requested in (None, "export") and CONFIG["nextjs_standalone"]
+        ):
+            return "standalone"
+        return None
+
+    def choose_next_output(self, project_dir, deploy_config):
+        """Pick and apply the output mode of a Next.js build: "export", "standalone" or None
+
+        deployConfig.output ("export", "standalone" or "server") wins; without
+        it, apps that qualify are exported when nextjs_static_export is on.
+        """
+        output = deploy_config.get("output")
+        if output is None and CONFIG["nextjs_static_export"]:
+            exportable, reason = self.static_export_candidate(project_dir)
+            print(
+                f"   {'📄 Static export' if exportable else '🖥️  Server mode'}: {reason}"
+            )
+            if exportable:
+                output = "export"
+        if output != "export":
+            output = self.server_output_mode(deploy_config)
+        if output and self.wrap_next_config(project_dir, output):
+            return output
+        return None
+
+    def publish_static_site(self, site_name, export_dir, timestamp):
+        """Serve an exported site from web_root as a static vhost; returns its public path
+
+        public/ is a symlink swapped to each new export in one rename, the
+        nginx route switches to it, and only then is a previous server-mode
+        deployment of the site stopped.
+        """
+        site_dir = f"{CONFIG['web_root']}/{site_name}"
+        releases_dir = f"{site_dir}/static-releases"
+        release_dir = f"{releases_dir}/{timestamp}"
+        public_path = f"{site_dir}/public"
+        try:
+            os.makedirs(releases_dir, mode=0o755, exist_ok=True)
+            shutil.copytree(export_dir, release_dir, copy_function=self.link_or_copy)
+            temp_link = f"{public_path}.tmp-{os.getpid()}"
+            if os.path.lexists(temp_link):
+                os.remove(temp_link)
+            os.symlink(release_dir, temp_link)
+            if os.path.isdir(public_path) and not os.path.islink(public_path):
+                shutil.rmtree(public_path)
+            os.replace(temp_link, public_path)
+            print(f"   📄 {public_path} -> {release_dir}")
+        except OSError as e:
+            print(f"   ❌ Could not publish static export: {e}")
+            shutil.rmtree(release_dir, ignore_errors=True)
+            return None
+
+        if not self.readonly_filesystem:
+            if CONFIG["nginx_routing_mode"] == "map":
+                routed = self.set_vhost_route(
+                    [f"{site_name}.yourdomain.com", site_name],
+                    site_name,
+                    "static",
+                    public_path,
+                )
+            elif self.ssl_enabled(site_name):
+                # Keep the certificate: the HTTPS vhost now serves the export
+                routed = self.apply_tls_profile(site_name, 0, "static")
+            else:
+                routed = self.write_static_vhost(site_name, public_path)
+            if not routed:
+                print("   ❌ nginx could not be switched to the static export")
+                return None
+        else:
+            print("   ⚠️  Read-only mode: nginx configuration skipped")
 
-        return False, "All npm install strategies failed"
+        # The export is live: a previous Node deployment can go
+        if self.load_deployment_info(site_name):
+            print(f"   🛑 Stopping the server-mode deployment of {site_name}")
+            self.remove_app(site_name)
+
+        conn = self.get_database_connection()
+        if conn:
+            conn.execute(
+                """
+                INSERT INTO domains (domain_name, port, site_type, ssl_enabled, status)
+                VALUES (?, 0, 'static', 0, 'active')
+                ON CONFLICT(domain_name) DO UPDATE SET port = 0, site_type = 'static',
+                    status = 'active'
+            """,
+                (site_name,),
+            )
+            conn.execute(
+                """
+                INSERT INTO deployment_logs (domain_name, action, status, message)
+                VALUES (?, 'deploy', 'success', 'Static export published')
+            """,
+                (site_name,),
+            )
+            conn.commit()
+            conn.close()
+
+        for name in sorted(os.listdir(releases_dir), reverse=True)[
+            CONFIG["releases_to_keep"] :
+        ]:
+            shutil.rmtree(f"{releases_dir}/{name}", ignore_errors=True)
+            print(f"   🧹 Pruned old static export {name}")
+        return public_path
+
+    def domain_exists(self, domain_name):
+        """Whether a domain is deployed (has a live row in the domains table)"""
+        conn = self.get_database_connection()
+        if not conn:
+            return False
+        row = conn.execute(
+            "SELECT 1 FROM domains WHERE domain_name = ? AND status != 'removed'",
+            (domain_name,),
+        ).fetchone()
+        conn.close()
+        return row is not None
+
+    def ssl_enabled(self, domain_name):
+        """Whether a domain has an issued certificate and an HTTPS vhost"""
+        conn = self.get_database_connection()
+        if not conn:
+            return False
+        row = conn.execute(
+            "SELECT ssl_enabled FROM domains WHERE domain_name = ?", (domain_name,)
+        ).fetchone()
+        conn.close()
+        return bool(row and row[0])
+
+    def write_static_vhost(self, site_name, public_path):
+        """Per-site static server block for a site, enabled and reloaded"""
+        nginx_file = f"{CONFIG['nginx_sites_dir']}/{site_name}"
+        enabled_file = f"{CONFIG['nginx_enabled_dir']}/{site_name}"
+        try:
+            self.templates.write_if_changed(
+                nginx_file,
+                self.generate_nginx_config(site_name, public_path, 0, "static"),
+            )
+            if os.path.lexists(enabled_file):
+                os.remove(enabled_file)
+            os.symlink(nginx_file, enabled_file)
+        except OSError as e:
+            print(f"   ❌ Failed to write static vhost: {e}")
+            return False
+        if not self.test_nginx_config_safe():
+            print("   ❌ Nginx configuration test failed")
+            return False
+        return self.reload_nginx_safe()
+
+    def assemble_standalone_release(self, project_dir, release_dir):
+        """Release .next/standalone with .next/static and public; False without the output"""
+        standalone_dir = os.path.join(project_dir, ".next", "standalone")
+        if not os.path.isfile(os.path.join(standalone_dir, "server.js")):
+            return False
+        # The standalone server expects the static assets beside it but
+        # leaves copying them (for a CDN, or not) to the deployer
+        shutil.copytree(
+            standalone_dir,
+            release_dir,
+            symlinks=True,
+            copy_function=self.link_or_copy,
+        )
+        for relative in (os.path.join(".next", "static"), "public"):
+            source = os.path.join(project_dir, relative)
+            if os.path.isdir(source):
+                shutil.copytree(
+                    source,
+                    os.path.join(release_dir, relative),
+                    copy_function=self.link_or_copy,
+                    dirs_exist_ok=True,
+                )
+        return True
+
+    def is_standalone_release(self, release_dir):
+        """A Next.js standalone release: server.js and the build, no next.config"""
+        return (
+            os.path.isfile(os.path.join(release_dir, "server.js"))
+            and os.path.isfile(
+                os.path.join(release_dir, ".next", "required-server-files.json")
+            )
+            and not any(
+                os.path.exists(os.path.join(release_dir, name))
+                for name in self.NEXT_CONFIG_FILES
+            )
+        )
 
     def setup_database(self):
         """Initialize SQLite database"""
@@ -1352,11 +5744,100 @@ www-data ALL=(ALL) NOPASSWD: /bin/systemctl * nodejs-*
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 );
                 
+                CREATE TABLE IF NOT EXISTS vhost_routes (
+                    host TEXT PRIMARY KEY,
+                    site_name TEXT NOT NULL,
+                    site_class TEXT NOT NULL,
+                    target TEXT NOT NULL,
+                    app_root TEXT,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+                
+                CREATE TABLE IF NOT EXISTS certificate_domains (
+                    domain_name TEXT PRIMARY KEY,
+                    cert_name TEXT NOT NULL,
+                    config_dir TEXT NOT NULL,
+                    issued_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+                
+                CREATE TABLE IF NOT EXISTS certificates (
+                    cert_name TEXT NOT NULL,
+                    config_dir TEXT NOT NULL,
+                    cert_path TEXT NOT NULL,
+                    sans TEXT NOT NULL,
+                    issuer TEXT,
+                    serial TEXT,
+                    not_before TIMESTAMP,
+                    not_after TIMESTAMP NOT NULL,
+                    renew_at TIMESTAMP NOT NULL,
+                    file_mtime REAL,
+                    last_renewal_at TIMESTAMP,
+                    last_renewal_error TEXT,
+                    indexed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (config_dir, cert_name)
+                );
+                
+                CREATE TABLE IF NOT EXISTS port_allocations (
+                    port INTEGER PRIMARY KEY,
+                    site_name TEXT,
+                    state TEXT DEFAULT 'free',
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+                
+                CREATE TABLE IF NOT EXISTS app_wakes (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    site_name TEXT NOT NULL,
+                    cold_start_ms INTEGER NOT NULL,
+                    ready BOOLEAN NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+                
+                CREATE TABLE IF NOT EXISTS app_restart_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    site_name TEXT NOT NULL,
+                    port INTEGER,
+                    restarts INTEGER NOT NULL,
+                    exit_code INTEGER,
+                    reason TEXT,
+                    log_tail TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+                
+                CREATE TABLE IF NOT EXISTS deploy_stage_timings (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    site_name TEXT NOT NULL,
+                    tenant TEXT,
+                    job_class TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    seconds REAL NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+                
+                CREATE TABLE IF NOT EXISTS npm_install_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    template TEXT NOT NULL,
+                    lockfile_hash TEXT,
+                    strategy TEXT NOT NULL,
+                    success BOOLEAN NOT NULL,
+                    seconds REAL NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+                
                 CREATE INDEX IF NOT EXISTS idx_domains_name ON domains(domain_name);
                 CREATE INDEX IF NOT EXISTS idx_domains_status ON domains(status);
                 CREATE INDEX IF NOT EXISTS idx_logs_domain ON deployment_logs(domain_name);
                 CREATE INDEX IF NOT EXISTS idx_logs_created ON deployment_logs(created_at);
                 CREATE INDEX IF NOT EXISTS idx_logs_status ON deployment_logs(status);
+                CREATE INDEX IF NOT EXISTS idx_routes_site ON vhost_routes(site_name);
+                CREATE INDEX IF NOT EXISTS idx_cert_domains_cert ON certificate_domains(cert_name);
+                CREATE INDEX IF NOT EXISTS idx_certificates_renew ON certificates(renew_at);
+                CREATE INDEX IF NOT EXISTS idx_certificates_expiry ON certificates(not_after);
+                CREATE INDEX IF NOT EXISTS idx_ports_free ON port_allocations(port) WHERE site_name IS NULL;
+                CREATE INDEX IF NOT EXISTS idx_ports_site ON port_allocations(site_name);
+                CREATE INDEX IF NOT EXISTS idx_wakes_created ON app_wakes(created_at);
+                CREATE INDEX IF NOT EXISTS idx_restarts_site ON app_restart_events(site_name, created_at);
+                CREATE INDEX IF NOT EXISTS idx_stage_timings_class ON deploy_stage_timings(job_class, site_name);
+                CREATE INDEX IF NOT EXISTS idx_npm_history_template ON npm_install_history(template, lockfile_hash);
             """
             )
 
@@ -1494,7 +5975,7 @@ WorkingDirectory={service_dir}
 Environment=PATH=/usr/bin:/bin:/usr/local/bin
 Environment=PYTHONUNBUFFERED=1
 Environment=FLASK_ENV=production
-ExecStart=/usr/bin/python3 {target_script} --api --api-port 5000
+ExecStart=/usr/bin/python3 {target_script} --api --api-port 5000 --routing-mode {CONFIG["nginx_routing_mode"]} --acme-server {CONFIG["acme_directory_url"]}{"" if CONFIG["acme_verify_ssl"] else " --acme-insecure"}
 ExecReload=/bin/kill -HUP $MAINPID
 Restart=always
 RestartSec=3
@@ -1639,8 +6120,22 @@ WantedBy=multi-user.target
 
             print(f"   Created optimized index.html")
 
+            self.precompress_static_assets([public_path])
+
             # Create nginx config (only if not read-only)
-            if not self.readonly_filesystem:
+            if not self.readonly_filesystem and CONFIG["nginx_routing_mode"] == "map":
+                if site_type == "static":
+                    routed = self.set_vhost_route(
+                        [domain_name], domain_name, "static", public_path
+                    )
+                else:
+                    routed = self.set_vhost_route(
+                        [domain_name], domain_name, "proxy", f"127.0.0.1:{port}"
+                    )
+                if not routed:
+                    print("   ❌ Consolidated nginx routing failed")
+                    return False
+            elif not self.readonly_filesystem:
                 nginx_config = self.generate_nginx_config(
                     domain_name, public_path, port, site_type
                 )
@@ -1648,8 +6143,7 @@ WantedBy=multi-user.target
                 nginx_file = f"{CONFIG['nginx_sites_dir']}/{domain_name}"
 
                 try:
-                    with open(nginx_file, "w") as f:
-                        f.write(nginx_config)
+                    self.templates.write_if_changed(nginx_file, nginx_config)
                     print(f"   Created nginx config: {nginx_file}")
                 except PermissionError as e:
                     print(f"   ❌ Failed to create nginx config: {e}")
@@ -1744,107 +6238,370 @@ WantedBy=multi-user.target
             print(f"❌ Deployment failed: {e}")
             import traceback
 
-            traceback.print_exc()
+            traceback.print_exc()
+            return False
+
+    def nginx_supports_brotli(self):
+        """Check whether the installed nginx has the ngx_brotli module"""
+        if CONFIG["nginx_brotli_static"] is not None:
+            return CONFIG["nginx_brotli_static"]
+
+        try:
+            result = subprocess.run(
+                [self.get_nginx_binary_path(), "-V"], capture_output=True, text=True
+            )
+            # nginx -V prints its build configuration to stderr; distro packages
+            # load brotli as a dynamic module instead
+            modules_dir = "/etc/nginx/modules-enabled"
+            dynamic_modules = (
+                os.listdir(modules_dir) if os.path.isdir(modules_dir) else []
+            )
+            CONFIG["nginx_brotli_static"] = "brotli" in (
+                result.stderr + result.stdout
+            ) or any("brotli" in name for name in dynamic_modules)
+        except Exception:
+            CONFIG["nginx_brotli_static"] = False
+
+        return CONFIG["nginx_brotli_static"]
+
+    def precompress_static_assets(self, directories):
+        """Precompress static files to .gz (and .br) for gzip_static/brotli_static"""
+        candidates = {}  # path -> the directory whose manifest records it
+        extensions = tuple(CONFIG["precompress_extensions"])
+        orphans = 0
+
+        for directory in directories:
+            if not directory or not os.path.isdir(directory):
+                continue
+            # Only outputs an earlier pass wrote are ours to remove: shipped
+            # files such as sitemap.xml.gz never appear in the manifest
+            for relative in self.read_precompress_manifest(directory):
+                output = os.path.join(directory, relative)
+                if os.path.exists(output) and not os.path.exists(output[:-3]):
+                    # Its source was deleted: gzip_static would keep serving it
+                    os.remove(output)
+                    orphans += 1
+            for root, _dirs, files in os.walk(directory):
+                for name in files:
+                    if name.lower().endswith(extensions):
+                        candidates[os.path.join(root, name)] = directory
+
+        if orphans:
+            print(f"   🧹 Removed {orphans} compressed file(s) without a source")
+        stats = {
+            "files": len(candidates),
+            "gzip": 0,
+            "brotli": 0,
+            "saved_bytes": 0,
+            "orphans_removed": orphans,
+        }
+        outputs = {directory: [] for directory in directories if directory}
+        if candidates:
+            print(f"🗜️  Precompressing {len(candidates)} static files...")
+            if brotli is None:
+                print("   ⚠️  brotli module not installed - creating .gz files only")
+
+        with ThreadPoolExecutor(max_workers=CONFIG["precompress_workers"]) as pool:
+            for path, result in zip(
+                candidates, pool.map(self._precompress_file, candidates)
+            ):
+                stats["gzip"] += result["gzip"]
+                stats["brotli"] += result["brotli"]
+                stats["saved_bytes"] += result["saved_bytes"]
+                directory = candidates[path]
+                outputs[directory] += [
+                    os.path.relpath(output, directory) for output in result["outputs"]
+                ]
+        for directory, written in outputs.items():
+            if os.path.isdir(directory):
+                self.write_precompress_manifest(directory, written)
+        if not candidates:
+            return stats
+
+        print(
+            f"   ✅ Precompressed: {stats['gzip']} .gz, {stats['brotli']} .br "
+            f"({stats['saved_bytes'] // 1024} KB saved per full transfer)"
+        )
+        return stats
+
+    PRECOMPRESS_MANIFEST = ".hosting-precompressed"  # Hidden: nginx denies dotfiles
+
+    def read_precompress_manifest(self, directory):
+        """Relative paths of the .gz/.br files earlier passes wrote in a directory"""
+        try:
+            with open(os.path.join(directory, self.PRECOMPRESS_MANIFEST), "r") as f:
+                return [
+                    line
+                    for line in f.read().splitlines()
+                    if line.endswith((".gz", ".br")) and not line.startswith("..")
+                ]
+        except OSError:
+            return []
+
+    def write_precompress_manifest(self, directory, outputs):
+        """Record the .gz/.br files this pass wrote, for the next pass to prune"""
+        path = os.path.join(directory, self.PRECOMPRESS_MANIFEST)
+        if not outputs:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        self.templates.write_if_changed(
+            path, "".join(f"{o}\n" for o in sorted(outputs))
+        )
+
+    def _precompress_file(self, path):
+        """Write .gz/.br siblings for one file, skipping outputs that don't shrink"""
+        result = {"gzip": 0, "brotli": 0, "saved_bytes": 0, "outputs": []}
+
+        try:
+            source_stat = os.stat(path)
+            if source_stat.st_size < CONFIG["precompress_min_size"]:
+                return result
+
+            encoders = [("gzip", ".gz", lambda data: gzip.compress(data, 9, mtime=0))]
+            if brotli is not None:
+                encoders.append(
+                    ("brotli", ".br", lambda data: brotli.compress(data, quality=11))
+                )
+
+            data = None
+            for encoding, suffix, compress in encoders:
+                target = path + suffix
+
+                # Up to date from a previous run - nothing to do
+                if (
+                    os.path.exists(target)
+                    and os.stat(target).st_mtime == source_stat.st_mtime
+                ):
+                    result[encoding] += 1
+                    result["outputs"].append(target)
+                    continue
+
+                if data is None:
+                    with open(path, "rb") as f:
+                        data = f.read()
+
+                compressed = compress(data)
+                if len(compressed) >= len(data):
+                    # Not worth serving; drop any stale output from earlier deploys
+                    if os.path.exists(target):
+                        os.remove(target)
+                    continue
+
+                temp_target = f"{target}.tmp-{os.getpid()}"
+                with open(temp_target, "wb") as f:
+                    f.write(compressed)
+                os.utime(temp_target, (source_stat.st_atime, source_stat.st_mtime))
+                os.replace(temp_target, target)
+
+                result[encoding] += 1
+                result["outputs"].append(target)
+                result["saved_bytes"] += len(data) - len(compressed)
+
+        except Exception as e:
+            print(f"   ⚠️  Could not precompress {path}: {e}")
+
+        return result
+
+    def generate_nginx_config(
+        self, domain_name, public_path, port, site_type, ssl_enabled=False
+    ):
+        """Generate nginx configuration"""
+        if ssl_enabled:
+            tls_params = {
+                "redirect_server": self.templates.render(
+                    "tls_redirect_server",
+                    domain_name=domain_name,
+                    acme_webroot=CONFIG["acme_webroot"],
+                ),
+                "listen": "listen 443 ssl http2;",
+                "tls": self.render_tls_profile(domain_name),
+            }
+        else:
+            tls_params = {"redirect_server": "", "listen": "listen 80;", "tls": ""}
+
+        if site_type == "static":
+            return self.templates.render(
+                "static_vhost",
+                domain_name=domain_name,
+                public_path=public_path,
+                brotli_static=self._brotli_static_directive(),
+                acme_webroot=CONFIG["acme_webroot"],
+                **tls_params,
+            )
+        else:
+            return self.templates.render(
+                "proxy_vhost",
+                domain_name=domain_name,
+                port=port,
+                acme_webroot=CONFIG["acme_webroot"],
+                **tls_params,
+            )
+
+    def get_certificate_paths(self, domain_name):
+        """Locate the issued certificate files for a domain"""
+        live_dir = f"{CONFIG['letsencrypt_live_dir']}/{domain_name}"
+
+        # Bulk-issued certificates live in a shard's certbot config dir and
+        # may be a SAN certificate named after another host
+        conn = self.get_database_connection()
+        if conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT cert_name, config_dir FROM certificate_domains WHERE domain_name = ?",
+                (domain_name,),
+            )
+            row = cursor.fetchone()
+            conn.close()
+            if row:
+                live_dir = f"{row[1]}/live/{row[0]}"
+
+        return {
+            "certificate": f"{live_dir}/fullchain.pem",
+            "key": f"{live_dir}/privkey.pem",
+            "chain": f"{live_dir}/chain.pem",
+        }
+
+    def render_tls_profile(self, domain_name):
+        """Render the tuned TLS directives for a domain's HTTPS server block"""
+        profile = CONFIG["tls_profile"]
+        paths = self.get_certificate_paths(domain_name)
+
+        ocsp_stapling = ""
+        if profile["ocsp_stapling"]:
+            ocsp_stapling = self.templates.render(
+                "tls_ocsp_stapling",
+                ssl_trusted_certificate=paths["chain"],
+                resolver=profile["resolver"],
+            )
+
+        return self.templates.render(
+            "tls_profile",
+            ssl_certificate=paths["certificate"],
+            ssl_certificate_key=paths["key"],
+            ssl_protocols=profile["protocols"],
+            ssl_ciphers=profile["ciphers"],
+            ssl_ecdh_curve=profile["ecdh_curve"],
+            ssl_session_cache=profile["session_cache"],
+            ssl_session_timeout=profile["session_timeout"],
+            ssl_session_tickets=profile["session_tickets"],
+            ocsp_stapling=ocsp_stapling,
+        )
+
+    def apply_tls_profile(self, domain_name, port, site_type):
+        """Render a domain's HTTPS vhost with the TLS profile, test and reload"""
+        return self.apply_tls_profiles([(domain_name, port, site_type)])
+
+    def apply_tls_profiles(self, entries):
+        """Render HTTPS vhosts for (domain, port, site_type) entries, test and reload once"""
+        previous = {}
+        created_links = []
+
+        for domain_name, port, site_type in entries:
+            public_path = f"{CONFIG['web_root']}/{domain_name}/public"
+            nginx_config = self.generate_nginx_config(
+                domain_name, public_path, port, site_type, ssl_enabled=True
+            )
+
+            nginx_file = f"{CONFIG['nginx_sites_dir']}/{domain_name}"
+            enabled_file = f"{CONFIG['nginx_enabled_dir']}/{domain_name}"
+
+            old_content = None
+            if os.path.exists(nginx_file):
+                with open(nginx_file, "r") as f:
+                    old_content = f.read()
+
+            if self.templates.write_if_changed(nginx_file, nginx_config):
+                previous[nginx_file] = old_content
+            if not os.path.lexists(enabled_file):
+                os.symlink(nginx_file, enabled_file)
+                created_links.append(enabled_file)
+
+        if not previous and not created_links:
+            print(f"   ✅ TLS profile already applied to {len(entries)} vhost(s)")
+            return True
+
+        print(f"   🔐 Applied TLS profile to {len(previous)} vhost(s)")
+
+        if not self.test_nginx_config_safe():
+            print("   ❌ TLS vhosts failed nginx test - restoring previous configs")
+            for link in created_links:
+                if os.path.islink(link):
+                    os.remove(link)
+            for path, old_content in previous.items():
+                if old_content is None:
+                    os.remove(path)
+                else:
+                    with open(path, "w") as f:
+                        f.write(old_content)
+            return False
+
+        if not self.reload_nginx_safe():
             return False
 
-    def generate_nginx_config(self, domain_name, public_path, port, site_type):
-        """Generate nginx configuration"""
+        # HTTPS hosts need their own server block for the certificate, so they
+        # leave the consolidated port-80 routes once the new vhost is live
+        if CONFIG["nginx_routing_mode"] == "map":
+            self.remove_vhost_routes(*[entry[0] for entry in entries])
+        return True
+
+    def upstream_servers(self, ports):
+        """upstream {} server lines; a failed instance is skipped for 5s"""
+        return "".join(
+            f"    server 127.0.0.1:{port} max_fails=1 fail_timeout=5s;\n"
+            for port in ports
+        )
 
-        if site_type == "static":
-            return f"""# Static site configuration for {domain_name}
-server {{
-    listen 80;
-    server_name {domain_name};
-    root {public_path};
-    index index.html index.htm;
-    
-    # Security headers
-    add_header X-Frame-Options "SAMEORIGIN" always;
-    add_header X-Content-Type-Options "nosniff" always;
-    add_header X-XSS-Protection "1; mode=block" always;
-    add_header Referrer-Policy "strict-origin-when-cross-origin" always;
-    
-    # Performance optimizations
-    location / {{
-        try_files $uri $uri/ =404;
-        expires 1h;
-        add_header Cache-Control "public, no-transform";
-    }}
-    
-    # Static assets with long-term caching
-    location ~* \\.(css|js|png|jpg|jpeg|gif|ico|svg|woff|woff2|ttf|eot|webp|avif)$ {{
-        expires 1y;
-        add_header Cache-Control "public, immutable";
-        add_header Vary Accept-Encoding;
-    }}
-    
-    # Gzip compression
-    location ~* \\.(css|js|html|xml|txt|json)$ {{
-        gzip on;
-        gzip_vary on;
-        gzip_min_length 1024;
-        gzip_comp_level 6;
-        gzip_types text/plain text/css text/xml text/javascript application/javascript application/xml+rss application/json;
-    }}
-    
-    # Security: Prevent access to hidden files
-    location ~ /\\. {{
-        deny all;
-        access_log off;
-        log_not_found off;
-    }}
-    
-    # Security: Prevent access to backup files
-    location ~* \\.(bak|backup|old|tmp)$ {{
-        deny all;
-        access_log off;
-        log_not_found off;
-    }}
-}}"""
-        else:
-            return f"""# Reverse proxy configuration for {domain_name}
-server {{
-    listen 80;
-    server_name {domain_name};
-    
-    # Security headers
-    add_header X-Frame-Options "SAMEORIGIN" always;
-    add_header X-Content-Type-Options "nosniff" always;
-    add_header X-XSS-Protection "1; mode=block" always;
-    add_header Referrer-Policy "strict-origin-when-cross-origin" always;
-    
-    # Main application proxy
-    location / {{
-        proxy_pass http://localhost:{port};
-        proxy_http_version 1.1;
-        proxy_set_header Upgrade $http_upgrade;
-        proxy_set_header Connection 'upgrade';
-        proxy_set_header Host $host;
-        proxy_set_header X-Real-IP $remote_addr;
-        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
-        proxy_set_header X-Forwarded-Proto $scheme;
-        proxy_cache_bypass $http_upgrade;
-        proxy_read_timeout 86400;
-        proxy_connect_timeout 60s;
-        proxy_send_timeout 60s;
-        
-        # Buffer settings for better performance
-        proxy_buffering on;
-        proxy_buffer_size 8k;
-        proxy_buffers 8 8k;
-    }}
-    
-    # Health check endpoint
-    location /health {{
-        access_log off;
-        return 200 "healthy\\n";
-        add_header Content-Type text/plain;
-    }}
-}}"""
+    def generate_app_proxy_config(self, site_name, ports, app_dir=None):
+        """Generate the reverse proxy vhost for a deployed Node.js app"""
+        if not isinstance(ports, (list, tuple)):
+            ports = [ports]
+
+        # Serve the app's precompressed build output and public/ straight
+        # from disk; everything else falls through to the Node.js process
+        static_locations = ""
+        app_location = "location /"
+        if app_dir:
+            static_locations = self.templates.render(
+                "app_static_locations",
+                app_dir=app_dir,
+                brotli_static=self._brotli_static_directive(),
+            )
+            app_location = "location @app"
+
+        return self.templates.render(
+            "app_proxy_vhost",
+            server_names=f"{site_name}.yourdomain.com {site_name}",
+            static_locations=static_locations,
+            app_location=app_location,
+            upstream_name=f"hosting_app_{re.sub(r'[^A-Za-z0-9_]', '_', site_name)}",
+            servers=self.upstream_servers(ports),
+            web_root=CONFIG["web_root"],
+            acme_webroot=CONFIG["acme_webroot"],
+            **self.app_hibernation_params(site_name),
+        )
 
-    def setup_nginx_proxy(self, site_name, port):
+    def app_hibernation_params(self, site_name):
+        """Access log and wake hook parameters for an app's proxy server block"""
+        return {
+            "site_name": site_name,
+            "nginx_access_log": CONFIG["nginx_access_log"],
+            "app_access_log": self.app_access_log(site_name),
+            "app_access_log_dir": CONFIG["app_access_log_dir"],
+            "wake_api_address": CONFIG["wake_api_address"],
+            # Build-on-start apps may take the unit's full 300s to answer
+            "wake_timeout": max(CONFIG["readiness_timeout"], 300) + 30,
+        }
+
+    def _brotli_static_directive(self):
+        return "\n    brotli_static on;" if self.nginx_supports_brotli() else ""
+
+    def setup_nginx_proxy(self, site_name, port, app_dir=None):
         """Configure nginx as reverse proxy for Node.js app - with read-only support"""
         try:
+            # port may be a list: every instance joins the site's upstream
+            ports = port if isinstance(port, (list, tuple)) else [port]
+            port = ",".join(str(p) for p in ports)
             print(f"🔧 Setting up nginx proxy for {site_name} -> localhost:{port}")
 
             # Skip nginx config in read-only mode
@@ -1859,67 +6616,37 @@ server {{
                 print("❌ Nginx is not properly installed")
                 return False
 
-            nginx_config = f"""# Nginx proxy configuration for {site_name}
-server {{
-    listen 80;
-    server_name {site_name}.yourdomain.com {site_name};
-    
-    # Security headers
-    add_header X-Frame-Options "SAMEORIGIN" always;
-    add_header X-Content-Type-Options "nosniff" always;
-    add_header X-XSS-Protection "1; mode=block" always;
-    add_header Referrer-Policy "strict-origin-when-cross-origin" always;
-    
-    # Main application proxy
-    location / {{
-        proxy_pass http://localhost:{port};
-        proxy_http_version 1.1;
-        proxy_set_header Upgrade $http_upgrade;
-        proxy_set_header Connection 'upgrade';
-        proxy_set_header Host $host;
-        proxy_set_header X-Real-IP $remote_addr;
-        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
-        proxy_set_header X-Forwarded-Proto $scheme;
-        proxy_cache_bypass $http_upgrade;
-        proxy_read_timeout 86400;
-        proxy_connect_timeout 60s;
-        proxy_send_timeout 60s;
-        
-        # Buffer settings for better performance
-        proxy_buffering on;
-        proxy_buffer_size 8k;
-        proxy_buffers 8 8k;
-    }}
-    
-    # Health check endpoint
-    location /health {{
-        access_log off;
-        return 200 "healthy\\n";
-        add_header Content-Type text/plain;
-    }}
-    
-    # Static assets if they exist
-    location /static/ {{
-        alias {CONFIG['web_root']}/{site_name}/static/;
-        expires 1y;
-        add_header Cache-Control "public, immutable";
-    }}
-}}
-"""
+            if CONFIG["nginx_routing_mode"] == "map":
+                return self.set_vhost_route(
+                    [f"{site_name}.yourdomain.com", site_name],
+                    site_name,
+                    "proxy",
+                    ",".join(f"127.0.0.1:{p}" for p in ports),
+                    app_dir,
+                )
+
+            nginx_config = self.generate_app_proxy_config(site_name, ports, app_dir)
 
+            if not os.path.isdir(CONFIG["app_access_log_dir"]):
+                self.create_directory_with_permissions(CONFIG["app_access_log_dir"])
             os.makedirs(CONFIG["nginx_sites_dir"], exist_ok=True)
             os.makedirs(CONFIG["nginx_enabled_dir"], exist_ok=True)
 
             config_path = f"{CONFIG['nginx_sites_dir']}/{site_name}"
+            enabled_path = f"{CONFIG['nginx_enabled_dir']}/{site_name}"
             try:
-                with open(config_path, "w") as f:
-                    f.write(nginx_config)
-                print(f"   ✅ Nginx config written: {config_path}")
+                changed = self.templates.write_if_changed(config_path, nginx_config)
             except PermissionError:
                 print(f"   ❌ Permission denied writing nginx config")
                 return False
 
-            enabled_path = f"{CONFIG['nginx_enabled_dir']}/{site_name}"
+            if not changed and os.path.realpath(enabled_path) == os.path.realpath(
+                config_path
+            ):
+                print(f"   ✅ Nginx config unchanged: {config_path} (no reload)")
+                return True
+            print(f"   ✅ Nginx config written: {config_path}")
+
             try:
                 if os.path.exists(enabled_path) or os.path.islink(enabled_path):
                     os.remove(enabled_path)
@@ -1932,35 +6659,632 @@ server {{
                     subprocess.run(
                         ["sudo", "ln", "-s", config_path, enabled_path], check=True
                     )
-                    print(f"   ✅ Site enabled with sudo: {enabled_path}")
-                except subprocess.CalledProcessError as e:
-                    print(f"   ❌ Failed to enable site: {e}")
-                    return False
+                    print(f"   ✅ Site enabled with sudo: {enabled_path}")
+                except subprocess.CalledProcessError as e:
+                    print(f"   ❌ Failed to enable site: {e}")
+                    return False
+
+            print("   🧪 Testing nginx configuration...")
+            if not self.test_nginx_config_safe():
+                print(f"   ❌ Nginx config test failed - removing config")
+                try:
+                    os.remove(config_path)
+                    if os.path.exists(enabled_path):
+                        os.remove(enabled_path)
+                except:
+                    pass
+                return False
+
+            print("   🔄 Reloading nginx service...")
+            if not self.reload_nginx_safe():
+                print(f"   ❌ Nginx reload failed")
+                return False
+
+            print(
+                f"✅ Nginx proxy configured successfully: {site_name} -> localhost:{port}"
+            )
+            return True
+
+        except Exception as e:
+            print(f"❌ Nginx proxy configuration failed: {str(e)}")
+            return False
+
+    def rerender_all_vhosts(self):
+        """Re-render every managed vhost from the current templates in one pass"""
+        summary = {"rendered": 0, "changed": 0, "reloaded": False}
+
+        if self.readonly_filesystem:
+            print("🔒 Read-only mode: nginx vhosts are not managed")
+            return summary
+
+        map_mode = CONFIG["nginx_routing_mode"] == "map"
+        if map_mode:
+            summary["reloaded"] = self.render_vhost_routes()
+
+        print("🔄 Re-rendering nginx vhosts from templates...")
+        configs = {}
+
+        conn = self.get_database_connection()
+        if conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT domain_name, port, site_type, ssl_enabled
+                FROM domains
+                WHERE status = 'active'
+            """
+            )
+            for domain_name, port, site_type, ssl_enabled in cursor.fetchall():
+                # In map mode only HTTPS hosts keep a per-site server block
+                if map_mode and not ssl_enabled:
+                    continue
+                public_path = f"{CONFIG['web_root']}/{domain_name}/public"
+                configs[f"{CONFIG['nginx_sites_dir']}/{domain_name}"] = (
+                    self.generate_nginx_config(
+                        domain_name, public_path, port, site_type, bool(ssl_enabled)
+                    )
+                )
+            conn.close()
+
+        # Node.js apps deployed through the API keep their settings on disk
+        apps_dir = self.deployment_apps_dir()
+        if os.path.isdir(apps_dir) and not map_mode:
+            for site_name in sorted(os.listdir(apps_dir)):
+                info_file = f"{apps_dir}/{site_name}/deployment.json"
+                if not os.path.exists(info_file):
+                    continue
+                with open(info_file, "r") as f:
+                    info = json.load(f)
+                configs[f"{CONFIG['nginx_sites_dir']}/{site_name}"] = (
+                    self.generate_app_proxy_config(
+                        site_name,
+                        [i["port"] for i in self.app_instances(site_name, info)],
+                        info["cwd"],
+                    )
+                )
+
+        previous = {}
+        for path, content in configs.items():
+            old_content = None
+            if os.path.exists(path):
+                with open(path, "r") as f:
+                    old_content = f.read()
+            if self.templates.write_if_changed(path, content):
+                previous[path] = old_content
+        summary["rendered"] = len(configs)
+        summary["changed"] = len(previous)
+
+        if not previous:
+            print(f"   ✅ {len(configs)} vhosts up to date - no reload needed")
+            return summary
+
+        if not self.test_nginx_config_safe():
+            print("   ❌ Re-rendered vhosts failed nginx test - restoring previous")
+            for path, old_content in previous.items():
+                if old_content is None:
+                    os.remove(path)
+                else:
+                    with open(path, "w") as f:
+                        f.write(old_content)
+            return summary
+
+        summary["reloaded"] = self.reload_nginx_safe()
+        print(
+            f"   ✅ {len(previous)}/{len(configs)} vhosts changed, nginx reloaded once"
+        )
+        return summary
+
+    def set_vhost_route(self, host_names, site_name, site_class, target, app_root=None):
+        """Add or update consolidated (map mode) routes for a site and re-render
+
+        When nginx rejects the result the site's previous routes are put back,
+        so the next render of another site does not revive the failing config.
+        """
+        with VHOST_ROUTES_LOCK:
+            previous = self.site_vhost_routes(site_name)
+            if self._set_vhost_route(
+                host_names, site_name, site_class, target, app_root
+            ):
+                return True
+            if previous is not None:
+                self.restore_vhost_routes(site_name, previous)
+            return False
+
+    def site_vhost_routes(self, site_name):
+        """A site's vhost_routes rows, or None without a database"""
+        conn = self.get_database_connection()
+        if not conn:
+            return None
+        rows = conn.execute(
+            """
+            SELECT host, site_name, site_class, target, app_root
+            FROM vhost_routes WHERE site_name = ?
+        """,
+            (site_name,),
+        ).fetchall()
+        conn.close()
+        return rows
+
+    def restore_vhost_routes(self, site_name, rows):
+        """Put back the vhost_routes rows a failed route change replaced"""
+        conn = self.get_database_connection()
+        if not conn:
+            return
+        conn.execute("DELETE FROM vhost_routes WHERE site_name = ?", (site_name,))
+        conn.executemany(
+            """
+            INSERT OR REPLACE INTO vhost_routes (host, site_name, site_class, target, app_root)
+            VALUES (?, ?, ?, ?, ?)
+        """,
+            rows,
+        )
+        conn.commit()
+        conn.close()
+        print(f"   ↩️  Restored the previous routes of {site_name}")
+
+    def _set_vhost_route(self, host_names, site_name, site_class, target, app_root):
+        """set_vhost_route without the lock and the rollback"""
+        try:
+            conn = self.get_database_connection()
+            if not conn:
+                print("   ❌ Database unavailable - cannot update vhost routes")
+                return False
+
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM vhost_routes WHERE site_name = ?", (site_name,))
+            cursor.executemany(
+                """
+                INSERT OR REPLACE INTO vhost_routes (host, site_name, site_class, target, app_root)
+                VALUES (?, ?, ?, ?, ?)
+            """,
+                [
+                    (host, site_name, site_class, target, app_root)
+                    for host in host_names
+                ],
+            )
+            cursor.execute(
+                "SELECT 1 FROM domains WHERE domain_name = ? AND ssl_enabled = 1",
+                (site_name,),
+            )
+            https = cursor.fetchone() is not None
+            port = (
+                0
+                if site_class == "static"
+                else int(target.split(",")[0].rsplit(":", 1)[1])
+            )
+            if https:
+                # Later TLS re-renders (renewals, profile changes) read this row
+                cursor.execute(
+                    "UPDATE domains SET port = ?, site_type = ? WHERE domain_name = ?",
+                    (port, site_class, site_name),
+                )
+            conn.commit()
+            conn.close()
+
+            if https:
+                # The per-site file is the domain's HTTPS server block: point it
+                # at the new target rather than falling back to plain HTTP
+                print(f"   🔐 {site_name} has HTTPS - re-applying its TLS vhost")
+                return self.apply_tls_profile(site_name, port, site_class)
+
+            # A leftover plain-HTTP server block would shadow the map entries
+            for leftover in [
+                f"{CONFIG['nginx_enabled_dir']}/{site_name}",
+                f"{CONFIG['nginx_sites_dir']}/{site_name}",
+            ]:
+                if os.path.lexists(leftover):
+                    os.remove(leftover)
+                    print(f"   Removed per-site config: {leftover}")
+
+            print(f"   🗺️  Routed {', '.join(host_names)} -> {target} ({site_class})")
+            return self.render_vhost_routes()
+
+        except Exception as e:
+            print(f"   ❌ Failed to update vhost routes: {e}")
+            return False
+
+    def remove_vhost_routes(self, *site_names):
+        """Drop sites' consolidated (map mode) routes and re-render once"""
+        with VHOST_ROUTES_LOCK:
+            try:
+                conn = self.get_database_connection()
+                if not conn:
+                    return False
+
+                cursor = conn.cursor()
+                cursor.executemany(
+                    "DELETE FROM vhost_routes WHERE site_name = ?",
+                    [(site_name,) for site_name in site_names],
+                )
+                removed = cursor.rowcount
+                conn.commit()
+                conn.close()
+
+                if removed:
+                    return self.render_vhost_routes()
+                return True
+
+            except Exception as e:
+                print(f"   ❌ Failed to remove vhost routes: {e}")
+                return False
+
+    def render_vhost_routes(self):
+        """Render every map-mode route into one nginx include, then test and reload"""
+        with VHOST_ROUTES_LOCK:
+            conn = self.get_database_connection()
+            if not conn:
+                return False
+
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT host, site_class, target, app_root, site_name
+                FROM vhost_routes
+                ORDER BY host
+            """
+            )
+            routes = cursor.fetchall()
+            conn.close()
+
+            static_routes = [r for r in routes if r[1] == "static"]
+            proxy_routes = [r for r in routes if r[1] == "proxy"]
+
+            # nginx sizes its hashes up front; keep max_size a power of two above the
+            # number of names so lookups stay O(1) and startup never overflows
+            hash_max_size = 512
+            while hash_max_size < len(routes) * 2:
+                hash_max_size *= 2
+            bucket_size = CONFIG["nginx_server_names_hash_bucket_size"]
+
+            def map_block(variable, entries):
+                return self.templates.render(
+                    "routes_map",
+                    variable=variable,
+                    entries="".join(
+                        f"    {host} {value};\n" for host, value in entries
+                    ),
+                )
+
+            def server_names(entries):
+                return "".join(f"\n        {entry[0]}" for entry in entries)
+
+            # A multi-instance target ("ip:port,ip:port") becomes a named upstream;
+            # proxy_pass with a variable resolves upstream names before addresses
+            upstreams = ""
+            pools = {}
+            for target in sorted({r[2] for r in proxy_routes if "," in r[2]}):
+                name = f"hosting_pool_{hashlib.sha1(target.encode()).hexdigest()[:12]}"
+                pools[target] = name
+                upstreams += self.templates.render(
+                    "app_upstream",
+                    upstream_name=name,
+                    servers=self.upstream_servers(
+                        [address.split(":")[1] for address in target.split(",")]
+                    ),
+                )
+
+            maps = "\n".join(
+                [
+                    map_block(
+                        "hosting_static_root", [(r[0], r[2]) for r in static_routes]
+                    ),
+                    map_block(
+                        "hosting_upstream",
+                        [(r[0], pools.get(r[2], r[2])) for r in proxy_routes],
+                    ),
+                    map_block(
+                        "hosting_app_root", [(r[0], r[3]) for r in proxy_routes if r[3]]
+                    ),
+                    map_block("hosting_site", [(r[0], r[4]) for r in proxy_routes]),
+                ]
+            )
+
+            servers = ""
+            if static_routes:
+                servers += self.templates.render(
+                    "routes_static_server",
+                    server_names=server_names(static_routes),
+                    brotli_static=self._brotli_static_directive(),
+                    acme_webroot=CONFIG["acme_webroot"],
+                )
+            if proxy_routes:
+                servers += self.templates.render(
+                    "routes_proxy_server",
+                    server_names=server_names(proxy_routes),
+                    brotli_static=self._brotli_static_directive(),
+                    acme_webroot=CONFIG["acme_webroot"],
+                    **self.app_hibernation_params("$hosting_site"),
+                )
+
+            config = self.templates.render(
+                "routes_include",
+                host_count=len(routes),
+                static_count=len(static_routes),
+                proxy_count=len(proxy_routes),
+                hash_max_size=hash_max_size,
+                bucket_size=bucket_size,
+                upstreams=upstreams,
+                maps=maps,
+                servers=servers,
+            )
+
+            routes_file = CONFIG["nginx_routes_file"]
+            previous = None
+            if os.path.exists(routes_file):
+                with open(routes_file, "r") as f:
+                    previous = f.read()
+
+            os.makedirs(os.path.dirname(routes_file), exist_ok=True)
+            # Logs with $hosting_site in their path are opened by the workers
+            if proxy_routes and not os.path.isdir(CONFIG["app_access_log_dir"]):
+                self.create_directory_with_permissions(CONFIG["app_access_log_dir"])
+            if not self.templates.write_if_changed(routes_file, config):
+                print(f"   ✅ Routes unchanged: {routes_file} (no reload)")
+                return True
+            print(f"   ✅ Rendered {len(routes)} routes into {routes_file}")
+
+            if not self.test_nginx_config_safe():
+                print(
+                    "   ❌ Consolidated routes failed nginx test - restoring previous"
+                )
+                if previous is None:
+                    os.remove(routes_file)
+                else:
+                    with open(routes_file, "w") as f:
+                        f.write(previous)
+                return False
+
+            return self.reload_nginx_safe()
+
+    def registrable_domain(self, domain_name):
+        """Approximate the registrable domain that a host's SAN group is keyed by"""
+        labels = domain_name.lower().rstrip(".").split(".")
+        if len(labels) > 2 and ".".join(labels[-2:]) in self.MULTI_LABEL_SUFFIXES:
+            return ".".join(labels[-3:])
+        return ".".join(labels[-2:])
+
+    def plan_certificates(self, domain_names, group_sans=True):
+        """Group domains into certificates of at most acme_max_sans names each"""
+        groups = {}
+        for domain_name in domain_names:
+            key = self.registrable_domain(domain_name) if group_sans else domain_name
+            groups.setdefault(key, []).append(domain_name)
+
+        max_sans = max(1, CONFIG["acme_max_sans"])
+        plan = []
+        for key in sorted(groups):
+            names = sorted(set(groups[key]))
+            chunks = [names[i : i + max_sans] for i in range(0, len(names), max_sans)]
+            for index, chunk in enumerate(chunks):
+                cert_name = key if index == 0 else f"{key}-{index + 1}"
+                plan.append({"cert_name": cert_name, "domains": chunk})
+        return plan
+
+    def certificate_config_dir(self, cert_name):
+        """Pick the certbot config dir (shard) a new certificate lineage lives in"""
+        # certbot holds a lock on its config dir, so concurrent issuance needs
+        # one dir per worker; hashing keeps a lineage on the same shard
+        shards = max(1, CONFIG["acme_workers"])
+        shard = int(hashlib.sha1(cert_name.encode("utf-8")).hexdigest(), 16) % shards
+        return f"{CONFIG['acme_state_dir']}/shard-{shard}/config"
+
+    def run_per_shard(self, jobs, handler):
+        """Call handler(job) for every job: shards in parallel, in order within one"""
+        # certbot holds a lock on its config dir, so two jobs for the same shard
+        # must never overlap
+        shards = {}
+        for job in jobs:
+            shards.setdefault(job["config_dir"], []).append(job)
+
+        def run_shard(shard_jobs):
+            for job in shard_jobs:
+                handler(job)
+
+        with ThreadPoolExecutor(max_workers=max(1, CONFIG["acme_workers"])) as pool:
+            list(pool.map(run_shard, shards.values()))
+
+    def issue_certificate(self, cert_name, domain_names, config_dir):
+        """Request one certificate over http-01 via the shared webroot"""
+        self.acme_limiter.acquire()
+
+        shard_dir = os.path.dirname(config_dir)
+        email = CONFIG["acme_email"] or f"admin@{domain_names[0]}"
+        command = [
+            "certbot",
+            "certonly",
+            "--webroot",
+            "-w",
+            CONFIG["acme_webroot"],
+            "--cert-name",
+            cert_name,
+            "--server",
+            CONFIG["acme_directory_url"],
+            "--config-dir",
+            config_dir,
+            "--work-dir",
+            f"{shard_dir}/work",
+            "--logs-dir",
+            f"{shard_dir}/logs",
+            "--non-interactive",
+            "--agree-tos",
+            "--email",
+            email,
+            "--keep-until-expiring",
+        ]
+        if not CONFIG["acme_verify_ssl"]:
+            command.append("--no-verify-ssl")
+        for domain_name in domain_names:
+            command.extend(["-d", domain_name])
+
+        started = time.time()
+        result = subprocess.run(command, capture_output=True, text=True)
+        return {
+            "cert_name": cert_name,
+            "domains": domain_names,
+            "config_dir": config_dir,
+            "success": result.returncode == 0,
+            "error": result.stderr.strip()[-500:] if result.returncode != 0 else None,
+            "seconds": round(time.time() - started, 1),
+        }
+
+    def add_ssl_bulk(self, domain_names, group_sans=True, progress=None):
+        """Issue certificates for many domains concurrently, then reload nginx once"""
+        summary = {
+            "requested": len(domain_names),
+            "certificates": [],
+            "issued": [],
+            "failed": {},
+            "reloaded": False,
+        }
+
+        if self.readonly_filesystem:
+            print("🔒 Read-only mode: SSL certificate setup skipped")
+            for domain_name in domain_names:
+                summary["failed"][domain_name] = "read-only filesystem"
+            return summary
+
+        conn = self.get_database_connection()
+        if not conn:
+            print("❌ Could not connect to database")
+            for domain_name in domain_names:
+                summary["failed"][domain_name] = "database unavailable"
+            return summary
+
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT domain_name, port, site_type FROM domains WHERE status = 'active'"
+        )
+        active = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+        cursor.execute(
+            "SELECT domain_name, cert_name, config_dir FROM certificate_domains"
+        )
+        existing = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+        conn.close()
+
+        requested = []
+        for domain_name in dict.fromkeys(domain_names):
+            if domain_name in active:
+                requested.append(domain_name)
+            else:
+                summary["failed"][domain_name] = "domain not deployed"
+
+        plan = self.plan_certificates(requested, group_sans)
+
+        # Re-issuing an existing lineage replaces its names, so keep the hosts it
+        # already covers and reuse its config dir
+        for cert in plan:
+            lineage = [
+                name
+                for name, (cert_name, _) in existing.items()
+                if cert_name == cert["cert_name"] and name in active
+            ]
+            cert["domains"] = sorted(set(cert["domains"]) | set(lineage))
+            if lineage:
+                cert["config_dir"] = existing[lineage[0]][1]
+            else:
+                cert["config_dir"] = self.certificate_config_dir(cert["cert_name"])
+
+        if not plan:
+            return summary
+
+        print(
+            f"🔒 Issuing {len(plan)} certificate(s) for {len(requested)} domain(s) "
+            f"via {CONFIG['acme_directory_url']}"
+        )
+
+        # Challenges are answered from the webroot location in every vhost; this
+        # is a no-op (no reload) once all vhosts carry the location
+        os.makedirs(
+            f"{CONFIG['acme_webroot']}/.well-known/acme-challenge", exist_ok=True
+        )
+        self.rerender_all_vhosts()
+
+        results = []
+        results_lock = threading.Lock()
+
+        def issue(cert):
+            os.makedirs(cert["config_dir"], exist_ok=True)
+            result = self.issue_certificate(
+                cert["cert_name"], cert["domains"], cert["config_dir"]
+            )
+            status = "✅" if result["success"] else "❌"
+            print(
+                f"   {status} {result['cert_name']} ({len(result['domains'])} names, {result['seconds']}s)"
+            )
+            with results_lock:
+                results.append(result)
+                if progress:
+                    progress(result, len(results), len(plan))
+
+        self.run_per_shard(plan, issue)
+
+        issued = []
+        for result in results:
+            summary["certificates"].append(
+                {
+                    key: result[key]
+                    for key in ("cert_name", "domains", "success", "error", "seconds")
+                }
+            )
+            for domain_name in result["domains"]:
+                if result["success"]:
+                    issued.append(
+                        (domain_name, result["cert_name"], result["config_dir"])
+                    )
+                else:
+                    summary["failed"][domain_name] = result["error"]
 
-            print("   🧪 Testing nginx configuration...")
-            if not self.test_nginx_config_safe():
-                print(f"   ❌ Nginx config test failed - removing config")
-                try:
-                    os.remove(config_path)
-                    if os.path.exists(enabled_path):
-                        os.remove(enabled_path)
-                except:
-                    pass
-                return False
+        if not issued:
+            return summary
 
-            print("   🔄 Reloading nginx service...")
-            if not self.reload_nginx_safe():
-                print(f"   ❌ Nginx reload failed")
-                return False
+        conn = self.get_database_connection()
+        if conn:
+            cursor = conn.cursor()
+            cursor.executemany(
+                """
+                INSERT OR REPLACE INTO certificate_domains (domain_name, cert_name, config_dir)
+                VALUES (?, ?, ?)
+            """,
+                issued,
+            )
+            conn.commit()
+            conn.close()
 
-            print(
-                f"✅ Nginx proxy configured successfully: {site_name} -> localhost:{port}"
+        # Every new HTTPS vhost is written first, then one test and one reload
+        entries = [(name, *active[name]) for name, _, _ in issued]
+        if not self.apply_tls_profiles(entries):
+            for domain_name, _, _ in issued:
+                summary["failed"][domain_name] = "HTTPS vhost could not be applied"
+            return summary
+        summary["reloaded"] = True
+        summary["issued"] = sorted(name for name, _, _ in issued)
+
+        conn = self.get_database_connection()
+        if conn:
+            cursor = conn.cursor()
+            cursor.executemany(
+                "UPDATE domains SET ssl_enabled = 1 WHERE domain_name = ?",
+                [(name,) for name, _, _ in issued],
             )
-            return True
+            cursor.executemany(
+                """
+                INSERT INTO deployment_logs (domain_name, action, status, message)
+                VALUES (?, 'ssl_add', 'success', ?)
+            """,
+                [
+                    (name, f"Certificate {cert_name} issued via webroot")
+                    for name, cert_name, _ in issued
+                ],
+            )
+            conn.commit()
+            conn.close()
 
-        except Exception as e:
-            print(f"❌ Nginx proxy configuration failed: {str(e)}")
-            return False
+        self.index_certificates()
+        print(
+            f"✅ {len(summary['issued'])} domain(s) secured, "
+            f"{len(summary['failed'])} failed, nginx reloaded once"
+        )
+        return summary
 
     def add_ssl(self, domain_name):
         """Add Let's Encrypt SSL certificate to domain - skip in read-only mode"""
@@ -1976,54 +7300,304 @@ server {{
 
             print(f"🔒 Adding Let's Encrypt SSL certificate to {domain_name}...")
 
-            conn = self.get_database_connection()
-            if conn:
-                cursor = conn.cursor()
+            # Same webroot path as bulk issuance: certbot never touches nginx, and
+            # the HTTPS vhost is rendered from our own TLS profile
+            summary = self.add_ssl_bulk([domain_name], group_sans=False)
+            if domain_name not in summary["issued"]:
+                error = summary["failed"].get(domain_name, "unknown error")
+                print(f"❌ SSL certificate request failed: {error}")
+                return False
+
+            print(f"✅ SSL certificate successfully added to {domain_name}!")
+            print(f"🌐 Visit: https://{domain_name}")
+            return True
+
+        except Exception as e:
+            print(f"❌ SSL setup failed: {e}")
+            return False
+
+    def certbot_config_dirs(self):
+        """Every certbot config dir that may hold managed certificates"""
+        config_dirs = [os.path.dirname(CONFIG["letsencrypt_live_dir"])]
+        state_dir = CONFIG["acme_state_dir"]
+        if os.path.isdir(state_dir):
+            for shard in sorted(os.listdir(state_dir)):
+                if os.path.isdir(f"{state_dir}/{shard}/config/live"):
+                    config_dirs.append(f"{state_dir}/{shard}/config")
+        return config_dirs
+
+    def parse_certificate(self, cert_path):
+        """Read expiry, SANs, issuer and serial from a PEM file via openssl"""
+        result = subprocess.run(
+            [
+                "openssl",
+                "x509",
+                "-in",
+                cert_path,
+                "-noout",
+                "-startdate",
+                "-enddate",
+                "-issuer",
+                "-serial",
+                "-text",
+            ],
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            raise ValueError(result.stderr.strip() or f"Unreadable PEM: {cert_path}")
+
+        fields = {}
+        for line in result.stdout.splitlines():
+            key, sep, value = line.partition("=")
+            if sep and key in ("notBefore", "notAfter", "issuer", "serial"):
+                fields.setdefault(key, value.strip())
+
+        def timestamp(value):
+            parsed = datetime.strptime(" ".join(value.split()[:4]), "%b %d %H:%M:%S %Y")
+            return parsed.strftime("%Y-%m-%d %H:%M:%S")
+
+        return {
+            "not_before": timestamp(fields["notBefore"]),
+            "not_after": timestamp(fields["notAfter"]),
+            "issuer": fields.get("issuer"),
+            "serial": fields.get("serial"),
+            "sans": sorted(set(re.findall(r"DNS:([^,\s]+)", result.stdout))),
+        }
+
+    def certificate_renew_at(self, cert_name, not_after):
+        """Pick a certificate's renewal time: a stable hashed slot in the window"""
+        window = max(1, CONFIG["cert_renew_window_days"] * 86400)
+        slot = int(hashlib.sha1(cert_name.encode("utf-8")).hexdigest(), 16) % window
+        renew_at = datetime.strptime(not_after, "%Y-%m-%d %H:%M:%S") - timedelta(
+            days=CONFIG["cert_renew_before_days"], seconds=slot
+        )
+        return renew_at.strftime("%Y-%m-%d %H:%M:%S")
+
+    def index_certificates(self):
+        """Sync the certificates table with the PEM files on disk"""
+        conn = self.get_database_connection()
+        if not conn:
+            return {"indexed": 0, "parsed": 0, "removed": 0}
+
+        cursor = conn.cursor()
+        cursor.execute("SELECT config_dir, cert_name, file_mtime FROM certificates")
+        known = {(row[0], row[1]): row[2] for row in cursor.fetchall()}
+
+        seen = set()
+        parsed = 0
+        for config_dir in self.certbot_config_dirs():
+            live_dir = f"{config_dir}/live"
+            if not os.path.isdir(live_dir):
+                continue
+            for cert_name in sorted(os.listdir(live_dir)):
+                cert_path = f"{live_dir}/{cert_name}/cert.pem"
+                if not os.path.exists(cert_path):
+                    continue
+                key = (config_dir, cert_name)
+                seen.add(key)
+
+                # Only fork openssl for files that changed since the last pass
+                mtime = os.stat(cert_path).st_mtime
+                if known.get(key) == mtime:
+                    continue
+                try:
+                    info = self.parse_certificate(cert_path)
+                except Exception as e:
+                    print(f"   ⚠️  Could not parse {cert_path}: {e}")
+                    continue
+
                 cursor.execute(
-                    "SELECT domain_name FROM domains WHERE domain_name = ? AND status = 'active'",
-                    (domain_name,),
+                    """
+                    INSERT OR REPLACE INTO certificates
+                        (cert_name, config_dir, cert_path, sans, issuer, serial,
+                         not_before, not_after, renew_at, file_mtime, indexed_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+                """,
+                    (
+                        cert_name,
+                        config_dir,
+                        cert_path,
+                        json.dumps(info["sans"]),
+                        info["issuer"],
+                        info["serial"],
+                        info["not_before"],
+                        info["not_after"],
+                        self.certificate_renew_at(cert_name, info["not_after"]),
+                        mtime,
+                    ),
                 )
-                domain_exists = cursor.fetchone()
-                conn.close()
+                parsed += 1
 
-                if not domain_exists:
-                    print(f"❌ Domain {domain_name} not found. Deploy it first.")
-                    return False
-
-            print("   Requesting SSL certificate from Let's Encrypt...")
-            certbot_command = f"certbot --nginx -d {domain_name} --non-interactive --agree-tos --email admin@{domain_name} --redirect"
+        removed = [key for key in known if key not in seen]
+        cursor.executemany(
+            "DELETE FROM certificates WHERE config_dir = ? AND cert_name = ?", removed
+        )
+        conn.commit()
+        conn.close()
+        return {"indexed": len(seen), "parsed": parsed, "removed": len(removed)}
+
+    def list_certificates(self, expiring_within_days=None):
+        """Certificates from the inventory, soonest expiry first"""
+        conn = self.get_database_connection()
+        if not conn:
+            return []
 
-            result = subprocess.run(
-                certbot_command, shell=True, capture_output=True, text=True
+        query = """
+            SELECT cert_name, config_dir, sans, issuer, serial, not_before,
+                   not_after, renew_at, last_renewal_at, last_renewal_error,
+                   julianday(not_after) - julianday('now')
+            FROM certificates
+        """
+        params = ()
+        if expiring_within_days is not None:
+            query += " WHERE not_after <= datetime('now', ?)"
+            params = (f"+{int(expiring_within_days)} days",)
+        query += " ORDER BY not_after"
+
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+        conn.close()
+
+        certificates = []
+        for row in rows:
+            certificates.append(
+                {
+                    "cert_name": row[0],
+                    "config_dir": row[1],
+                    "sans": json.loads(row[2]),
+                    "issuer": row[3],
+                    "serial": row[4],
+                    "not_before": row[5],
+                    "not_after": row[6],
+                    "days_remaining": round(row[10], 1),
+                    "renew_at": row[7],
+                    "last_renewal_at": row[8],
+                    "last_renewal_error": row[9],
+                }
             )
-            if result.returncode == 0:
-                conn = self.get_database_connection()
-                if conn:
-                    cursor = conn.cursor()
-                    cursor.execute(
-                        "UPDATE domains SET ssl_enabled = 1 WHERE domain_name = ?",
-                        (domain_name,),
-                    )
-                    cursor.execute(
-                        """
-                        INSERT INTO deployment_logs (domain_name, action, status, message)
-                        VALUES (?, 'ssl_add', 'success', 'Let''s Encrypt SSL certificate added successfully')
-                    """,
-                        (domain_name,),
-                    )
-                    conn.commit()
-                    conn.close()
+        return certificates
+
+    def renew_certificate(self, cert_name, config_dir):
+        """Renew one lineage; certbot runs no nginx hooks, the caller reloads"""
+        self.acme_limiter.acquire()
+
+        shard_dir = os.path.dirname(config_dir)
+        command = [
+            "certbot",
+            "renew",
+            "--cert-name",
+            cert_name,
+            "--config-dir",
+            config_dir,
+            "--non-interactive",
+            "--force-renewal",
+            "--no-random-sleep-on-renew",
+        ]
+        if config_dir.startswith(CONFIG["acme_state_dir"]):
+            command += ["--work-dir", f"{shard_dir}/work"]
+            command += ["--logs-dir", f"{shard_dir}/logs"]
+        if not CONFIG["acme_verify_ssl"]:
+            command.append("--no-verify-ssl")
+
+        result = subprocess.run(command, capture_output=True, text=True)
+        if result.returncode != 0:
+            return result.stderr.strip()[-500:] or "certbot renew failed"
+        return None
+
+    def run_renewal_pass(self):
+        """Renew the certificates whose slot has arrived, then reload nginx once"""
+        summary = {"due": 0, "renewed": [], "failed": {}, "reloaded": False}
+        if self.readonly_filesystem:
+            return summary
 
-                print(f"✅ SSL certificate successfully added to {domain_name}!")
-                print(f"🌐 Visit: https://{domain_name}")
-                return True
-            else:
-                print(f"❌ SSL certificate request failed: {result.stderr}")
-                return False
+        self.index_certificates()
 
-        except Exception as e:
-            print(f"❌ SSL setup failed: {e}")
-            return False
+        conn = self.get_database_connection()
+        if not conn:
+            return summary
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT cert_name, config_dir FROM certificates
+            WHERE renew_at <= datetime('now')
+            ORDER BY renew_at
+            LIMIT ?
+        """,
+            (CONFIG["cert_renew_batch_size"],),
+        )
+        due = [{"cert_name": row[0], "config_dir": row[1]} for row in cursor.fetchall()]
+        conn.close()
+
+        summary["due"] = len(due)
+        if not due:
+            return summary
+
+        print(f"🔄 Renewing {len(due)} certificate(s) due for renewal...")
+        lock = threading.Lock()
+
+        def renew(job):
+            error = self.renew_certificate(job["cert_name"], job["config_dir"])
+            with lock:
+                if error:
+                    summary["failed"][job["cert_name"]] = error
+                else:
+                    summary["renewed"].append(job["cert_name"])
+            print(f"   {'❌' if error else '✅'} {job['cert_name']}")
+
+        self.run_per_shard(due, renew)
+
+        conn = self.get_database_connection()
+        if conn:
+            cursor = conn.cursor()
+            # Failures retry later instead of hammering the CA every pass
+            for job in due:
+                error = summary["failed"].get(job["cert_name"])
+                cursor.execute(
+                    """
+                    UPDATE certificates
+                    SET last_renewal_at = CURRENT_TIMESTAMP,
+                        last_renewal_error = ?,
+                        renew_at = CASE WHEN ? IS NULL THEN renew_at
+                                   ELSE datetime('now', ?) END
+                    WHERE cert_name = ? AND config_dir = ?
+                """,
+                    (
+                        error,
+                        error,
+                        f"+{CONFIG['cert_renew_retry_hours']} hours",
+                        job["cert_name"],
+                        job["config_dir"],
+                    ),
+                )
+            conn.commit()
+            conn.close()
+
+        if summary["renewed"]:
+            # New PEMs sit behind the same live/ paths; one reload picks them all up
+            self.index_certificates()
+            summary["reloaded"] = self.reload_nginx_safe()
+
+        print(
+            f"   ✅ {len(summary['renewed'])} renewed, {len(summary['failed'])} failed"
+        )
+        return summary
+
+    def start_renewal_scheduler(self):
+        """Run renewal passes in a daemon thread until renewal_stop is set"""
+
+        def loop():
+            while not self.renewal_stop.is_set():
+                try:
+                    self.run_renewal_pass()
+                except Exception as e:
+                    print(f"⚠️  Certificate renewal pass failed: {e}")
+                self.renewal_stop.wait(CONFIG["cert_renew_check_interval"])
+
+        thread = threading.Thread(target=loop, name="cert-renewal", daemon=True)
+        thread.start()
+        return thread
 
     def list_domains(self):
         """List all deployed domains"""
@@ -2082,6 +7656,9 @@ server {{
         try:
             print(f"🗑️  Removing {domain_name}...")
 
+            if self.remove_app(domain_name):
+                print(f"   ✅ Removed Node.js application: {domain_name}")
+
             if not self.readonly_filesystem:
                 nginx_config = f"{CONFIG['nginx_sites_dir']}/{domain_name}"
                 nginx_enabled = f"{CONFIG['nginx_enabled_dir']}/{domain_name}"
@@ -2093,6 +7670,8 @@ server {{
                 if os.path.exists(nginx_config):
                     os.remove(nginx_config)
                     print(f"   Removed config: {nginx_config}")
+
+                self.remove_vhost_routes(domain_name)
             else:
                 print("   🔒 Read-only mode: nginx configs not removed")
 
@@ -2130,10 +7709,32 @@ server {{
 class SimpleAPI:
     """Simple Flask API server with read-only filesystem support"""
 
+    # Not copied when replaying a request against a woken app
+    HOP_BY_HOP_HEADERS = {
+        "connection",
+        "keep-alive",
+        "proxy-connection",
+        "transfer-encoding",
+        "te",
+        "trailer",
+        "upgrade",
+        "content-length",
+        "x-hosting-original-uri",
+    }
+
     def __init__(self, manager):
         self.manager = manager
         self.app = Flask(__name__)
         CORS(self.app)
+        self.ssl_jobs = {}  # Bulk issuance jobs, polled via /api/ssl/bulk/<id>
+        self.ssl_jobs_lock = threading.Lock()
+        self.deploy_jobs = {}  # Deploys, polled via /api/deploy/jobs/<id>
+        self.deploy_jobs_lock = threading.Lock()
+        self.deploy_job_seq = 0
+        self.deploy_cancels = {}  # Job id -> Event, set to cancel that deploy
+        self.prewarm_job = (
+            None  # Latest golden env prewarm, polled via /api/templates/golden
+        )
         self.setup_routes()
 
     def setup_routes(self):
@@ -2202,334 +7803,83 @@ class SimpleAPI:
                             "ssl_count": ssl_count,
                             "is_root": self.manager.is_root,
                             "current_user": self.manager.current_user,
-                            "database_path": CONFIG["database_path"],
-                            "web_root": CONFIG["web_root"],
-                            "readonly_filesystem": self.manager.readonly_filesystem,
-                            "deployment_enabled": True,
-                        },
-                    }
-                )
-
-            except Exception as e:
-                return jsonify({"success": False, "error": str(e)}), 500
-
-        @self.app.route("/api/deploy/nodejs", methods=["POST"])
-        def deploy_nodejs_app():
-            """Deploy a Node.js application with read-only filesystem support"""
-            try:
-                data = request.json
-                site_name = data["name"]
-                project_files = data["files"]
-                deploy_config = data.get("deployConfig", {})
-
-                if not site_name or not project_files:
-                    return jsonify(
-                        {"success": False, "error": "Missing site name or files"}
-                    )
-
-                timestamp = int(time.time())
-                temp_dir = f"/tmp/deploy_{site_name}_{timestamp}"
-
-                # Always use writable directory for final location in read-only mode
-                if self.manager.readonly_filesystem:
-                    final_dir = f"{CONFIG['web_root']}/{site_name}"
-                else:
-                    # Try traditional locations first
-                    final_dir_candidates = [
-                        f"/var/www/domains/{site_name}",
-                        f"/home/www/domains/{site_name}",
-                        f"/opt/www/domains/{site_name}",
-                        f"{CONFIG['web_root']}/{site_name}",
-                    ]
-
-                    final_dir = None
-                    for candidate in final_dir_candidates:
-                        try:
-                            os.makedirs(candidate, mode=0o755, exist_ok=True)
-                            test_file = os.path.join(candidate, ".write_test")
-                            with open(test_file, "w") as f:
-                                f.write("test")
-                            os.remove(test_file)
-                            final_dir = candidate
-                            break
-                        except:
-                            continue
-
-                    if not final_dir:
-                        final_dir = f"{CONFIG['web_root']}/{site_name}"
-
-                os.makedirs(temp_dir, exist_ok=True)
-                os.makedirs(final_dir, exist_ok=True)
-
-                print(f"🚀 Starting Node.js deployment for {site_name}")
-                print(f"   📁 Temp dir: {temp_dir}")
-                print(f"   📁 Final dir: {final_dir}")
-
-                # Extract project files
-                print("📁 Extracting project files...")
-                self.extract_project_files(project_files, temp_dir)
-
-                # Setup deployment environment
-                print("🔧 Setting up deployment environment...")
-                deploy_env, npm_cache_dir, npm_prefix_dir = (
-                    self.manager.get_npm_environment_for_deployment(
-                        temp_dir, site_name, timestamp
-                    )
-                )
-
-                # Install dependencies
-                print("📦 Installing Node.js dependencies...")
-                install_success, install_error = self.manager.run_npm_install_safely(
-                    temp_dir, deploy_env, npm_cache_dir
-                )
-
-                if not install_success:
-                    print(f"❌ npm install failed: {install_error}")
-                    # Cleanup
-                    for cleanup_dir in [
-                        npm_cache_dir,
-                        npm_prefix_dir,
-                        deploy_env.get("TMPDIR"),
-                        temp_dir,
-                    ]:
-                        if cleanup_dir and os.path.exists(cleanup_dir):
-                            shutil.rmtree(cleanup_dir, ignore_errors=True)
-
-                    return jsonify(
-                        {
-                            "success": False,
-                            "error": f"npm install failed: {install_error[:500]}...",
-                            "details": install_error,
-                        }
-                    )
-
-                print("✅ Dependencies installed successfully")
-
-                # Build if needed
-                package_json_path = os.path.join(temp_dir, "package.json")
-                has_build_script = False
-
-                if os.path.exists(package_json_path):
-                    try:
-                        with open(package_json_path, "r") as f:
-                            package_data = json.load(f)
-                            scripts = package_data.get("scripts", {})
-                            has_build_script = "build" in scripts
-                    except:
-                        pass
-
-                if has_build_script:
-                    print("🔨 Building Node.js application...")
-                    build_result = subprocess.run(
-                        ["npm", "run", "build", "--silent"],
-                        cwd=temp_dir,
-                        env=deploy_env,
-                        capture_output=True,
-                        text=True,
-                        timeout=600,
-                    )
-
-                    if build_result.returncode != 0:
-                        error_msg = build_result.stderr or build_result.stdout
-                        print(f"❌ Build failed: {error_msg}")
-                        # Cleanup
-                        for cleanup_dir in [
-                            npm_cache_dir,
-                            npm_prefix_dir,
-                            deploy_env.get("TMPDIR"),
-                            temp_dir,
-                        ]:
-                            if cleanup_dir and os.path.exists(cleanup_dir):
-                                shutil.rmtree(cleanup_dir, ignore_errors=True)
-
-                        return jsonify(
-                            {
-                                "success": False,
-                                "error": f"npm build failed: {error_msg[:500]}...",
-                                "details": error_msg,
-                            }
-                        )
-                    print("✅ Build completed successfully")
-
-                # Copy to final directory
-                if temp_dir != final_dir:
-                    print(f"📋 Copying to final directory: {final_dir}")
-                    try:
-                        if os.path.exists(final_dir):
-                            shutil.rmtree(final_dir)
-                        shutil.copytree(temp_dir, final_dir)
-                        print(f"✅ Copied to: {final_dir}")
-                    except Exception as copy_error:
-                        print(f"❌ Copy failed: {copy_error}")
-                        final_dir = temp_dir  # Use temp as final
-
-                app_port = deploy_config.get("port", 3000)
-
-                # Start the application
-                print("🚀 Starting Node.js application...")
-
-                # Use appropriate process manager based on read-only status
-                process_manager = None
-
-                if self.manager.readonly_filesystem:
-                    print("   🔒 Using read-only process manager...")
-                    pm_success = self.manager.create_readonly_process_manager(
-                        site_name, final_dir, app_port
-                    )
-                    if pm_success:
-                        process_manager = "readonly-simple"
-                        print("   ✅ Read-only process manager deployment successful")
-                    else:
-                        # Cleanup and return error
-                        for cleanup_dir in [
-                            npm_cache_dir,
-                            npm_prefix_dir,
-                            deploy_env.get("TMPDIR"),
-                        ]:
-                            if cleanup_dir and os.path.exists(cleanup_dir):
-                                shutil.rmtree(cleanup_dir, ignore_errors=True)
-                        if temp_dir != final_dir and os.path.exists(temp_dir):
-                            shutil.rmtree(temp_dir, ignore_errors=True)
-
-                        return jsonify(
-                            {
-                                "success": False,
-                                "error": "Read-only process manager deployment failed",
-                            }
-                        )
-                else:
-                    # Try systemd for regular filesystems
-                    print("   🔄 Using systemd deployment...")
-                    systemd_success = self.manager.create_systemd_app_service(
-                        site_name, final_dir, app_port
-                    )
-                    if systemd_success:
-                        process_manager = "systemd"
-                        print("   ✅ Systemd deployment successful")
-                    else:
-                        # Cleanup and return error
-                        for cleanup_dir in [
-                            npm_cache_dir,
-                            npm_prefix_dir,
-                            deploy_env.get("TMPDIR"),
-                        ]:
-                            if cleanup_dir and os.path.exists(cleanup_dir):
-                                shutil.rmtree(cleanup_dir, ignore_errors=True)
-                        if temp_dir != final_dir and os.path.exists(temp_dir):
-                            shutil.rmtree(temp_dir, ignore_errors=True)
-
-                        return jsonify(
-                            {"success": False, "error": "Systemd deployment failed"}
-                        )
-
-                # Configure nginx proxy
-                print("⚙️ Configuring nginx...")
-                nginx_success = self.setup_nginx_proxy(site_name, app_port)
-
-                if not nginx_success and not self.manager.readonly_filesystem:
-                    print("❌ Nginx configuration failed, stopping application")
-                    if process_manager == "systemd":
-                        self.manager.stop_systemd_app(site_name)
-                    elif process_manager == "readonly-simple":
-                        self.manager.stop_readonly_app(site_name)
-
-                    # Cleanup
-                    for cleanup_dir in [
-                        npm_cache_dir,
-                        npm_prefix_dir,
-                        deploy_env.get("TMPDIR"),
-                    ]:
-                        if cleanup_dir and os.path.exists(cleanup_dir):
-                            shutil.rmtree(cleanup_dir, ignore_errors=True)
-                    if temp_dir != final_dir and os.path.exists(temp_dir):
-                        shutil.rmtree(temp_dir, ignore_errors=True)
-
-                    return jsonify(
-                        {"success": False, "error": "Nginx configuration failed"}
-                    )
-
-                if nginx_success:
-                    print("✅ Nginx configured successfully")
-                else:
-                    print("⚠️  Nginx configuration skipped (read-only mode)")
-
-                # Save deployment configuration
-                print("💾 Saving deployment configuration...")
-                try:
-                    if self.manager.readonly_filesystem:
-                        deployment_info_dir = f"/tmp/nodejs-apps/{site_name}"
-                    else:
-                        deployment_info_dir = f"/var/lib/hosting-apps/{site_name}"
-
-                    os.makedirs(deployment_info_dir, mode=0o755, exist_ok=True)
-
-                    deployment_config = {
-                        "site_name": site_name,
-                        "port": app_port,
-                        "cwd": final_dir,
-                        "process_manager": process_manager,
-                        "created_at": datetime.now().isoformat(),
-                        "readonly_mode": self.manager.readonly_filesystem,
-                    }
-
-                    config_file = f"{deployment_info_dir}/deployment.json"
-                    with open(config_file, "w") as f:
-                        json.dump(deployment_config, f, indent=2)
-
-                    print(f"✅ Configuration saved to {deployment_info_dir}")
-                except Exception as e:
-                    print(f"⚠️  Could not save deployment configuration: {e}")
-
-                # Cleanup temporary directories
-                print("🧹 Cleaning up temporary files...")
-                for cleanup_dir in [
-                    npm_cache_dir,
-                    npm_prefix_dir,
-                    deploy_env.get("TMPDIR"),
-                ]:
-                    if cleanup_dir and os.path.exists(cleanup_dir):
-                        shutil.rmtree(cleanup_dir, ignore_errors=True)
-
-                if temp_dir != final_dir and os.path.exists(temp_dir):
-                    shutil.rmtree(temp_dir, ignore_errors=True)
-
-                print(f"✅ Deployment completed successfully: {site_name}")
-
-                response_data = {
-                    "success": True,
-                    "site_name": site_name,
-                    "domain": f"{site_name}.yourdomain.com",
-                    "port": app_port,
-                    "status": "running",
-                    "process_manager": process_manager,
-                    "url": f"http://{site_name}.yourdomain.com",
-                    "files_path": final_dir,
-                    "web_root_used": CONFIG["web_root"],
-                    "created_at": datetime.now().isoformat(),
-                    "readonly_mode": self.manager.readonly_filesystem,
-                }
-
-                if self.manager.readonly_filesystem:
-                    response_data["notes"] = (
-                        "Deployed in read-only filesystem mode with limited features"
-                    )
-
-                return jsonify(response_data)
-
-            except subprocess.TimeoutExpired:
-                print(f"❌ Deployment timeout for: {site_name}")
-                return jsonify(
-                    {
-                        "success": False,
-                        "error": "Deployment timeout - process took too long",
+                            "database_path": CONFIG["database_path"],
+                            "web_root": CONFIG["web_root"],
+                            "readonly_filesystem": self.manager.readonly_filesystem,
+                            "deployment_enabled": True,
+                        },
                     }
                 )
+
             except Exception as e:
-                print(f"❌ Deployment failed: {str(e)}")
-                import traceback
+                return jsonify({"success": False, "error": str(e)}), 500
 
-                traceback.print_exc()
-                return jsonify({"success": False, "error": str(e)})
+        @self.app.route("/api/deploy/nodejs", methods=["POST"])
+        def deploy_nodejs_app():
+            """Deploy a Node.js application with read-only filesystem support"""
+            data = request.json or {}
+            job = self.create_deploy_job(data.get("name"))
+            if data.get("async"):
+                # Builds may wait in the admission queue: answer now, poll the job
+                threading.Thread(
+                    target=self.run_deploy_job, args=(job, data), daemon=True
+                ).start()
+                return (
+                    jsonify(
+                        {
+                            "success": True,
+                            "job_id": job["job_id"],
+                            "status_url": f"/api/deploy/jobs/{job['job_id']}",
+                        }
+                    ),
+                    202,
+                )
+            return jsonify(self.run_deploy_job(job, data))
+
+        @self.app.route("/api/deploy/jobs", methods=["GET"])
+        def list_deploy_jobs():
+            """Recent deploy jobs with their stage and queue position"""
+            # Deploy threads add and prune jobs: iterate over a snapshot
+            with self.deploy_jobs_lock:
+                jobs = list(self.deploy_jobs.values())
+            jobs = [self.describe_deploy_job(job) for job in jobs]
+            return jsonify(
+                {
+                    "success": True,
+                    "jobs": jobs,
+                    "admission": self.manager.build_admission.snapshot(),
+                }
+            )
+
+        @self.app.route("/api/deploy/jobs/<job_id>/cancel", methods=["POST"])
+        def cancel_deploy_job(job_id):
+            """Cancel a deploy that has not started its release yet"""
+            job = self.deploy_jobs.get(job_id)
+            if not job:
+                return jsonify({"success": False, "error": "Job not found"}), 404
+            cancel = self.deploy_cancels.get(job_id)
+            if not cancel or job["stage"] == "release":
+                return (
+                    jsonify(
+                        {
+                            "success": False,
+                            "error": f"Job is {job['status']} ({job['stage']}) - too late to cancel",
+                        }
+                    ),
+                    409,
+                )
+            cancel.set()
+            self.manager.cancel_pending_deploy(job["site_name"], job_id)
+            self.manager.build_admission.wake()
+            return jsonify({"success": True, "job_id": job_id, "status": "cancelling"})
+
+        @self.app.route("/api/deploy/jobs/<job_id>", methods=["GET"])
+        def get_deploy_job(job_id):
+            """Poll a deploy job"""
+            job = self.deploy_jobs.get(job_id)
+            if not job:
+                return jsonify({"success": False, "error": "Job not found"}), 404
+            return jsonify({"success": True, **self.describe_deploy_job(job)})
 
         @self.app.route("/api/apps/status/<site_name>", methods=["GET"])
         def get_app_status(site_name):
@@ -2554,14 +7904,22 @@ class SimpleAPI:
                     else:
                         is_running = False
 
+                    status = "running" if is_running else "stopped"
+                    if config.get("hibernated_at"):
+                        status = "hibernated"
+                    quarantine = config.get("quarantine")
+                    if quarantine and quarantine.get("until"):
+                        status = "quarantined"
+
                     return jsonify(
                         {
                             "success": True,
                             "site_name": site_name,
-                            "status": "running" if is_running else "stopped",
+                            "status": status,
                             "type": "nodejs",
                             "port": config.get("port"),
                             "process_manager": process_manager,
+                            "quarantine": quarantine,
                             "readonly_mode": config.get("readonly_mode", False),
                         }
                     )
@@ -2629,7 +7987,12 @@ class SimpleAPI:
 
                     process_manager = config.get("process_manager", "unknown")
 
-                    if process_manager == "readonly-simple":
+                    # A manual start overrides crash-loop quarantine
+                    self.manager.lift_quarantine(site_name)
+                    if config.get("hibernated_at"):
+                        woken = self.manager.wake_app(site_name)
+                        success = bool(woken and woken["ready"])
+                    elif process_manager == "readonly-simple":
                         success = self.manager.start_readonly_app(site_name)
                     elif process_manager == "systemd":
                         success = self.manager.start_systemd_app(site_name)
@@ -2644,6 +8007,233 @@ class SimpleAPI:
             except Exception as e:
                 return jsonify({"success": False, "error": str(e)})
 
+        @self.app.route("/api/apps/restart/<site_name>", methods=["POST"])
+        def restart_app(site_name):
+            """Restart an application's instances one at a time"""
+            try:
+                with self.manager.app_lock(site_name):
+                    success = self.manager.restart_app_rolling(site_name)
+                return jsonify({"success": success, "site_name": site_name})
+            except Exception as e:
+                return jsonify({"success": False, "error": str(e)})
+
+        @self.app.route(
+            "/api/apps/wake/<site_name>",
+            methods=["GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
+        )
+        def wake_app(site_name):
+            """Wake a hibernated app; nginx sends the request that found it asleep"""
+            try:
+                woken = self.manager.wake_app(site_name)
+                if not woken:
+                    return jsonify({"success": False, "error": "App not found"}), 404
+                if not woken["ready"]:
+                    return (
+                        jsonify({"success": False, "error": "App failed to wake"}),
+                        503,
+                        {"Retry-After": "5"},
+                    )
+
+                original_uri = request.headers.get("X-Hosting-Original-URI")
+                if not original_uri:
+                    # Called directly, e.g. to warm an app up ahead of traffic
+                    return jsonify(
+                        {
+                            "success": True,
+                            "site_name": site_name,
+                            "woken": woken["woken"],
+                            "cold_start_seconds": round(woken["cold_start"], 3),
+                        }
+                    )
+                return self.forward_to_app(
+                    woken["ports"][0], original_uri, woken["cold_start"]
+                )
+            except Exception as e:
+                return jsonify({"success": False, "error": str(e)}), 500
+
+        @self.app.route("/api/apps/crashes/<site_name>", methods=["GET"])
+        def get_app_crashes(site_name):
+            """Crash-loop classification, quarantine and restart events of an app"""
+            try:
+                return jsonify(
+                    {"success": True, **self.manager.app_crash_report(site_name)}
+                )
+            except Exception as e:
+                return jsonify({"success": False, "error": str(e)})
+
+        @self.app.route("/api/apps/resources", methods=["GET"])
+        def resource_report():
+            """Limits and cgroup-measured usage of every app"""
+            try:
+                return jsonify(
+                    {"success": True, "apps": self.manager.resource_report()}
+                )
+            except Exception as e:
+                return jsonify({"success": False, "error": str(e)})
+
+        @self.app.route("/api/apps/resources/<site_name>", methods=["GET"])
+        def app_resources(site_name):
+            """Limits and cgroup-measured usage of one app's instances"""
+            try:
+                info = self.manager.load_deployment_info(site_name)
+                if not info:
+                    return jsonify({"success": False, "error": "App not found"})
+                return jsonify(
+                    {
+                        "success": True,
+                        **self.manager.app_resource_usage(site_name, info),
+                    }
+                )
+            except Exception as e:
+                return jsonify({"success": False, "error": str(e)})
+
+        @self.app.route("/api/apps/memory", methods=["GET"])
+        def node_memory_report():
+            """Applied and ideal NODE_OPTIONS with measured RSS per app"""
+            try:
+                return jsonify(
+                    {"success": True, "apps": self.manager.node_memory_report()}
+                )
+            except Exception as e:
+                return jsonify({"success": False, "error": str(e)})
+
+        @self.app.route("/api/apps/retune", methods=["POST"])
+        def retune_apps():
+            """Restart apps whose heap size drifted with the host's density"""
+            try:
+                data = request.get_json(silent=True) or {}
+                retuned = self.manager.retune_apps(data.get("site_name"))
+                return jsonify({"success": True, "retuned": retuned})
+            except Exception as e:
+                return jsonify({"success": False, "error": str(e)})
+
+        @self.app.route("/api/templates/prewarm", methods=["POST"])
+        def prewarm_templates():
+            """Build golden envs for the given templates (default: all) in the background"""
+            try:
+                data = request.get_json(silent=True) or {}
+                templates = data.get("templates") or self.manager.generator_templates()
+                unknown = set(templates) - set(self.manager.generator_templates())
+                if unknown:
+                    return (
+                        jsonify(
+                            {
+                                "success": False,
+                                "error": f"Unknown templates: {', '.join(sorted(unknown))}",
+                            }
+                        ),
+                        400,
+                    )
+                if self.prewarm_job and self.prewarm_job["status"] == "running":
+                    return (
+                        jsonify(
+                            {
+                                "success": False,
+                                "error": "A prewarm is already running",
+                                "job": self.prewarm_job,
+                            }
+                        ),
+                        409,
+                    )
+                job = {
+                    "status": "running",
+                    "templates": templates,
+                    "started_at": datetime.now().isoformat(),
+                    "finished_at": None,
+                    "results": None,
+                }
+                self.prewarm_job = job
+
+                def run():
+                    try:
+                        job["results"] = self.manager.prewarm_templates(templates)
+                        job["status"] = (
+                            "completed"
+                            if all(r["success"] for r in job["results"])
+                            else "failed"
+                        )
+                    except Exception as e:
+                        job.update(status="failed", error=str(e))
+                    job["finished_at"] = datetime.now().isoformat()
+
+                threading.Thread(target=run, daemon=True).start()
+                return jsonify({"success": True, "job": job}), 202
+            except Exception as e:
+                return jsonify({"success": False, "error": str(e)})
+
+        @self.app.route("/api/templates", methods=["GET"])
+        def site_templates():
+            """Template ids and current versions a site spec can name"""
+            try:
+                templates = []
+                for name in self.manager.site_templates.templates():
+                    tree = self.manager.site_templates.tree(name)
+                    templates.append(
+                        {
+                            "template": name,
+                            "version": tree["version"],
+                            "files": len(tree["sources"]),
+                        }
+                    )
+                return jsonify({"success": True, "templates": templates})
+            except Exception as e:
+                return jsonify({"success": False, "error": str(e)})
+
+        @self.app.route("/api/blobs", methods=["POST"])
+        def upload_blob():
+            """Store a raw asset once; specs then reference it by sha256"""
+            try:
+                data = request.get_data()
+                if not data:
+                    return jsonify({"success": False, "error": "Empty body"}), 400
+                digest = self.manager.store_blob(data)
+                return jsonify({"success": True, "sha256": digest, "size": len(data)})
+            except Exception as e:
+                return jsonify({"success": False, "error": str(e)})
+
+        @self.app.route("/api/blobs/<digest>", methods=["GET", "HEAD"])
+        def blob_status(digest):
+            """Whether a blob is stored, so clients upload only what is missing"""
+            if not self.manager.has_blob(digest):
+                return jsonify({"success": False, "error": "Blob not found"}), 404
+            return jsonify(
+                {
+                    "success": True,
+                    "sha256": digest,
+                    "size": os.path.getsize(self.manager.blob_path(digest)),
+                }
+            )
+
+        @self.app.route("/api/templates/golden", methods=["GET"])
+        def golden_envs():
+            """Built golden envs and the latest prewarm"""
+            try:
+                return jsonify(
+                    {
+                        "success": True,
+                        "templates": self.manager.generator_templates(),
+                        "golden_envs": self.manager.golden_envs(),
+                        "prewarm": self.prewarm_job,
+                    }
+                )
+            except Exception as e:
+                return jsonify({"success": False, "error": str(e)})
+
+        @self.app.route("/api/apps/hibernation", methods=["GET"])
+        def hibernation_report():
+            """Hibernation state, idle time and cold start latency per app"""
+            try:
+                apps = self.manager.hibernation_report()
+                return jsonify(
+                    {
+                        "success": True,
+                        "apps": apps,
+                        "hibernated": sum(a["state"] == "hibernated" for a in apps),
+                    }
+                )
+            except Exception as e:
+                return jsonify({"success": False, "error": str(e)})
+
         # EXISTING ROUTES with read-only support
         @self.app.route("/api/domains", methods=["GET"])
         def list_domains():
@@ -2781,154 +8371,29 @@ class SimpleAPI:
                 return jsonify({"success": False, "error": str(e)}), 500
 
         @self.app.route("/api/domains/<domain_name>", methods=["DELETE"])
-        def remove_domain(self, domain_name):
+        def remove_domain(domain_name):
             """Remove a domain and stop any associated running applications"""
             try:
-                print(f"🗑️  Removing {domain_name}...")
-
-                # Check if there's a running Node.js app for this domain and stop it
-                print("🔍 Checking for running Node.js applications...")
-
-                # Check in read-only mode location
-                if self.readonly_filesystem:
-                    config_file = f"/tmp/nodejs-apps/{domain_name}/deployment.json"
-                else:
-                    config_file = f"/var/lib/hosting-apps/{domain_name}/deployment.json"
-
-                if os.path.exists(config_file):
-                    try:
-                        with open(config_file, "r") as f:
-                            config = json.load(f)
-
-                        process_manager = config.get("process_manager", "unknown")
-                        print(
-                            f"   📱 Found running app with {process_manager} process manager"
-                        )
-
-                        # Stop the application
-                        if process_manager == "readonly-simple":
-                            if self.stop_readonly_app(domain_name):
-                                print(
-                                    f"   ✅ Stopped read-only managed app: {domain_name}"
-                                )
-                            else:
-                                print(
-                                    f"   ⚠️  Failed to stop read-only managed app: {domain_name}"
-                                )
-                        elif process_manager == "systemd":
-                            if self.stop_systemd_app(domain_name):
-                                print(
-                                    f"   ✅ Stopped systemd service: nodejs-{domain_name}"
-                                )
-                            else:
-                                print(
-                                    f"   ⚠️  Failed to stop systemd service: nodejs-{domain_name}"
-                                )
-
-                        # Remove systemd service file if it exists
-                        if (
-                            process_manager == "systemd"
-                            and not self.readonly_filesystem
-                        ):
-                            service_file = (
-                                f"/etc/systemd/system/nodejs-{domain_name}.service"
-                            )
-                            if os.path.exists(service_file):
-                                try:
-                                    subprocess.run(
-                                        [
-                                            "systemctl",
-                                            "disable",
-                                            f"nodejs-{domain_name}",
-                                        ],
-                                        capture_output=True,
-                                        text=True,
-                                    )
-                                    os.remove(service_file)
-                                    subprocess.run(
-                                        ["systemctl", "daemon-reload"],
-                                        capture_output=True,
-                                        text=True,
-                                    )
-                                    print(
-                                        f"   ✅ Removed systemd service file: {service_file}"
-                                    )
-                                except Exception as e:
-                                    print(
-                                        f"   ⚠️  Could not remove systemd service file: {e}"
-                                    )
-
-                        # Clean up deployment configuration directory
-                        config_dir = os.path.dirname(config_file)
-                        if os.path.exists(config_dir):
-                            shutil.rmtree(config_dir, ignore_errors=True)
-                            print(f"   ✅ Cleaned up deployment config: {config_dir}")
-
-                    except Exception as e:
-                        print(f"   ⚠️  Error stopping application: {e}")
-                else:
-                    print("   ℹ️  No running Node.js application found")
-
-                # Remove nginx configurations
-                if not self.readonly_filesystem:
-                    nginx_config = f"{CONFIG['nginx_sites_dir']}/{domain_name}"
-                    nginx_enabled = f"{CONFIG['nginx_enabled_dir']}/{domain_name}"
-
-                    if os.path.exists(nginx_enabled):
-                        os.remove(nginx_enabled)
-                        print(f"   ✅ Removed enabled site: {nginx_enabled}")
-
-                    if os.path.exists(nginx_config):
-                        os.remove(nginx_config)
-                        print(f"   ✅ Removed nginx config: {nginx_config}")
-                else:
-                    print("   🔒 Read-only mode: nginx configs not removed")
-
-                # Update database
-                conn = self.get_database_connection()
-                if conn:
-                    cursor = conn.cursor()
-                    cursor.execute(
-                        "UPDATE domains SET status = 'removed' WHERE domain_name = ?",
-                        (domain_name,),
-                    )
-                    cursor.execute(
-                        """
-                        INSERT INTO deployment_logs (domain_name, action, status, message)
-                        VALUES (?, 'remove', 'success', 'Domain and associated applications removed successfully')
-                    """,
-                        (domain_name,),
-                    )
-                    conn.commit()
-                    conn.close()
-                    print(f"   ✅ Database updated: {domain_name} marked as removed")
+                # Stops every app instance, drops its units and frees its ports
+                success = self.manager.remove_domain(domain_name)
 
                 # Clean up application files directory if it exists
                 app_files_dir = f"{CONFIG['web_root']}/{domain_name}"
-                if os.path.exists(app_files_dir):
-                    try:
-                        shutil.rmtree(app_files_dir, ignore_errors=True)
-                        print(f"   ✅ Cleaned up application files: {app_files_dir}")
-                    except Exception as e:
-                        print(f"   ⚠️  Could not remove application files: {e}")
-
-                # Reload nginx configuration
-                if not self.readonly_filesystem:
-                    if self.test_nginx_config_safe():
-                        self.reload_nginx_safe()
-                        print("   ✅ Nginx reloaded successfully")
-                    else:
-                        print("   ⚠️  Nginx config test failed after removal")
+                if success and os.path.exists(app_files_dir):
+                    shutil.rmtree(app_files_dir, ignore_errors=True)
+                    print(f"   ✅ Cleaned up application files: {app_files_dir}")
 
-                print(
-                    f"✅ {domain_name} and all associated applications removed successfully!"
-                )
-                print(f"🔄 Domain {domain_name} is now available for reuse")
-                return True
+                if success:
+                    return jsonify(
+                        {
+                            "success": True,
+                            "message": f"{domain_name} and all associated applications removed",
+                        }
+                    )
+                return jsonify({"success": False, "error": "Removal failed"}), 500
 
             except Exception as e:
-                print(f"❌ Removal failed: {e}")
-                return False
+                return jsonify({"success": False, "error": str(e)}), 500
 
         @self.app.route("/api/domains/<domain_name>/ssl", methods=["POST"])
         def add_ssl(domain_name):
@@ -2955,17 +8420,152 @@ class SimpleAPI:
                             "ssl_provider": "Let's Encrypt",
                         }
                     )
-                else:
+                else:
+                    return (
+                        jsonify(
+                            {
+                                "success": False,
+                                "error": "SSL certificate request failed",
+                            }
+                        ),
+                        500,
+                    )
+
+            except Exception as e:
+                return jsonify({"success": False, "error": str(e)}), 500
+
+        @self.app.route("/api/ssl/bulk", methods=["POST"])
+        def add_ssl_bulk():
+            """Issue certificates for many domains in the background"""
+            try:
+                if self.manager.readonly_filesystem:
+                    return (
+                        jsonify(
+                            {
+                                "success": False,
+                                "error": "SSL certificates cannot be managed in read-only filesystem mode",
+                                "readonly_mode": True,
+                            }
+                        ),
+                        400,
+                    )
+
+                data = request.get_json() or {}
+                domain_names = data.get("domains") or []
+                if not isinstance(domain_names, list) or not domain_names:
+                    return (
+                        jsonify(
+                            {
+                                "success": False,
+                                "error": "domains must be a non-empty list",
+                            }
+                        ),
+                        400,
+                    )
+                group_sans = bool(data.get("group_sans", True))
+
+                with self.ssl_jobs_lock:
+                    job_id = f"ssl-{datetime.now().strftime('%Y%m%d%H%M%S')}-{len(self.ssl_jobs) + 1}"
+                    job = {
+                        "job_id": job_id,
+                        "status": "running",
+                        "domains": len(domain_names),
+                        "certificates_done": 0,
+                        "certificates_total": None,
+                        "started_at": datetime.now().isoformat(),
+                        "finished_at": None,
+                        "summary": None,
+                    }
+                    self.ssl_jobs[job_id] = job
+
+                def progress(result, done, total):
+                    job["certificates_done"] = done
+                    job["certificates_total"] = total
+
+                def run_job():
+                    try:
+                        job["summary"] = self.manager.add_ssl_bulk(
+                            domain_names, group_sans, progress
+                        )
+                        job["status"] = "completed"
+                    except Exception as e:
+                        job["status"] = "failed"
+                        job["error"] = str(e)
+                    job["finished_at"] = datetime.now().isoformat()
+
+                threading.Thread(target=run_job, daemon=True).start()
+
+                return (
+                    jsonify(
+                        {
+                            "success": True,
+                            "job_id": job_id,
+                            "status_url": f"/api/ssl/bulk/{job_id}",
+                            "acme_directory": CONFIG["acme_directory_url"],
+                        }
+                    ),
+                    202,
+                )
+
+            except Exception as e:
+                return jsonify({"success": False, "error": str(e)}), 500
+
+        @self.app.route("/api/ssl/bulk/<job_id>", methods=["GET"])
+        def get_ssl_bulk_job(job_id):
+            """Poll a bulk issuance job"""
+            job = self.ssl_jobs.get(job_id)
+            if not job:
+                return jsonify({"success": False, "error": "Job not found"}), 404
+            return jsonify({"success": True, **job})
+
+        @self.app.route("/api/ssl/certificates", methods=["GET"])
+        def list_certificates():
+            """List indexed certificates, optionally only those expiring soon"""
+            try:
+                days = request.args.get("expiring_within_days", None, type=int)
+                certificates = self.manager.list_certificates(days)
+                return jsonify(
+                    {
+                        "success": True,
+                        "certificates": certificates,
+                        "total": len(certificates),
+                        "expiring_within_days": days,
+                    }
+                )
+            except Exception as e:
+                return jsonify({"success": False, "error": str(e)}), 500
+
+        @self.app.route("/api/domains/<domain_name>/precompress", methods=["POST"])
+        def precompress_domain(domain_name):
+            """Precompress a static site's files after new content is uploaded"""
+            try:
+                # Also keeps the name from reaching outside web_root
+                if not self.manager.domain_exists(domain_name):
+                    return (
+                        jsonify({"success": False, "error": "Domain not found"}),
+                        404,
+                    )
+                public_path = f"{CONFIG['web_root']}/{domain_name}/public"
+                if not os.path.isdir(public_path):
                     return (
-                        jsonify(
-                            {
-                                "success": False,
-                                "error": "SSL certificate request failed",
-                            }
-                        ),
-                        500,
+                        jsonify({"success": False, "error": "Site files not found"}),
+                        404,
                     )
 
+                stats = self.manager.precompress_static_assets([public_path])
+                return jsonify(
+                    {"success": True, "domain_name": domain_name, "stats": stats}
+                )
+
+            except Exception as e:
+                return jsonify({"success": False, "error": str(e)}), 500
+
+        @self.app.route("/api/nginx/rerender", methods=["POST"])
+        def rerender_vhosts():
+            """Re-render all vhosts after a template change"""
+            try:
+                summary = self.manager.rerender_all_vhosts()
+                return jsonify({"success": True, **summary})
             except Exception as e:
                 return jsonify({"success": False, "error": str(e)}), 500
 
@@ -3035,6 +8635,572 @@ class SimpleAPI:
                 return jsonify({"success": False, "error": str(e)}), 500
 
     # Helper methods for deployment
+    def create_deploy_job(self, site_name):
+        """Register a deploy so its progress can be polled"""
+        with self.deploy_jobs_lock:
+            cutoff = time.time() - CONFIG["deploy_job_retention"]
+            for job_id, job in list(self.deploy_jobs.items()):
+                finished_at = job["finished_at"]
+                if (
+                    finished_at
+                    and datetime.fromisoformat(finished_at).timestamp() < cutoff
+                ):
+                    del self.deploy_jobs[job_id]
+            self.deploy_job_seq += 1
+            job_id = f"deploy-{datetime.now().strftime('%Y%m%d%H%M%S')}-{self.deploy_job_seq}"
+            job = {
+                "job_id": job_id,
+                "site_name": site_name,
+                "status": "pending",
+                "stage": None,
+                "created_at": datetime.now().isoformat(),
+                "finished_at": None,
+                "error": None,
+            }
+            self.deploy_jobs[job_id] = job
+            self.deploy_cancels[job_id] = threading.Event()
+        return job
+
+    def run_deploy_job(self, job, data):
+        """Run a deploy job to completion and record its outcome"""
+        site_name = data.get("name")
+        cancel = self.deploy_cancels[job["job_id"]]
+        self.enter_stage(job, "site", "queued")
+        superseded_by = self.manager.wait_for_deploy_slot(site_name, job["job_id"])
+        try:
+            if cancel.is_set():
+                # The slot may have been handed over just as the cancel landed
+                superseded_by = None
+                result = {"success": False, "error": "Deploy cancelled"}
+            elif superseded_by:
+                print(
+                    f"⏭️  Deploy {job['job_id']} of {site_name} superseded by {superseded_by}"
+                )
+                result = {
+                    "success": False,
+                    "superseded_by": superseded_by,
+                    "error": f"Superseded by a newer deploy of {site_name}",
+                }
+            else:
+                try:
+                    result = self.deploy_nodejs(job, data, cancel)
+                except Exception as e:
+                    result = {"success": False, "error": str(e)}
+        finally:
+            if not superseded_by:
+                self.manager.release_deploy_slot(site_name, job["job_id"])
+
+        self.deploy_cancels.pop(job["job_id"], None)
+        if superseded_by:
+            job["status"] = "superseded"
+        elif cancel.is_set() and not result.get("success"):
+            job["status"] = "cancelled"
+            result.update(cancelled=True, error="Deploy cancelled")
+        else:
+            job["status"] = "completed" if result.get("success") else "failed"
+        job["error"] = result.get("error")
+        job["finished_at"] = datetime.now().isoformat()
+        self.enter_stage(job, None)
+        if result.get("success"):
+            self.manager.record_stage_timings(job)
+        return {**result, "job_id": job["job_id"]}
+
+    def enter_stage(self, job, stage, status="running"):
+        """Move a job to its next stage, timing the one it leaves"""
+        now = time.time()
+        if job.get("stage") and job.get("stage_started"):
+            job.setdefault("stage_seconds", {})[job["stage"]] = round(
+                now - job["stage_started"], 2
+            )
+        if stage:
+            job.update(stage=stage, status=status, stage_started=now)
+
+    def describe_deploy_job(self, job):
+        """A job as JSON, with its live position in the build queue"""
+        return {
+            **job,
+            **self.manager.build_admission.position(job["job_id"]),
+            "waiting_behind": self.manager.deploy_waiting_behind(
+                job["site_name"], job["job_id"]
+            ),
+        }
+
+    def stage_timeout(self, job, stage):
+        """Seconds a stage may run: its own budget, capped by the job's deadline"""
+        return max(
+            0,
+            min(CONFIG["deploy_stage_timeouts"][stage], job["deadline"] - time.time()),
+        )
+
+    def run_app_build(self, job, project_dir, deploy_env, cancel):
+        """npm run build within the build stage's budget; a timeout is a failed result"""
+        budget = self.stage_timeout(job, "build")
+        try:
+            return self.manager.run_build_step(
+                ["npm", "run", "build", "--silent"],
+                project_dir,
+                deploy_env,
+                budget,
+                cancel,
+            )
+        except subprocess.TimeoutExpired:
+            return subprocess.CompletedProcess(
+                [], -signal.SIGKILL, "", f"timed out after {budget:.0f}s"
+            )
+
+    def deploy_nodejs(self, job, data, cancel=None):
+        """Build and release a Node.js app for one deploy job; returns the response"""
+        cancel = cancel or threading.Event()
+        # Removed on every way out of the deploy, except a release left running
+        temp_dir = release_dir = live_dir = extraction = None
+        scratch_dirs = []
+        try:
+            site_name = data["name"]
+            project_files = data.get("files")
+            site_spec = data.get("spec")
+            deploy_config = data.get("deployConfig", {})
+
+            if not site_name or not (project_files or site_spec):
+                return {"success": False, "error": "Missing site name or files"}
+
+            materialized = None
+            if site_spec:
+                # Only the spec was sent: render it from the cached templates
+                print(f"📐 Rendering {site_name} from site spec...")
+                try:
+                    materialized = self.manager.render_site_spec(site_spec)
+                except ValueError as e:
+                    return {"success": False, "error": f"Invalid site spec: {e}"}
+            template = deploy_config.get("template") or (site_spec or {}).get(
+                "template"
+            )
+
+            timestamp = int(time.time())
+            temp_dir = f"/tmp/deploy_{site_name}_{timestamp}"
+
+            # Always use writable directory for final location in read-only mode
+            if self.manager.readonly_filesystem:
+                final_dir = f"{CONFIG['web_root']}/{site_name}"
+            else:
+                # Try traditional locations first
+                final_dir_candidates = [
+                    f"/var/www/domains/{site_name}",
+                    f"/home/www/domains/{site_name}",
+                    f"/opt/www/domains/{site_name}",
+                    f"{CONFIG['web_root']}/{site_name}",
+                ]
+
+                final_dir = None
+                for candidate in final_dir_candidates:
+                    try:
+                        os.makedirs(candidate, mode=0o755, exist_ok=True)
+                        test_file = os.path.join(candidate, ".write_test")
+                        with open(test_file, "w") as f:
+                            f.write("test")
+                        os.remove(test_file)
+                        final_dir = candidate
+                        break
+                    except:
+                        continue
+
+                if not final_dir:
+                    final_dir = f"{CONFIG['web_root']}/{site_name}"
+
+            os.makedirs(temp_dir, exist_ok=True)
+            os.makedirs(final_dir, exist_ok=True)
+
+            print(f"🚀 Starting Node.js deployment for {site_name}")
+            self.enter_stage(job, "extract")
+            print(f"   📁 Temp dir: {temp_dir}")
+            print(f"   📁 Final dir: {final_dir}")
+
+            # Extract project files
+            print("📁 Extracting project files...")
+            split = (
+                None if materialized else self.split_install_manifests(project_files)
+            )
+            if materialized:
+                # Local copies: nothing left to overlap
+                self.manager.materialize_blobs(materialized["files"], temp_dir)
+                job["materialized"] = {
+                    "template": materialized["template"],
+                    "version": materialized["version"],
+                    "files": len(materialized["files"]),
+                }
+            elif split:
+                # npm only needs the manifests: the sources are written while
+                # the deploy waits for admission and installs dependencies
+                manifests, sources = split
+                self.extract_project_files(manifests, temp_dir)
+                extraction_pool = ThreadPoolExecutor(max_workers=1)
+                extraction = extraction_pool.submit(
+                    self.extract_project_files, sources, temp_dir
+                )
+                extraction_pool.shutdown(wait=False)
+                job["overlapped_extraction"] = True
+                print(f"   ⏩ Installing while {len(sources)} source file(s) extract")
+            else:
+                self.extract_project_files(project_files, temp_dir)
+
+            # Setup deployment environment
+            print("🔧 Setting up deployment environment...")
+            deploy_env, npm_cache_dir, npm_prefix_dir = (
+                self.manager.get_npm_environment_for_deployment(
+                    temp_dir, site_name, timestamp
+                )
+            )
+            scratch_dirs = [npm_cache_dir, npm_prefix_dir, deploy_env.get("TMPDIR")]
+
+            # Builds queue here until the host has room for one more
+            self.enter_stage(job, "admission", "queued")
+            ticket = self.manager.build_ticket(
+                job["job_id"],
+                site_name,
+                temp_dir,
+                deploy_config.get("tenant") or data.get("tenant"),
+            )
+            job.update(
+                tenant=ticket["tenant"],
+                job_class=ticket["job_class"],
+                estimated_seconds=ticket["cost"],
+            )
+            print(
+                f"🚦 Waiting for a build slot ({ticket['job_class']}, ~{ticket['cost']:.0f}s, {ticket['memory'] // 1048576}M estimated)..."
+            )
+            if not self.manager.build_admission.admit(ticket, cancel=cancel):
+                print(f"❌ Build for {site_name} was never admitted")
+                return {
+                    "success": False,
+                    "error": "Build queue wait timed out - host too busy",
+                }
+            self.enter_stage(job, "install")
+            job["deadline"] = time.time() + CONFIG["deploy_timeout"]
+
+            try:
+                # A golden env of the same template skips the install and
+                # warms the build; anything it cannot provide is installed
+                golden = self.manager.find_golden_env(temp_dir, template)
+                if golden:
+                    job["golden_env"] = f"{golden['template']}@{golden['version']}"
+                if golden and self.manager.clone_golden_env(golden, temp_dir):
+                    install_success, install_error = True, ""
+                else:
+                    # Install dependencies
+                    print("📦 Installing Node.js dependencies...")
+                    install_success, install_error = (
+                        self.manager.run_npm_install_safely(
+                            temp_dir,
+                            deploy_env,
+                            npm_cache_dir,
+                            self.stage_timeout(job, "install"),
+                            cancel,
+                            template,
+                        )
+                    )
+
+                if not install_success:
+                    print(f"❌ npm install failed: {install_error}")
+                    return {
+                        "success": False,
+                        "error": f"npm install failed: {install_error[:500]}...",
+                        "details": install_error,
+                    }
+
+                print("✅ Dependencies installed successfully")
+                if extraction:
+                    extraction.result()  # The build needs every source file
+
+                # Build if needed
+                package_json_path = os.path.join(temp_dir, "package.json")
+                has_build_script = False
+
+                if os.path.exists(package_json_path):
+                    try:
+                        with open(package_json_path, "r") as f:
+                            package_data = json.load(f)
+                            scripts = package_data.get("scripts", {})
+                            has_build_script = "build" in scripts
+                    except:
+                        pass
+
+                output = None
+                if has_build_script and ticket["job_class"] == "nextjs-build":
+                    output = self.manager.choose_next_output(temp_dir, deploy_config)
+
+                if has_build_script:
+                    print("🔨 Building Node.js application...")
+                    self.enter_stage(job, "build")
+                    build_result = self.run_app_build(job, temp_dir, deploy_env, cancel)
+
+                    export_dir = os.path.join(temp_dir, "out")
+                    if output == "export" and (
+                        build_result.returncode != 0
+                        or not os.path.isfile(os.path.join(export_dir, "index.html"))
+                    ):
+                        # Rebuild for a Node server; the first build warmed the cache
+                        reason = (build_result.stderr or build_result.stdout or "")[
+                            -500:
+                        ] or "no out/index.html"
+                        print(
+                            f"⚠️  Static export failed, falling back to server mode: {reason}"
+                        )
+                        job["static_export_error"] = reason
+                        shutil.rmtree(export_dir, ignore_errors=True)
+                        output = self.manager.server_output_mode(deploy_config)
+                        if not (
+                            output and self.manager.wrap_next_config(temp_dir, output)
+                        ):
+                            output = None
+                            self.manager.unwrap_next_config(temp_dir)
+                        if not cancel.is_set():
+                            build_result = self.run_app_build(
+                                job, temp_dir, deploy_env, cancel
+                            )
+
+                    if cancel.is_set():
+                        # A killed or skipped build is not a build failure
+                        print(f"🛑 Deploy of {site_name} cancelled during the build")
+                        return {"success": False, "error": "Deploy cancelled"}
+
+                    if build_result.returncode != 0:
+                        error_msg = build_result.stderr or build_result.stdout
+                        print(f"❌ Build failed: {error_msg}")
+                        return {
+                            "success": False,
+                            "error": f"npm build failed: {error_msg[:500]}...",
+                            "details": error_msg,
+                        }
+                    print("✅ Build completed successfully")
+            finally:
+                self.manager.build_admission.release(ticket)
+
+            # Precompress static output so nginx serves it with gzip_static
+            self.manager.precompress_static_assets(
+                [os.path.join(temp_dir, "out")]
+                if output == "export"
+                else [
+                    os.path.join(temp_dir, "public"),
+                    os.path.join(temp_dir, ".next", "static"),
+                ]
+            )
+
+            # Each deploy is a new release directory; the live release keeps
+            # running from its own directory until it has been drained
+            # (a static export is published from the temp dir instead)
+            release_dir = f"{final_dir}/releases/{timestamp}"
+            if output == "export":
+                release_dir = temp_dir
+            else:
+                print(f"📋 Copying to release directory: {release_dir}")
+                try:
+                    if (
+                        output == "standalone"
+                        and self.manager.assemble_standalone_release(
+                            temp_dir, release_dir
+                        )
+                    ):
+                        job["standalone"] = True
+                        print(f"✅ Standalone release assembled: {release_dir}")
+                    else:
+                        os.makedirs(os.path.dirname(release_dir), exist_ok=True)
+                        if output == "standalone":
+                            print(
+                                "⚠️  No .next/standalone output - releasing the full tree"
+                            )
+                            shutil.rmtree(release_dir, ignore_errors=True)
+                        # Hardlinked: the temp dir goes away anyway
+                        shutil.copytree(
+                            temp_dir,
+                            release_dir,
+                            copy_function=self.manager.link_or_copy,
+                        )
+                        if materialized:
+                            # Built and read-only now: safe to share across sites
+                            self.manager.relink_blobs(
+                                materialized["files"], release_dir
+                            )
+                        print(f"✅ Copied to: {release_dir}")
+                except Exception as copy_error:
+                    print(f"❌ Copy failed: {copy_error}")
+                    release_dir = temp_dir  # Run from temp instead
+
+            # Without an explicit port the allocator picks one from the pool
+            app_port = deploy_config.get("port")
+            readiness_path = deploy_config.get("readinessPath")
+            readiness_timeout = deploy_config.get("readinessTimeout")
+
+            # Last point a cancel or the deadline can stop the deploy: once the
+            # release starts it runs to completion or rolls back on its own
+            if cancel.is_set() or time.time() > job["deadline"]:
+                print(f"🛑 Deploy of {site_name} stopped before release")
+                return {
+                    "success": False,
+                    "error": (
+                        "Deploy cancelled"
+                        if cancel.is_set()
+                        else f"Deploy exceeded its {CONFIG['deploy_timeout']}s deadline"
+                    ),
+                }
+
+            if output == "export":
+                # No Node process at all: nginx serves the exported files
+                print("📄 Publishing static export...")
+                self.enter_stage(job, "release")
+                with self.manager.app_lock(site_name):
+                    public_path = self.manager.publish_static_site(
+                        site_name, os.path.join(temp_dir, "out"), timestamp
+                    )
+                if not public_path:
+                    return {
+                        "success": False,
+                        "error": "Static export could not be published",
+                    }
+                job["static_export"] = True
+                print(f"✅ Deployment completed successfully: {site_name} (static)")
+                return {
+                    "success": True,
+                    "site_name": site_name,
+                    "domain": f"{site_name}.yourdomain.com",
+                    "status": "static",
+                    "site_type": "static",
+                    "static_export": True,
+                    "url": f"http://{site_name}.yourdomain.com",
+                    "files_path": os.path.realpath(public_path),
+                    "release": str(timestamp),
+                    "instances": [],
+                    "web_root_used": CONFIG["web_root"],
+                    "created_at": datetime.now().isoformat(),
+                    "readonly_mode": self.manager.readonly_filesystem,
+                }
+
+            # Start the release beside the live one, switch nginx once it is
+            # ready, and drain the previous instance
+            print("🚀 Starting Node.js application...")
+            self.enter_stage(job, "release")
+            # Hibernation and quarantine rewrite deployment.json too
+            with self.manager.app_lock(site_name):
+                release = self.manager.release_app(
+                    site_name,
+                    release_dir,
+                    app_port,
+                    readiness_path,
+                    readiness_timeout,
+                    deploy_config.get("instances"),
+                    deploy_config.get("hibernateAfter"),
+                    resources=deploy_config.get("resources"),
+                )
+
+            if not release:
+                return {
+                    "success": False,
+                    "error": "New release failed to start - previous release still live",
+                }
+
+            app_port = release["port"]
+            process_manager = release["process_manager"]
+            final_dir = release_dir
+
+            live_dir = release_dir
+
+            print(f"✅ Deployment completed successfully: {site_name}")
+
+            response_data = {
+                "success": True,
+                "site_name": site_name,
+                "domain": f"{site_name}.yourdomain.com",
+                "port": app_port,
+                "status": "running",
+                "process_manager": process_manager,
+                "url": f"http://{site_name}.yourdomain.com",
+                "files_path": final_dir,
+                "release": os.path.basename(final_dir),
+                "instances": [i["port"] for i in release["instances"]],
+                "draining_instances": len(release.get("draining", [])),
+                "standalone": bool(job.get("standalone")),
+                "static_export_error": job.get("static_export_error"),
+                "web_root_used": CONFIG["web_root"],
+                "created_at": datetime.now().isoformat(),
+                "readonly_mode": self.manager.readonly_filesystem,
+            }
+
+            if self.manager.readonly_filesystem:
+                response_data["notes"] = (
+                    "Deployed in read-only filesystem mode with limited features"
+                )
+
+            return response_data
+
+        except subprocess.TimeoutExpired:
+            print(f"❌ Deployment timeout for: {site_name}")
+            return {
+                "success": False,
+                "error": "Deployment timeout - process took too long",
+            }
+        except Exception as e:
+            print(f"❌ Deployment failed: {str(e)}")
+            import traceback
+
+            traceback.print_exc()
+            return {"success": False, "error": str(e)}
+        finally:
+            if extraction:
+                extraction.exception()  # Let it finish before removing its dir
+            for cleanup_dir in [*scratch_dirs, temp_dir, release_dir]:
+                if (
+                    cleanup_dir
+                    and cleanup_dir != live_dir
+                    and os.path.exists(cleanup_dir)
+                ):
+                    shutil.rmtree(cleanup_dir, ignore_errors=True)
+
+    INSTALL_MANIFESTS = (
+        "package.json",
+        "package-lock.json",
+        "npm-shrinkwrap.json",
+        ".npmrc",
+    )
+
+    def split_install_manifests(self, files_dict):
+        """(manifests, sources) when npm install can run on the manifests alone
+
+        None when the install needs the sources: lifecycle scripts, workspaces,
+        local file:/link: dependencies, or a bundled node_modules.
+        """
+        manifests = {
+            path: content
+            for path, content in files_dict.items()
+            if path in self.INSTALL_MANIFESTS
+        }
+        try:
+            package_data = json.loads(manifests["package.json"])
+            scripts = package_data.get("scripts") or {}
+            dependencies = {
+                **(package_data.get("dependencies") or {}),
+                **(package_data.get("devDependencies") or {}),
+                **(package_data.get("optionalDependencies") or {}),
+            }
+        except (KeyError, ValueError, AttributeError, TypeError):
+            return None
+
+        if package_data.get("workspaces") or any(
+            name in scripts
+            for name in ("preinstall", "install", "postinstall", "prepare")
+        ):
+            return None
+        if any(
+            str(spec).startswith(("file:", "link:")) for spec in dependencies.values()
+        ):
+            return None
+        if any(path.startswith("node_modules/") for path in files_dict):
+            return None
+
+        sources = {
+            path: content
+            for path, content in files_dict.items()
+            if path not in manifests
+        }
+        return manifests, sources
+
     def extract_project_files(self, files_dict, target_dir):
         """Extract project files from the uploaded data"""
         for file_path, content in files_dict.items():
@@ -3046,10 +9212,41 @@ class SimpleAPI:
 
         print(f"📁 Extracted {len(files_dict)} files to {target_dir}")
 
-    def setup_nginx_proxy(self, site_name, port):
+    def forward_to_app(self, port, uri, cold_start):
+        """Replay the current request against a freshly woken app instance"""
+        headers = {
+            key: value
+            for key, value in request.headers.items()
+            if key.lower() not in self.HOP_BY_HOP_HEADERS
+        }
+        app_request = urllib.request.Request(
+            f"http://127.0.0.1:{port}{uri}",
+            data=request.get_data() or None,
+            headers=headers,
+            method=request.method,
+        )
+        opener = urllib.request.build_opener(NoRedirectHandler)
+        try:
+            app_response = opener.open(app_request, timeout=CONFIG["readiness_timeout"])
+        except urllib.error.HTTPError as e:
+            app_response = e  # 3xx/4xx/5xx answers are passed through as-is
+        except (urllib.error.URLError, OSError) as e:
+            return jsonify({"success": False, "error": f"App unreachable: {e}"}), 502
+
+        with app_response:
+            body = app_response.read()
+            response_headers = [
+                (key, value)
+                for key, value in app_response.headers.items()
+                if key.lower() not in self.HOP_BY_HOP_HEADERS
+            ]
+        response_headers.append(("X-Hosting-Cold-Start", f"{cold_start:.3f}"))
+        return Response(body, status=app_response.getcode(), headers=response_headers)
+
+    def setup_nginx_proxy(self, site_name, port, app_dir=None):
         """Configure nginx as reverse proxy for Node.js app"""
         try:
-            return self.manager.setup_nginx_proxy(site_name, port)
+            return self.manager.setup_nginx_proxy(site_name, port, app_dir)
         except Exception as e:
             print(f"❌ API nginx configuration failed: {str(e)}")
             return False
@@ -3088,11 +9285,29 @@ class SimpleAPI:
         print(f"   DELETE /api/domains/<domain>")
         if not self.manager.readonly_filesystem:
             print(f"   POST /api/domains/<domain>/ssl")
+            print(f"   POST /api/ssl/bulk")
+            print(f"   GET  /api/ssl/certificates")
+        print(f"   POST /api/domains/<domain>/precompress")
+        print(f"   POST /api/nginx/rerender")
         print(f"   GET  /api/logs")
         print(f"   🆕 POST /api/deploy/nodejs")
         print(f"   🆕 GET  /api/apps/status/<site_name>")
         print(f"   🆕 POST /api/apps/start/<site_name>")
         print(f"   🆕 POST /api/apps/stop/<site_name>")
+        print(f"   🆕 POST /api/apps/restart/<site_name>")
+        print(f"   🆕 ANY  /api/apps/wake/<site_name>")
+        print(f"   🆕 GET  /api/apps/hibernation")
+        print(f"   🆕 GET  /api/apps/crashes/<site_name>")
+        print(f"   🆕 GET  /api/apps/resources[/<site_name>]")
+        print(f"   🆕 GET  /api/apps/memory")
+        print(f"   🆕 GET  /api/deploy/jobs[/<job_id>]")
+        print(f"   🆕 POST /api/deploy/jobs/<job_id>/cancel")
+        print(f"   🆕 POST /api/apps/retune")
+        print(f"   🆕 GET  /api/templates")
+        print(f"   🆕 POST /api/blobs")
+        print(f"   🆕 GET  /api/blobs/<sha256>")
+        print(f"   🆕 POST /api/templates/prewarm")
+        print(f"   🆕 GET  /api/templates/golden")
 
         if self.manager.readonly_filesystem:
             print(f"\n🔒 Read-Only Mode Limitations:")
@@ -3100,6 +9315,13 @@ class SimpleAPI:
             print(f"   ❌ Nginx configuration changes limited")
             print(f"   ✅ App deployment and management available")
             print(f"   ✅ Database operations available")
+        else:
+            self.manager.start_renewal_scheduler()
+            print(f"\n🔁 Certificate renewal scheduler running")
+            self.manager.start_hibernation_scheduler()
+            print(f"💤 Idle apps hibernate after {CONFIG['hibernate_after_seconds']}s")
+        self.manager.start_crash_watch()
+        print(f"🩺 Crash-loop watch running every {CONFIG['crash_watch_interval']}s")
 
         try:
             self.app.run(
@@ -3122,11 +9344,35 @@ def main():
     parser.add_argument("--status", action="store_true", help="Show system status")
     parser.add_argument("--list", action="store_true", help="List all domains")
     parser.add_argument("--api", action="store_true", help="Start API server")
+    parser.add_argument(
+        "--prewarm-templates",
+        nargs="*",
+        metavar="TEMPLATE",
+        help="Build golden environments for generator templates (default: all)",
+    )
     parser.add_argument("--api-port", type=int, default=5000, help="API server port")
     parser.add_argument("--api-host", default="0.0.0.0", help="API server host")
+    parser.add_argument(
+        "--routing-mode",
+        choices=["per-site", "map"],
+        default=CONFIG["nginx_routing_mode"],
+        help="nginx vhost layout: per-site server files or one consolidated map include",
+    )
+    parser.add_argument(
+        "--acme-server",
+        default=CONFIG["acme_directory_url"],
+        help="ACME directory URL (e.g. https://localhost:14000/dir for Pebble)",
+    )
+    parser.add_argument(
+        "--acme-insecure",
+        action="store_true",
+        help="Skip TLS verification of the ACME server (Pebble test CA)",
+    )
 
     parser.add_argument(
-        "command", nargs="?", help="Command: deploy, ssl, remove, list, status"
+        "command",
+        nargs="?",
+        help="Command: deploy, ssl, ssl-bulk, certs, renew, restart, hibernate, wake, crashes, usage, memory, retune, supervisor, remove, precompress, routes, rerender, list, status",
     )
     parser.add_argument("domain", nargs="?", help="Domain name")
     parser.add_argument("port", nargs="?", type=int, help="Port number")
@@ -3138,6 +9384,11 @@ def main():
     )
 
     args = parser.parse_args()
+    CONFIG["nginx_routing_mode"] = args.routing_mode
+    CONFIG["acme_directory_url"] = args.acme_server
+    CONFIG["wake_api_address"] = f"127.0.0.1:{args.api_port}"
+    if args.acme_insecure:
+        CONFIG["acme_verify_ssl"] = False
     manager = SimpleHostingManager()
 
     try:
@@ -3176,6 +9427,16 @@ def main():
             api = SimpleAPI(manager)
             api.run(host=args.api_host, port=args.api_port)
 
+        elif args.prewarm_templates is not None:
+            results = manager.prewarm_templates(args.prewarm_templates)
+            for result in results:
+                state = "reused" if result.get("reused") else "built"
+                print(
+                    f"{'✅' if result['success'] else '❌'} {result['template']}@{result.get('version', '-')}: "
+                    + (state if result["success"] else result["error"])
+                )
+            sys.exit(0 if all(r["success"] for r in results) else 1)
+
         elif args.status or (args.command == "status"):
             print("📊 Simple Multi-Domain Hosting Status v2.6:")
             print("=" * 50)
@@ -3249,12 +9510,139 @@ def main():
                 sys.exit(1)
             manager.add_ssl(args.domain)
 
+        elif args.command == "ssl-bulk":
+            if not args.domain:
+                print(
+                    "❌ Usage: python3 simple-hosting.py ssl-bulk <domain,domain,...|@file>"
+                )
+                sys.exit(1)
+            if args.domain.startswith("@"):
+                with open(args.domain[1:], "r") as f:
+                    domain_names = [line.strip() for line in f if line.strip()]
+            else:
+                domain_names = [d.strip() for d in args.domain.split(",") if d.strip()]
+            summary = manager.add_ssl_bulk(domain_names)
+            for domain_name, error in sorted(summary["failed"].items()):
+                print(f"   ❌ {domain_name}: {error}")
+            sys.exit(0 if not summary["failed"] else 1)
+
+        elif args.command == "certs":
+            manager.index_certificates()
+            days = int(args.domain) if args.domain else None
+            certificates = manager.list_certificates(days)
+            print(f"🔒 {len(certificates)} certificate(s):")
+            for cert in certificates:
+                print(
+                    f"   {cert['cert_name']:<40} {cert['days_remaining']:>6}d  {len(cert['sans'])} names  renew {cert['renew_at']}"
+                )
+
+        elif args.command == "renew":
+            summary = manager.run_renewal_pass()
+            sys.exit(0 if not summary["failed"] else 1)
+
         elif args.command == "remove":
             if not args.domain:
                 print("❌ Usage: python3 simple-hosting.py remove <domain>")
                 sys.exit(1)
             manager.remove_domain(args.domain)
 
+        elif args.command == "routes":
+            if CONFIG["nginx_routing_mode"] != "map":
+                print("❌ Consolidated routing is off - use --routing-mode map")
+                sys.exit(1)
+            sys.exit(0 if manager.render_vhost_routes() else 1)
+
+        elif args.command == "restart":
+            if not args.domain:
+                print("❌ Usage: python3 simple-hosting.py restart <site>")
+                sys.exit(1)
+            with manager.app_lock(args.domain):
+                restarted = manager.restart_app_rolling(args.domain)
+            sys.exit(0 if restarted else 1)
+
+        elif args.command == "hibernate":
+            if args.domain:
+                sys.exit(0 if manager.hibernate_app(args.domain) else 1)
+            manager.run_hibernation_pass()
+            for app in manager.hibernation_report():
+                p50 = app["cold_start_p50_ms"]
+                p95 = app["cold_start_p95_ms"]
+                print(
+                    f"   {app['site_name']:<30} {app['state']:<10} idle {app['idle_seconds']:>7}s  wakes {app['wakes_7d']:>4}  cold start p50 {p50 if p50 is not None else '-'}ms p95 {p95 if p95 is not None else '-'}ms"
+                )
+
+        elif args.command == "wake":
+            if not args.domain:
+                print("❌ Usage: python3 simple-hosting.py wake <site>")
+                sys.exit(1)
+            woken = manager.wake_app(args.domain)
+            sys.exit(0 if woken and woken["ready"] else 1)
+
+        elif args.command == "crashes":
+            if not args.domain:
+                print("❌ Usage: python3 simple-hosting.py crashes <site>")
+                sys.exit(1)
+            report = manager.app_crash_report(args.domain)
+            print(
+                f"🩺 {args.domain}: {report['classification']} ({report['restarts_in_window']} restarts in {CONFIG['crash_loop_window']}s)"
+            )
+            if report["quarantine"]:
+                print(f"   🚫 Quarantine level {report['quarantine']['level']}")
+            for event in report["events"][:10]:
+                print(
+                    f"   {event['created_at']}  port {event['port']}  x{event['restarts']}  exit {event['exit_code']}  {event['reason']}"
+                )
+
+        elif args.command == "usage":
+            apps = (
+                [manager.app_resource_usage(args.domain)]
+                if args.domain
+                else manager.resource_report()
+            )
+            for app in apps:
+                totals = app["totals"]
+                limits = app["resources"] or {}
+                print(
+                    f"   {app['site_name']:<30} {limits.get('class', '-'):<9} mem {totals.get('memory_current', 0) // 1048576:>6}M / {limits.get('memory_max', 0) // 1048576}M x{len(app['instances'])}  cpu {totals.get('cpu_usage_usec', 0) / 1e6:>9.1f}s  tasks {totals.get('tasks', 0):>4}  oom {totals.get('oom_kills', 0)}"
+                )
+
+        elif args.command == "memory":
+            for app in manager.node_memory_report():
+                applied = app["applied"] or {}
+                print(
+                    f"   {app['site_name']:<30} heap {applied.get('heap_mb', '-')}M (ideal {app['ideal']['heap_mb']}M){'  ⚠️  stale' if app['stale'] else ''}"
+                )
+                for instance in app["instances"]:
+                    rss = (
+                        f"{instance['rss'] // 1048576}M"
+                        if instance["rss"] is not None
+                        else "unknown"
+                    )
+                    print(
+                        f"      port {instance['port']}: rss {rss} / budget {applied.get('budget_bytes', 0) // 1048576}M"
+                    )
+
+        elif args.command == "retune":
+            retuned = manager.retune_apps(args.domain)
+            print(f"🧠 Retuned {len(retuned)} app(s): {', '.join(retuned) or '-'}")
+
+        elif args.command == "supervisor":
+            sys.exit(0 if AppSupervisor().run() else 1)
+
+        elif args.command == "rerender":
+            manager.rerender_all_vhosts()
+
+        elif args.command == "precompress":
+            if not args.domain:
+                print("❌ Usage: python3 simple-hosting.py precompress <domain>")
+                sys.exit(1)
+            if not manager.domain_exists(args.domain):
+                print(f"❌ Unknown domain: {args.domain}")
+                sys.exit(1)
+            manager.precompress_static_assets(
+                [f"{CONFIG['web_root']}/{args.domain}/public"]
+            )
+
         else:
             print("🚀 Simple Multi-Domain Hosting Platform v2.6 - READ-ONLY EDITION")
             print("=" * 70)
@@ -3268,12 +9656,55 @@ def main():
             print("   --status                             Show system status")
             print("   --list                               List all domains")
             print("   --api                                Start API server")
+            print(
+                "   --prewarm-templates [TEMPLATE ...]   Build golden envs for site templates"
+            )
             print("\n🌐 Domain Management:")
             print("   deploy <domain> <port> <type>        Deploy new domain")
             print(
                 "   ssl <domain>                         Add SSL (disabled in read-only mode)"
             )
+            print(
+                "   ssl-bulk <d1,d2,...|@file>           Issue SAN certificates in parallel"
+            )
+            print(
+                "   certs [days]                         List certificates (expiring within days)"
+            )
+            print(
+                "   renew                                Renew due certificates, reload once"
+            )
             print("   remove <domain>                      Remove domain")
+            print(
+                "   precompress <domain>                 Precompress static files (.gz/.br)"
+            )
+            print(
+                "   routes                               Re-render consolidated map routes"
+            )
+            print(
+                "   rerender                             Re-render all vhosts from templates"
+            )
+            print(
+                "   restart <site>                       Rolling restart of an app's instances"
+            )
+            print(
+                "   hibernate [site]                     Hibernate idle apps (or one), show cold starts"
+            )
+            print("   wake <site>                          Start a hibernated app")
+            print(
+                "   crashes <site>                       Crash-loop state and restart events"
+            )
+            print(
+                "   usage [site]                         Per-app limits and cgroup usage"
+            )
+            print(
+                "   memory                               NODE_OPTIONS heap sizes and measured RSS"
+            )
+            print(
+                "   retune [site]                        Restart apps whose heap size drifted"
+            )
+            print(
+                "   supervisor                           Run the read-only mode app supervisor"
+            )
             print("\n🚀 Quick Start:")
             print("   1. sudo python3 simple-hosting.py --setup")
             if manager.readonly_filesystem:
@@ -0,0 +1,85 @@
+"""Tests for scripts/simple-hosting.py (run: python -m unittest discover scripts/tests)"""
+
+import importlib.util
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+SCRIPT = os.path.join(os.path.dirname(__file__), "..", "simple-hosting.py")
+
+
+def load_script():
+    spec = importlib.util.spec_from_file_location("simple_hosting", SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+hosting = load_script()
+
+
+def bare_manager():
+    """A manager without the host probing and setup of __init__"""
+    manager = hosting.SimpleHostingManager.__new__(hosting.SimpleHostingManager)
+    manager.deploy_slots = {}
+    manager.deploy_slots_condition = threading.Condition()
+    manager.templates = hosting.ConfigTemplateEngine(hosting.NGINX_TEMPLATES)
+    return manager
+
+
+class DeploySlotTest(unittest.TestCase):
+    def test_cancelled_deploy_handed_the_slot_gives_it_back(self):
+        manager = bare_manager()
+        api = hosting.SimpleAPI(manager)
+        api.deploy_nodejs = lambda job, data, cancel: self.fail("cancelled job built")
+
+        self.assertIsNone(manager.wait_for_deploy_slot("site", "A"))
+        job = {"job_id": "B", "site_name": "site"}
+        api.deploy_cancels["B"] = threading.Event()
+        results = {}
+        waiter = threading.Thread(
+            target=lambda: results.update(b=api.run_deploy_job(job, {"name": "site"}))
+        )
+        waiter.start()
+        while manager.deploy_slots["site"]["pending"] != "B":
+            time.sleep(0.01)
+
+        # A finishes and hands its slot to B just as B's cancel lands
+        with manager.deploy_slots_condition:
+            api.deploy_cancels["B"].set()
+            manager.release_deploy_slot("site", "A")
+        waiter.join(5)
+
+        self.assertEqual(job["status"], "cancelled")
+        self.assertEqual(manager.deploy_slots, {})
+        self.assertIsNone(manager.wait_for_deploy_slot("site", "C"))
+
+
+class PrecompressTest(unittest.TestCase):
+    def write(self, path, content):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content)
+
+    def test_only_generated_outputs_are_pruned(self):
+        manager = bare_manager()
+        with tempfile.TemporaryDirectory() as public:
+            self.write(f"{public}/app.js", "console.log('hello');\n" * 200)
+            self.write(f"{public}/css/old.css", "body { color: red; }\n" * 200)
+            self.write(f"{public}/sitemap.xml.gz", "shipped as is")
+            manager.precompress_static_assets([public])
+            self.assertTrue(os.path.exists(f"{public}/css/old.css.gz"))
+
+            os.remove(f"{public}/css/old.css")
+            stats = manager.precompress_static_assets([public])
+
+            self.assertEqual(stats["orphans_removed"], 1)
+            self.assertFalse(os.path.exists(f"{public}/css/old.css.gz"))
+            self.assertTrue(os.path.exists(f"{public}/app.js.gz"))
+            self.assertTrue(os.path.exists(f"{public}/sitemap.xml.gz"))
+
+
+if __name__ == "__main__":
+    unittest.main()